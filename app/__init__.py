@@ -5,6 +5,11 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 
 from app.config.settings import config
 from app.extensions import init_extensions
+from app.services.catalog_sync import init_catalog_sync
+from app.services.json_provider import FastJSONProvider
+from app.services.play_counter import init_play_counter
+from app.services.play_events import init_play_events
+from app.services.search_analytics import init_search_analytics
 
 
 def _build_app_initials(app_name):
@@ -14,6 +19,7 @@ def _build_app_initials(app_name):
 
 def create_app(config_name=None):
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
 
     selected_config = config_name or os.getenv('FLASK_ENV', 'default')
     app.config.from_object(config.get(selected_config, config['default']))
@@ -27,6 +33,10 @@ def create_app(config_name=None):
 
     # Inicializa extensoes
     init_extensions(app)
+    init_catalog_sync(app)
+    init_search_analytics(app)
+    init_play_counter(app)
+    init_play_events(app)
     os.makedirs(app.config.get('UPLOAD_FOLDER', os.path.join(app.root_path, 'uploads')), exist_ok=True)
 
     @app.context_processor
@@ -43,12 +53,14 @@ def create_app(config_name=None):
     from app.views.music_routes import music_bp
     from app.views.playlist_routes import playlist_bp
     from app.views.api_routes import api_bp
+    from app.views.api_v2_routes import api_v2_bp
 
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(billing_bp)
     app.register_blueprint(music_bp)
     app.register_blueprint(playlist_bp)
     app.register_blueprint(api_bp, url_prefix='/api')
+    app.register_blueprint(api_v2_bp, url_prefix='/api/v2')
 
     return app
 
@@ -100,6 +100,56 @@ class Config:
     ALLOWED_EXTENSIONS = {'mp3', 'wav', 'flac', 'ogg'}
     ITEMS_PER_PAGE = 20
 
+    # Configuracao textual do Postgres usada no tsvector/tsquery da busca.
+    SEARCH_TEXT_CONFIG = os.getenv('SEARCH_TEXT_CONFIG') or 'portuguese'
+    # Similaridade minima (0-1) da busca aproximada por trigramas.
+    SEARCH_FUZZY_THRESHOLD = float(os.getenv('SEARCH_FUZZY_THRESHOLD', '0.5'))
+    # Bonus maximo de popularidade no ranking da busca (limitado a 20, a distancia entre os tipos
+    # de correspondencia) e visualizacoes em que ele chega a metade.
+    SEARCH_POPULARITY_BOOST = float(os.getenv('SEARCH_POPULARITY_BOOST', '15'))
+    SEARCH_POPULARITY_SATURATION = int(os.getenv('SEARCH_POPULARITY_SATURATION', '100'))
+    # Intervalo para reconstruir o indice de sugestoes de cada worker.
+    SUGGESTIONS_REFRESH_SECONDS = int(os.getenv('SUGGESTIONS_REFRESH_SECONDS', '300'))
+    # Cache LRU de resultados de busca por worker (TTL 0 desliga).
+    SEARCH_CACHE_TTL_SECONDS = float(os.getenv('SEARCH_CACHE_TTL_SECONDS', '60'))
+    SEARCH_CACHE_MAX_ENTRIES = int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', '512'))
+    # Estatisticas de busca: gravadas em lote a cada N segundos ou N termos pendentes.
+    SEARCH_ANALYTICS_FLUSH_SECONDS = float(os.getenv('SEARCH_ANALYTICS_FLUSH_SECONDS', '30'))
+    SEARCH_ANALYTICS_MAX_PENDING = int(os.getenv('SEARCH_ANALYTICS_MAX_PENDING', '500'))
+    SEARCH_ANALYTICS_RETENTION_DAYS = int(os.getenv('SEARCH_ANALYTICS_RETENTION_DAYS', '90'))
+    # Reproducoes acumuladas por worker e gravadas em lote por uma thread a cada intervalo.
+    # Encerramento normal grava o restante (atexit); SIGKILL/OOM do worker perde ate um
+    # intervalo de reproducoes, mais o que acumulou enquanto o banco recusava os lotes.
+    PLAY_COUNTER_FLUSH_SECONDS = float(os.getenv('PLAY_COUNTER_FLUSH_SECONDS', '10'))
+    PLAY_COUNTER_MAX_PENDING = int(os.getenv('PLAY_COUNTER_MAX_PENDING', '1000'))
+    # Log de reproducoes: lote por worker e retencao dos eventos e dos agregados por hora.
+    PLAY_EVENTS_FLUSH_SECONDS = float(os.getenv('PLAY_EVENTS_FLUSH_SECONDS', '30'))
+    PLAY_EVENTS_MAX_PENDING = int(os.getenv('PLAY_EVENTS_MAX_PENDING', '2000'))
+    PLAY_EVENTS_RETENTION_DAYS = int(os.getenv('PLAY_EVENTS_RETENTION_DAYS', '14'))
+    PLAY_HOURLY_RETENTION_DAYS = int(os.getenv('PLAY_HOURLY_RETENTION_DAYS', '30'))
+    # Cada worker pre-executa as buscas mais frequentes ao iniciar.
+    SEARCH_WARMUP_ON_START = _env_bool('SEARCH_WARMUP_ON_START', False)
+    SEARCH_WARMUP_TOP_QUERIES = int(os.getenv('SEARCH_WARMUP_TOP_QUERIES', '20'))
+    # Idade maxima da discografia materializada de um artista.
+    DISCOGRAPHY_MAX_AGE_SECONDS = int(os.getenv('DISCOGRAPHY_MAX_AGE_SECONDS', '3600'))
+    # Idade maxima das contagens de facetas antes de um recalculo em lote.
+    FACETS_REFRESH_SECONDS = int(os.getenv('FACETS_REFRESH_SECONDS', '300'))
+    # Paradas de populares: posicoes por lista, idade maxima e meia-vida das janelas dia/semana.
+    CHARTS_TOP_N = int(os.getenv('CHARTS_TOP_N', '100'))
+    CHARTS_REFRESH_SECONDS = int(os.getenv('CHARTS_REFRESH_SECONDS', '900'))
+    # Desligado, so o `refresh-charts` agendado recalcula as paradas (nenhuma thread no worker).
+    CHARTS_REFRESH_ON_READ = _env_bool('CHARTS_REFRESH_ON_READ', True)
+    CHARTS_HALF_LIFE_DAY_HOURS = float(os.getenv('CHARTS_HALF_LIFE_DAY_HOURS', '6'))
+    CHARTS_HALF_LIFE_WEEK_HOURS = float(os.getenv('CHARTS_HALF_LIFE_WEEK_HOURS', '48'))
+    # Listas da API com `limite` a partir deste valor sao transmitidas em fluxo.
+    API_STREAM_MIN_ROWS = int(os.getenv('API_STREAM_MIN_ROWS', '500'))
+    API_STREAM_CHUNK_ITEMS = int(os.getenv('API_STREAM_CHUNK_ITEMS', '100'))
+    # Maximo de ids por consulta em lote (`?ids=1,2,3`).
+    API_BATCH_MAX_IDS = int(os.getenv('API_BATCH_MAX_IDS', '100'))
+    # Faixas por janela no detalhe da playlist e maximo por janela na API.
+    PLAYLIST_TRACKS_WINDOW = int(os.getenv('PLAYLIST_TRACKS_WINDOW', '100'))
+    PLAYLIST_TRACKS_MAX_WINDOW = int(os.getenv('PLAYLIST_TRACKS_MAX_WINDOW', '500'))
+
 
 class DevelopmentConfig(Config):
     """Configuracao de desenvolvimento."""
@@ -142,6 +192,8 @@ class TestingConfig(Config):
     AUTO_VERIFY_EMAIL = True
     RATE_LIMIT_ENABLED = False
     EMAIL_DELIVERY_ENABLED = False
+    # O SQLite em memoria usa uma unica conexao: uma thread de recalculo disputaria com o teste.
+    CHARTS_REFRESH_ON_READ = False
 
 
 config = {
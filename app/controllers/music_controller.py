@@ -1,42 +1,243 @@
+import base64
+import binascii
+import copy
+import json
+from time import monotonic
+
+from flask import current_app
+
 from app.extensions import db
-from app.models import Music, Album, Artist
-from sqlalchemy import or_, func
+from app.models import Music, Album, Artist, ChartEntry, Tenant
+from app.models.campos import filtrar_campos, incluir_campo
+from app.services.catalog_reader import CatalogReader
+from app.services.chart_service import ChartService
+from app.services.play_counter import PlayCounter
+from app.services.play_events import PlayEvents
+from app.services.discography_service import DiscographyService
+from app.services.facet_service import FacetService
+from app.services.result_cache import search_cache
+from app.services.search_analytics import SearchAnalytics
+from app.services.search_service import CatalogSearchService, normalizar_texto
+from app.services.suggestion_service import SuggestionService
+from sqlalchemy import and_, or_, func
 
 class MusicController:
     """Controller para gerenciamento de músicas"""
     
     @staticmethod
-    def buscar_musicas(termo=None, limite=50, offset=0):
-        """Busca músicas por termo"""
+    def _codificar_cursor(musica):
+        """Gera cursor opaco a partir da chave (titulo, id) da ultima musica da pagina."""
+        bruto = json.dumps([musica.titulo, musica.id], ensure_ascii=False).encode('utf-8')
+        return base64.urlsafe_b64encode(bruto).decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def _decodificar_cursor(cursor):
+        """Retorna (titulo, id) do cursor ou levanta ValueError se for invalido."""
+        try:
+            preenchimento = '=' * (-len(cursor) % 4)
+            titulo, musica_id = json.loads(base64.urlsafe_b64decode(cursor + preenchimento))
+        except (TypeError, ValueError, binascii.Error) as exc:
+            raise ValueError('Cursor invalido') from exc
+        if not isinstance(titulo, str) or not isinstance(musica_id, int):
+            raise ValueError('Cursor invalido')
+        return titulo, musica_id
+    
+    ORDENACOES = ('relevancia', 'titulo')
+    
+    @staticmethod
+    def _em_fluxo(query, campos=None, ja_unido=False):
+        """Gera os dicts das músicas lendo o resultado em lotes (cursor no servidor)."""
+        lote = current_app.config.get('API_STREAM_CHUNK_ITEMS', 100)
+        for musica in CatalogReader.musicas_em_lotes(query, lote, campos, ja_unido):
+            yield musica.to_dict(campos=campos)
+    
+    @staticmethod
+    def buscar_musicas(termo=None, limite=50, offset=0, cursor=None, incluir_total=True, ordem='relevancia',
+                       em_fluxo=False, campos=None):
+        """Busca músicas por termo.
+
+        Com termo e `ordem='relevancia'` ordena pela pontuação combinada de
+        correspondência e popularidade; `ordem='titulo'` mantém a ordem alfabética.
+        Com `cursor` ('' na primeira página) pagina por chave (titulo, id) e
+        devolve `next_cursor`; nesse modo o total só é contado se solicitado.
+        Resultados ficam no cache de busca, chaveado pelo termo normalizado.
+        Com `em_fluxo` (paginação por offset) `musicas` é um gerador lido do
+        banco em lotes, fora do cache, para respostas transmitidas em fluxo.
+        `campos` (ver app.models.campos) limita as chaves de cada música.
+        """
+        if ordem not in MusicController.ORDENACOES:
+            return {'success': False, 'message': f'Ordenação inválida: {ordem}'}
+        
+        inicio = monotonic()
+        if em_fluxo and cursor is None:
+            resultado = MusicController._executar_busca(
+                termo, limite, offset, cursor, incluir_total, ordem, em_fluxo, campos
+            )
+        else:
+            resultado = MusicController._buscar_com_cache(termo, limite, offset, cursor, incluir_total, ordem, campos)
+        
+        # Só a primeira página conta como uma busca nas estatísticas.
+        if termo and resultado['success'] and not offset and not cursor:
+            total = resultado['total'] if resultado['total'] is not None else len(resultado['musicas'])
+            SearchAnalytics.registrar(termo, total, (monotonic() - inicio) * 1000)
+        return resultado
+    
+    @staticmethod
+    def _buscar_com_cache(termo, limite, offset, cursor, incluir_total, ordem, campos=None):
+        cache = search_cache()
+        chave = (
+            normalizar_texto(termo), limite, offset, cursor, incluir_total, ordem,
+            json.dumps(campos, sort_keys=True) if campos is not None else None,
+        )
+        resultado = cache.obter(chave)
+        if resultado is None:
+            resultado = MusicController._executar_busca(
+                termo, limite, offset, cursor, incluir_total, ordem, campos=campos
+            )
+            if resultado['success']:
+                cache.guardar(chave, copy.deepcopy(resultado))
+            return resultado
+        # Quem chama pode alterar as musicas (side-loading, campos); o cache fica intacto.
+        return copy.deepcopy(resultado)
+    
+    @staticmethod
+    def aquecer_cache_busca(limite_termos=20):
+        """Pré-executa as buscas mais frequentes para popular o cache do worker.
+
+        Cobre a primeira página de /buscar (20 itens) e da API (50 itens), sem
+        contar essas execuções nas estatísticas.
+        """
+        termos = SearchAnalytics.termos_para_aquecimento(limite_termos)
+        for termo in termos:
+            for limite in (20, 50):
+                MusicController._buscar_com_cache(termo, limite, 0, None, True, 'relevancia')
+        return termos
+    
+    @staticmethod
+    def _consulta_busca(termo, ordem, aproximada=False):
+        """(query, ordenacao, tem_aproximada) da busca; a aproximada so e montada quando pedida."""
+        query = Music.query.join(Album).join(Artist)
+        ordenacao = [Music.titulo, Music.id]
+        if not termo:
+            return query, ordenacao, False
+        
+        busca = CatalogSearchService.aplicar_busca(query, termo, aproximada)
+        if busca is not None:
+            query, relevancia = busca
+            if ordem == 'relevancia':
+                ranking = CatalogSearchService.expressao_ranking(termo, relevancia, aproximada)
+                ordenacao = [ranking.desc(), relevancia.desc(), Music.titulo, Music.id]
+            return query, ordenacao, not aproximada
+        
+        # Sem indice textual disponivel: mantem o ILIKE como fallback.
+        padrao = f"%{termo}%"
+        query = query.filter(
+            or_(
+                Music.titulo.ilike(padrao),
+                Album.titulo.ilike(padrao),
+                Artist.nome.ilike(padrao)
+            )
+        )
+        if ordem == 'relevancia':
+            ranking = CatalogSearchService.expressao_ranking(termo, None)
+            ordenacao = [ranking.desc(), Music.titulo, Music.id]
+        return query, ordenacao, False
+    
+    @staticmethod
+    def _executar_busca(termo, limite, offset, cursor, incluir_total, ordem, em_fluxo=False, campos=None):
         try:
-            query = Music.query.join(Album).join(Artist)
-            
-            if termo:
-                termo = f"%{termo}%"
-                query = query.filter(
-                    or_(
-                        Music.titulo.ilike(termo),
-                        Album.titulo.ilike(termo),
-                        Artist.nome.ilike(termo)
+            query, ordenacao, tem_aproximada = MusicController._consulta_busca(termo, ordem)
+            
+            if cursor is not None:
+                posicao = MusicController._decodificar_cursor(cursor) if cursor else None
+                
+                def pagina(query):
+                    if posicao:
+                        titulo, musica_id = posicao
+                        query = query.filter(
+                            or_(
+                                Music.titulo > titulo,
+                                and_(Music.titulo == titulo, Music.id > musica_id)
+                            )
+                        )
+                    # Busca um item extra apenas para saber se existe proxima pagina.
+                    return CatalogReader.musicas(
+                        query.order_by(Music.titulo, Music.id).limit(limite + 1), campos, ja_unido=True
                     )
-                )
+                
+                total = query.count() if incluir_total else None
+                musicas = pagina(query) if total != 0 else []
+                # A busca textual nao achou nada: tenta a aproximada (erros de digitacao).
+                if not musicas and tem_aproximada:
+                    query, _, _ = MusicController._consulta_busca(termo, ordem, aproximada=True)
+                    total = query.count() if incluir_total else None
+                    musicas = pagina(query)
+                proxima = len(musicas) > limite
+                musicas = musicas[:limite]
+                
+                return {
+                    'success': True,
+                    'musicas': [m.to_dict(campos=campos) for m in musicas],
+                    'total': total,
+                    'limite': limite,
+                    'next_cursor': MusicController._codificar_cursor(musicas[-1]) if proxima else None
+                }
             
             total = query.count()
-            musicas = query.order_by(Music.titulo).limit(limite).offset(offset).all()
+            # A contagem da pagina ja diz se a busca textual achou algo; so entao tenta a aproximada.
+            if not total and tem_aproximada:
+                query, ordenacao, _ = MusicController._consulta_busca(termo, ordem, aproximada=True)
+                total = query.count()
+            query = query.order_by(*ordenacao).limit(limite).offset(offset)
             
             return {
                 'success': True,
-                'musicas': [m.to_dict() for m in musicas],
+                'musicas': (
+                    MusicController._em_fluxo(query, campos, ja_unido=True) if em_fluxo
+                    else [m.to_dict(campos=campos) for m in CatalogReader.musicas(query, campos, ja_unido=True)]
+                ),
                 'total': total,
                 'limite': limite,
                 'offset': offset
             }
             
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
         except Exception as e:
             return {'success': False, 'message': f'Erro ao buscar músicas: {str(e)}'}
     
     @staticmethod
-    def obter_musica(musica_id):
+    def navegar_catalogo(filtros, limite=50, offset=0, campos=None):
+        """Lista músicas filtradas por gênero, ano e faixa de duração com contagens por faceta.
+
+        O total e as contagens vêm do cubo pré-calculado de FacetService.
+        """
+        try:
+            faixas_validas = {faixa for faixa, _, _ in FacetService.FAIXAS_DURACAO}
+            invalidas = set(filtros.get('duracao') or ()) - faixas_validas
+            if invalidas:
+                return {'success': False, 'message': f'Faixa de duração inválida: {sorted(invalidas)[0]}'}
+            
+            total, facetas = FacetService.contagens(filtros)
+            query = FacetService.filtrar(Music.query.join(Album).join(Artist), filtros)
+            musicas = CatalogReader.musicas(
+                query.order_by(Music.titulo, Music.id).limit(limite).offset(offset), campos, ja_unido=True
+            )
+            
+            return {
+                'success': True,
+                'musicas': [m.to_dict(campos=campos) for m in musicas],
+                'total': total,
+                'limite': limite,
+                'offset': offset,
+                'facetas': facetas
+            }
+            
+        except Exception as e:
+            return {'success': False, 'message': f'Erro ao navegar no catálogo: {str(e)}'}
+    
+    @staticmethod
+    def obter_musica(musica_id, campos=None):
         """Obtém detalhes de uma música"""
         try:
             musica = db.session.get(Music, musica_id)
@@ -46,12 +247,87 @@ class MusicController:
             
             return {
                 'success': True,
-                'musica': musica.to_dict()
+                'musica': musica.to_dict(campos=campos)
             }
             
         except Exception as e:
             return {'success': False, 'message': f'Erro ao obter música: {str(e)}'}
     
+    @staticmethod
+    def _na_ordem_pedida(ids, registros):
+        """Ordena `registros` (com `.id`) como `ids` e retorna (registros, ids_nao_encontrados)."""
+        por_id = {registro.id: registro for registro in registros}
+        return [por_id[i] for i in ids if i in por_id], [i for i in ids if i not in por_id]
+    
+    @staticmethod
+    def obter_musicas_por_ids(ids, campos=None):
+        """Obtém várias músicas em uma consulta `IN`, na ordem de `ids`.
+
+        Álbum e artista vêm no mesmo SELECT; ids inexistentes ficam em
+        `nao_encontrados`.
+        """
+        try:
+            musicas = CatalogReader.musicas(Music.query.filter(Music.id.in_(ids)), campos)
+            musicas, nao_encontrados = MusicController._na_ordem_pedida(ids, musicas)
+            return {
+                'success': True,
+                'musicas': [m.to_dict(campos=campos) for m in musicas],
+                'nao_encontrados': nao_encontrados
+            }
+        
+        except Exception as e:
+            return {'success': False, 'message': f'Erro ao obter músicas: {str(e)}'}
+    
+    @staticmethod
+    def obter_albuns_por_ids(ids, campos=None):
+        """Obtém vários álbuns (com o artista) em uma consulta `IN`, na ordem de `ids`."""
+        try:
+            query = Album.query.filter(Album.id.in_(ids))
+            if incluir_campo(campos, 'artista_nome'):
+                query = query.options(db.joinedload(Album.artista))
+            albuns, nao_encontrados = MusicController._na_ordem_pedida(ids, query.all())
+            return {
+                'success': True,
+                'albuns': [album.to_dict(campos=campos) for album in albuns],
+                'nao_encontrados': nao_encontrados
+            }
+        
+        except Exception as e:
+            return {'success': False, 'message': f'Erro ao obter álbuns: {str(e)}'}
+    
+    @staticmethod
+    def obter_artistas_por_ids(ids, campos=None):
+        """Obtém vários artistas em uma consulta `IN`, na ordem de `ids`.
+
+        Os totais de álbuns e músicas, se pedidos, saem de um único GROUP BY
+        em vez de duas consultas por artista.
+        """
+        try:
+            artistas, nao_encontrados = MusicController._na_ordem_pedida(
+                ids, Artist.query.filter(Artist.id.in_(ids)).all()
+            )
+            totais = {}
+            if incluir_campo(campos, 'total_albuns') or incluir_campo(campos, 'total_musicas'):
+                totais = {
+                    artista_id: (total_albuns, total_musicas)
+                    for artista_id, total_albuns, total_musicas in db.session.query(
+                        Album.artista_id,
+                        func.count(Album.id),
+                        func.coalesce(func.sum(Album.total_musicas), 0),
+                    ).filter(Album.artista_id.in_(ids)).group_by(Album.artista_id)
+                }
+            return {
+                'success': True,
+                'artistas': [
+                    artista.to_dict(campos=campos, totais=totais.get(artista.id, (0, 0)))
+                    for artista in artistas
+                ],
+                'nao_encontrados': nao_encontrados
+            }
+        
+        except Exception as e:
+            return {'success': False, 'message': f'Erro ao obter artistas: {str(e)}'}
+    
     @staticmethod
     def criar_musica(dados):
         """Cria nova música"""
@@ -135,24 +411,95 @@ class MusicController:
             return {'success': False, 'message': f'Erro ao deletar música: {str(e)}'}
     
     @staticmethod
-    def obter_musicas_populares(limite=20):
-        """Retorna músicas mais populares"""
+    def estatisticas_cache_busca():
+        """Retorna contadores de acerto do cache de busca deste worker"""
+        return {
+            'success': True,
+            'cache': search_cache().estatisticas()
+        }
+    
+    @staticmethod
+    def obter_sugestoes(prefixo, limite=10):
+        """Retorna sugestões de músicas, álbuns e artistas pelo prefixo digitado"""
         try:
-            musicas = Music.query.order_by(
-                Music.visualizacoes.desc()
-            ).limit(limite).all()
+            return {
+                'success': True,
+                'sugestoes': SuggestionService.sugerir(prefixo or '', limite)
+            }
+            
+        except Exception as e:
+            return {'success': False, 'message': f'Erro ao obter sugestões: {str(e)}'}
+    
+    @staticmethod
+    def obter_discografia(artista_id, campos=None):
+        """Retorna a discografia pré-calculada do artista (álbuns e totais)"""
+        try:
+            discografia = DiscographyService.obter(artista_id)
+            
+            if not discografia:
+                return {'success': False, 'message': 'Artista não encontrado'}
+            
+            return {
+                'success': True,
+                'discografia': filtrar_campos(discografia, campos)
+            }
+            
+        except Exception as e:
+            return {'success': False, 'message': f'Erro ao obter discografia: {str(e)}'}
+    
+    @staticmethod
+    def obter_musicas_populares(limite=20, em_fluxo=False, campos=None, tenant_id=None, janela='sempre',
+                                genero=None):
+        """Retorna músicas mais populares (`em_fluxo`: gerador lido em lotes)
+
+        Até CHARTS_TOP_N músicas, lê a parada pré-calculada do tenant
+        (ChartService) na `janela` ('dia', 'semana' ou 'sempre') e no `genero`;
+        acima disso, ou antes de a parada existir, ordena o catálogo por visualizações.
+        """
+        try:
+            if janela not in ChartEntry.JANELAS:
+                return {'success': False, 'message': f'Janela inválida: {janela}'}
+            
+            if tenant_id is None:
+                tenant_id = Tenant.resolve_default_id()
+            
+            ja_unido = False
+            query = None
+            if tenant_id is not None and limite <= ChartService.top_n():
+                # None ate o primeiro calculo da parada do tenant.
+                query = ChartService.consulta(tenant_id, janela, genero)
+            if query is None:
+                query = Music.query
+                if genero:
+                    query = query.join(Album, Music.album_id == Album.id).join(
+                        Artist, Album.artista_id == Artist.id
+                    ).filter(Artist.genero == genero)
+                    ja_unido = True
+                query = query.order_by(Music.visualizacoes.desc())
+            query = query.limit(limite)
             
             return {
                 'success': True,
-                'musicas': [m.to_dict() for m in musicas]
+                'janela': janela,
+                'genero': genero or None,
+                'musicas': (
+                    MusicController._em_fluxo(query, campos, ja_unido) if em_fluxo
+                    else [m.to_dict(campos=campos) for m in CatalogReader.musicas(query, campos, ja_unido)]
+                )
             }
             
         except Exception as e:
             return {'success': False, 'message': f'Erro ao obter músicas populares: {str(e)}'}
     
     @staticmethod
-    def registrar_reproducao(musica_id):
-        """Registra reprodução de música"""
+    def registrar_reproducao(musica_id, usuario_id=None, tenant_id=None):
+        """Registra reprodução de música
+
+        A contagem vai para o buffer do worker (PlayCounter) e é gravada em
+        lote; `visualizacoes` soma o valor gravado às reproduções pendentes
+        deste worker. Com o tenant, a reprodução também entra no log de
+        eventos e nos agregados por hora/dia (PlayEvents).
+        """
         try:
             musica = db.session.get(Music, musica_id)
             
@@ -160,10 +507,12 @@ class MusicController:
                 return {'success': False, 'message': 'Música não encontrada'}
             
             musica.incrementar_visualizacao()
+            if tenant_id is not None:
+                PlayEvents.registrar(musica_id, usuario_id, tenant_id)
             
             return {
                 'success': True,
-                'visualizacoes': musica.visualizacoes
+                'visualizacoes': (musica.visualizacoes or 0) + PlayCounter.pendentes(musica_id)
             }
             
         except Exception as e:
@@ -1,5 +1,10 @@
+import base64
+import binascii
+import json
+
 from app.extensions import db
 from app.models import Music, Playlist, Tenant, User
+from app.models.campos import filtrar_campos, incluir_campo
 
 
 class PlaylistController:
@@ -22,6 +27,37 @@ class PlaylistController:
             query = query.filter_by(tenant_id=tenant_id)
         return query.first()
 
+    @staticmethod
+    def _codificar_cursor(chave):
+        """Cursor opaco a partir da chave (posicao, id) da ultima faixa da janela."""
+        if chave is None:
+            return None
+        return base64.urlsafe_b64encode(json.dumps(list(chave)).encode('ascii')).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def _decodificar_cursor(cursor):
+        """Retorna (posicao, id) do cursor ou levanta ValueError se for invalido."""
+        try:
+            preenchimento = '=' * (-len(cursor) % 4)
+            posicao, faixa_id = json.loads(base64.urlsafe_b64decode(cursor + preenchimento))
+        except (TypeError, ValueError, binascii.Error) as exc:
+            raise ValueError('Cursor invalido') from exc
+        if not isinstance(posicao, int) or not isinstance(faixa_id, int):
+            raise ValueError('Cursor invalido')
+        return posicao, faixa_id
+
+    @staticmethod
+    def _playlist_visivel(playlist_id, usuario_id=None, tenant_id=None):
+        """Retorna (playlist, None) ou (None, mensagem) conforme tenant e visibilidade."""
+        tenant_resolvido = PlaylistController._resolve_tenant_id(usuario_id=usuario_id, tenant_id=tenant_id)
+        playlist = PlaylistController._query_playlist_by_tenant(playlist_id, tenant_resolvido)
+
+        if not playlist:
+            return None, 'Playlist nao encontrada'
+        if not playlist.publica and playlist.usuario_id != usuario_id:
+            return None, 'Acesso negado'
+        return playlist, None
+
     @staticmethod
     def criar_playlist(usuario_id, nome, descricao=None, publica=False):
         """Cria nova playlist."""
@@ -85,7 +121,7 @@ class PlaylistController:
             return {'success': False, 'message': f'Erro ao criar playlist: {str(e)}'}
 
     @staticmethod
-    def obter_playlists_usuario(usuario_id, include_musicas=False):
+    def obter_playlists_usuario(usuario_id, include_musicas=False, campos=None):
         """Obtem playlists de um usuario dentro do tenant dele."""
         try:
             usuario = db.session.get(User, usuario_id)
@@ -100,27 +136,57 @@ class PlaylistController:
 
             return {
                 'success': True,
-                'playlists': [p.to_dict(include_musicas=include_musicas) for p in playlists],
+                'playlists': [p.to_dict(include_musicas=include_musicas, campos=campos) for p in playlists],
             }
         except Exception as e:
             return {'success': False, 'message': f'Erro ao obter playlists: {str(e)}'}
 
     @staticmethod
-    def obter_playlist(playlist_id, usuario_id=None, tenant_id=None):
-        """Obtem detalhes de uma playlist respeitando isolamento por tenant."""
-        try:
-            tenant_resolvido = PlaylistController._resolve_tenant_id(usuario_id=usuario_id, tenant_id=tenant_id)
-            playlist = PlaylistController._query_playlist_by_tenant(playlist_id, tenant_resolvido)
+    def obter_playlist(playlist_id, usuario_id=None, tenant_id=None, campos=None, limite_musicas=None):
+        """Obtem detalhes de uma playlist respeitando isolamento por tenant.
 
-            if not playlist:
-                return {'success': False, 'message': 'Playlist nao encontrada'}
+        Com `limite_musicas` so a primeira janela de faixas e incluida, com
+        `musicas_next_cursor` para obter_faixas_playlist.
+        """
+        try:
+            playlist, erro = PlaylistController._playlist_visivel(playlist_id, usuario_id, tenant_id)
+            if erro:
+                return {'success': False, 'message': erro}
+
+            dados = playlist.to_dict(include_musicas=True, campos=campos, limite_musicas=limite_musicas)
+            if 'musicas_proxima' in dados:
+                dados['musicas_next_cursor'] = PlaylistController._codificar_cursor(dados.pop('musicas_proxima'))
+            return {'success': True, 'playlist': dados}
+        except Exception as e:
+            return {'success': False, 'message': f'Erro ao obter playlist: {str(e)}'}
 
-            if not playlist.publica and playlist.usuario_id != usuario_id:
-                return {'success': False, 'message': 'Acesso negado'}
+    @staticmethod
+    def obter_faixas_playlist(playlist_id, usuario_id=None, tenant_id=None, cursor=None, limite=100, campos=None):
+        """Retorna uma janela de faixas da playlist, paginada por cursor sobre a posicao.
+
+        `cursor` vazio ou None e a primeira janela; `next_cursor` e None na ultima.
+        Levanta ValueError para cursor invalido, para a rota responder 400 e
+        reservar o 404 para playlist inexistente ou nao visivel.
+        """
+        apos = PlaylistController._decodificar_cursor(cursor) if cursor else None
+        try:
+            playlist, erro = PlaylistController._playlist_visivel(playlist_id, usuario_id, tenant_id)
+            if erro:
+                return {'success': False, 'message': erro}
 
-            return {'success': True, 'playlist': playlist.to_dict(include_musicas=True)}
+            faixas, proxima = playlist.janela_faixas(
+                apos=apos, limite=limite, com_album=incluir_campo(campos, 'album')
+            )
+            return {
+                'success': True,
+                'playlist_id': playlist.id,
+                'usuario_id': playlist.usuario_id,
+                'musicas': filtrar_campos(Playlist.faixas_to_dict(faixas, campos), campos),
+                'limite': limite,
+                'next_cursor': PlaylistController._codificar_cursor(proxima),
+            }
         except Exception as e:
-            return {'success': False, 'message': f'Erro ao obter playlist: {str(e)}'}
+            return {'success': False, 'message': f'Erro ao obter faixas da playlist: {str(e)}'}
 
     @staticmethod
     def atualizar_playlist(playlist_id, usuario_id, dados):
@@ -241,7 +307,31 @@ class PlaylistController:
             return {'success': False, 'message': f'Erro ao remover musica: {str(e)}'}
 
     @staticmethod
-    def obter_playlists_publicas(limite=20, tenant_id=None):
+    def obter_status_musicas(usuario_id, musica_ids):
+        """Retorna, na ordem de `musica_ids`, se cada musica e favorita e em quais playlists do usuario esta.
+
+        Uma consulta para os favoritos e outra para as playlists, qualquer que
+        seja o tamanho da lista.
+        """
+        try:
+            usuario = db.session.get(User, usuario_id)
+            if not usuario:
+                return {'success': False, 'message': 'Usuario nao encontrado'}
+
+            favoritas = usuario.favoritos_entre(musica_ids)
+            playlists = Playlist.playlists_com_musicas(usuario_id, musica_ids)
+            return {
+                'success': True,
+                'musicas': [
+                    {'id': musica_id, 'favorito': musica_id in favoritas, 'playlists': playlists.get(musica_id, [])}
+                    for musica_id in musica_ids
+                ],
+            }
+        except Exception as e:
+            return {'success': False, 'message': f'Erro ao obter status das musicas: {str(e)}'}
+
+    @staticmethod
+    def obter_playlists_publicas(limite=20, tenant_id=None, campos=None):
         """Obtem playlists publicas do tenant resolvido."""
         try:
             tenant_resolvido = PlaylistController._resolve_tenant_id(tenant_id=tenant_id)
@@ -250,6 +340,6 @@ class PlaylistController:
                 query = query.filter_by(tenant_id=tenant_resolvido)
 
             playlists = query.order_by(Playlist.data_criacao.desc()).limit(limite).all()
-            return {'success': True, 'playlists': [p.to_dict() for p in playlists]}
+            return {'success': True, 'playlists': [p.to_dict(campos=campos) for p in playlists]}
         except Exception as e:
             return {'success': False, 'message': f'Erro ao obter playlists publicas: {str(e)}'}
@@ -1,11 +1,17 @@
 from app.models.api_key import ApiKey
 from app.models.album import Album
 from app.models.artist import Artist
+from app.models.artist_discography import ArtistDiscography
 from app.models.audit_log import AuditLog
+from app.models.catalog_facet import CatalogFacet
+from app.models.chart_entry import ChartEntry
 from app.models.membership import Membership
 from app.models.music import Music
 from app.models.plan import Plan
+from app.models.play_event import PlayEvent
+from app.models.play_rollup import PlayRollup
 from app.models.playlist import Playlist, PlaylistMusica
+from app.models.search_query_stat import SearchQueryStat
 from app.models.subscription import Subscription
 from app.models.tenant import Tenant
 from app.models.user import User, favoritos
@@ -15,12 +21,18 @@ __all__ = [
     'ApiKey',
     'Album',
     'Artist',
+    'ArtistDiscography',
     'AuditLog',
+    'CatalogFacet',
+    'ChartEntry',
     'Membership',
     'Music',
     'Plan',
+    'PlayEvent',
+    'PlayRollup',
     'Playlist',
     'PlaylistMusica',
+    'SearchQueryStat',
     'Subscription',
     'Tenant',
     'User',
@@ -1,4 +1,7 @@
+from sqlalchemy import DDL
+
 from app.extensions import db
+from app.models.campos import filtrar_campos, incluir_campo, subcampos
 
 class Album(db.Model):
     """Model de Álbum"""
@@ -6,10 +9,14 @@ class Album(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     titulo = db.Column(db.String(150), nullable=False, index=True)
-    artista_id = db.Column(db.Integer, db.ForeignKey('artistas.id'), nullable=False)
-    ano_lancamento = db.Column(db.Integer)
+    titulo_normalizado = db.Column(db.String(150))  # sem acentos/minusculo, mantido no flush
+    artista_id = db.Column(db.Integer, db.ForeignKey('artistas.id'), nullable=False, index=True)
+    ano_lancamento = db.Column(db.Integer, index=True)
     capa_url = db.Column(db.String(255))
     descricao = db.Column(db.Text)
+    # Agregados das faixas, mantidos por delta no flush (ver CatalogCounters).
+    total_musicas = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    duracao_total = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # em segundos
     
     # Relacionamentos
     musicas = db.relationship('Music', backref='album', lazy='dynamic', cascade='all, delete-orphan')
@@ -20,24 +27,15 @@ class Album(db.Model):
         self.ano_lancamento = ano_lancamento
         self.capa_url = capa_url
         self.descricao = descricao
+        self.total_musicas = 0
+        self.duracao_total = 0
     
-    @property
-    def total_musicas(self):
-        """Retorna total de músicas do álbum"""
-        return self.musicas.count()
-    
-    @property
-    def duracao_total(self):
-        """Retorna duração total do álbum em segundos"""
-        return sum(musica.duracao for musica in self.musicas if musica.duracao)
-    
-    def to_dict(self, include_musicas=False):
-        """Retorna representação em dicionário"""
+    def to_dict(self, include_musicas=False, campos=None):
+        """Retorna representação em dicionário (`campos`: ver app.models.campos)"""
         data = {
             'id': self.id,
             'titulo': self.titulo,
             'artista_id': self.artista_id,
-            'artista_nome': self.artista.nome if self.artista else None,
             'ano_lancamento': self.ano_lancamento,
             'capa_url': self.capa_url,
             'descricao': self.descricao,
@@ -45,10 +43,23 @@ class Album(db.Model):
             'duracao_total': self.duracao_total
         }
         
-        if include_musicas:
-            data['musicas'] = [musica.to_dict() for musica in self.musicas]
+        if incluir_campo(campos, 'artista_nome'):
+            data['artista_nome'] = self.artista.nome if self.artista else None
         
-        return data
+        if include_musicas and incluir_campo(campos, 'musicas'):
+            data['musicas'] = [musica.to_dict(campos=subcampos(campos, 'musicas')) for musica in self.musicas]
+        
+        return filtrar_campos(data, campos)
     
     def __repr__(self):
-        return f'<Album {self.titulo}>'
\ No newline at end of file
+        return f'<Album {self.titulo}>'
+
+
+db.event.listen(
+    Album.__table__,
+    'after_create',
+    DDL(
+        'CREATE INDEX IF NOT EXISTS ix_albuns_titulo_normalizado_trgm '
+        'ON albuns USING gin (titulo_normalizado gin_trgm_ops)'
+    ).execute_if(dialect='postgresql'),
+)
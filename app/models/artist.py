@@ -1,5 +1,8 @@
+from sqlalchemy import DDL
+
 from app.extensions import db
 from app.models.album import Album
+from app.models.campos import filtrar_campos, incluir_campo
 
 class Artist(db.Model):
     """Model de Artista"""
@@ -7,7 +10,8 @@ class Artist(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100), nullable=False, index=True)
-    genero = db.Column(db.String(50))
+    nome_normalizado = db.Column(db.String(100))  # sem acentos/minusculo, mantido no flush
+    genero = db.Column(db.String(50), index=True)
     bio = db.Column(db.Text)
     imagem_url = db.Column(db.String(255))
     
@@ -27,22 +31,40 @@ class Artist(db.Model):
     
     @property
     def total_musicas(self):
-        """Retorna total de músicas do artista"""
-        from app.models.music import Music
-
-        return Music.query.join(Album).filter(Album.artista_id == self.id).count()
+        """Retorna total de músicas do artista (soma dos agregados dos álbuns)"""
+        return db.session.query(
+            db.func.coalesce(db.func.sum(Album.total_musicas), 0)
+        ).filter(Album.artista_id == self.id).scalar()
     
-    def to_dict(self):
-        """Retorna representação em dicionário"""
-        return {
+    def to_dict(self, campos=None, totais=None):
+        """Retorna representação em dicionário (`campos`: ver app.models.campos)
+
+        Os totais só são consultados se forem pedidos; `totais` recebe
+        (total_albuns, total_musicas) já calculados em lote.
+        """
+        data = {
             'id': self.id,
             'nome': self.nome,
             'genero': self.genero,
             'bio': self.bio,
-            'imagem_url': self.imagem_url,
-            'total_albuns': self.total_albuns,
-            'total_musicas': self.total_musicas
+            'imagem_url': self.imagem_url
         }
+        total_albuns, total_musicas = totais if totais is not None else (None, None)
+        if incluir_campo(campos, 'total_albuns'):
+            data['total_albuns'] = self.total_albuns if totais is None else total_albuns
+        if incluir_campo(campos, 'total_musicas'):
+            data['total_musicas'] = self.total_musicas if totais is None else total_musicas
+        return filtrar_campos(data, campos)
     
     def __repr__(self):
-        return f'<Artist {self.nome}>'
\ No newline at end of file
+        return f'<Artist {self.nome}>'
+
+
+db.event.listen(
+    Artist.__table__,
+    'after_create',
+    DDL(
+        'CREATE INDEX IF NOT EXISTS ix_artistas_nome_normalizado_trgm '
+        'ON artistas USING gin (nome_normalizado gin_trgm_ops)'
+    ).execute_if(dialect='postgresql'),
+)
@@ -0,0 +1,20 @@
+from datetime import datetime
+
+from app.extensions import db
+
+
+class ArtistDiscography(db.Model):
+    """Discografia pre-calculada do artista (JSON servido por /artista/<id>).
+
+    A linha e apagada quando o artista, seus albuns ou faixas mudam e
+    reconstruida na proxima leitura (ver DiscographyService).
+    """
+
+    __tablename__ = 'artista_discografias'
+
+    artista_id = db.Column(db.Integer, db.ForeignKey('artistas.id', ondelete='CASCADE'), primary_key=True)
+    payload_json = db.Column(db.Text, nullable=False)
+    atualizado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ArtistDiscography artista={self.artista_id}>'
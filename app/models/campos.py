@@ -0,0 +1,50 @@
+"""Selecao de campos (`?fields=`) para os `to_dict` dos models.
+
+`campos` e None (tudo) ou um dict {nome: subcampos}, em que subcampos e None
+(o valor inteiro) ou outro dict para chaves aninhadas, como em
+`fields=id,titulo,album.titulo`.
+"""
+
+
+def interpretar_campos(valor):
+    """Converte 'id,titulo,album.titulo' em {'id': None, 'titulo': None, 'album': {'titulo': None}}.
+
+    Sem nenhum nome de campo (`fields=` vazio ou so virgulas) retorna None: todos os campos.
+    """
+    if valor is None:
+        return None
+    campos = {}
+    for caminho in valor.split(','):
+        partes = [parte.strip() for parte in caminho.split('.') if parte.strip()]
+        if not partes:
+            continue
+        nivel = campos
+        for indice, parte in enumerate(partes):
+            ultimo = indice == len(partes) - 1
+            if parte in nivel and nivel[parte] is None:
+                # O campo inteiro ja foi pedido.
+                break
+            if ultimo:
+                nivel[parte] = None
+            else:
+                nivel = nivel.setdefault(parte, {})
+    return campos or None
+
+
+def incluir_campo(campos, nome):
+    return campos is None or nome in campos
+
+
+def subcampos(campos, nome):
+    return None if campos is None else campos.get(nome)
+
+
+def filtrar_campos(dados, campos):
+    """Mantem so as chaves pedidas, descendo em dicts e listas de dicts."""
+    if campos is None:
+        return dados
+    if isinstance(dados, list):
+        return [filtrar_campos(item, campos) for item in dados]
+    if not isinstance(dados, dict):
+        return dados
+    return {chave: filtrar_campos(valor, campos[chave]) for chave, valor in dados.items() if chave in campos}
@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from app.extensions import db
+
+
+class CatalogFacet(db.Model):
+    """Contagem de musicas por combinacao de facetas (genero x ano x faixa de duracao).
+
+    Tabela derivada, recalculada em lote pelo FacetService.
+    """
+
+    __tablename__ = 'catalogo_facetas'
+
+    id = db.Column(db.Integer, primary_key=True)
+    genero = db.Column(db.String(50))
+    ano_lancamento = db.Column(db.Integer)
+    faixa_duracao = db.Column(db.String(20))
+    total_musicas = db.Column(db.Integer, nullable=False, default=0)
+    atualizado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<CatalogFacet {self.genero}/{self.ano_lancamento}/{self.faixa_duracao}={self.total_musicas}>'
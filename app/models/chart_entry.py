@@ -0,0 +1,28 @@
+from app.extensions import db
+
+
+class ChartEntry(db.Model):
+    """Posicao de uma musica numa parada pre-calculada (tenant x janela x genero).
+
+    `genero` vazio e a parada de todos os generos. Recalculada em lote pelo
+    ChartService; as leituras so buscam as posicoes ja ordenadas.
+    """
+
+    __tablename__ = 'paradas'
+    __table_args__ = (
+        db.UniqueConstraint('tenant_id', 'janela', 'genero', 'posicao', name='uq_paradas_tenant_janela_genero_posicao'),
+    )
+
+    JANELAS = ('dia', 'semana', 'sempre')
+
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id', ondelete='CASCADE'), nullable=False)
+    janela = db.Column(db.String(6), nullable=False)  # 'dia', 'semana' ou 'sempre'
+    genero = db.Column(db.String(50), nullable=False, default='')
+    posicao = db.Column(db.Integer, nullable=False)
+    musica_id = db.Column(db.Integer, db.ForeignKey('musicas.id', ondelete='CASCADE'), nullable=False, index=True)
+    pontuacao = db.Column(db.Float, nullable=False, default=0.0)
+    calculado_em = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<ChartEntry {self.janela} {self.genero or "*"} #{self.posicao} musica={self.musica_id}>'
@@ -1,16 +1,64 @@
+from sqlalchemy import DDL
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
 from app.extensions import db
+from app.models.album import Album
+from app.models.campos import filtrar_campos, incluir_campo
+
+# Colunas de Music que vao para a API; a leitura sem ORM (CatalogReader) seleciona as mesmas.
+COLUNAS_SERIALIZADAS = ('id', 'titulo', 'album_id', 'duracao', 'arquivo_url', 'numero_faixa', 'visualizacoes')
+
+
+def formatar_duracao(segundos):
+    """Retorna duração formatada (MM:SS)"""
+    if not segundos:
+        return "00:00"
+    return f"{segundos // 60:02d}:{segundos % 60:02d}"
+
+
+def musica_para_dict(musica, include_album=True, campos=None):
+    """Dicionário de uma música, de Music ou de uma leitura leve (MusicaResumo)
+
+    Único formato das duas; `campos` (ver app.models.campos) limita as chaves e
+    o álbum e o artista só são lidos se `album` for pedido.
+    """
+    data = {}
+    for coluna in COLUNAS_SERIALIZADAS:
+        data[coluna] = getattr(musica, coluna)
+        if coluna == 'duracao':
+            data['duracao_formatada'] = formatar_duracao(musica.duracao)
+    
+    album = musica.album if include_album and incluir_campo(campos, 'album') else None
+    if album is not None:
+        artista = album.artista
+        data['album'] = {
+            'id': album.id,
+            'titulo': album.titulo,
+            'capa_url': album.capa_url,
+            'artista': {'id': artista.id, 'nome': artista.nome} if artista else None
+        }
+    
+    return filtrar_campos(data, campos)
+
 
 class Music(db.Model):
     """Model de Música"""
     __tablename__ = 'musicas'
+    __table_args__ = (
+        # Sustenta a paginacao por cursor (titulo, id) de buscar_musicas.
+        db.Index('ix_musicas_titulo_id', 'titulo', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     titulo = db.Column(db.String(150), nullable=False, index=True)
-    album_id = db.Column(db.Integer, db.ForeignKey('albuns.id'), nullable=False)
+    titulo_normalizado = db.Column(db.String(150))  # sem acentos/minusculo, mantido no flush
+    album_id = db.Column(db.Integer, db.ForeignKey('albuns.id'), nullable=False, index=True)
     duracao = db.Column(db.Integer)  # em segundos
     arquivo_url = db.Column(db.String(255), nullable=False)
     numero_faixa = db.Column(db.Integer)
     visualizacoes = db.Column(db.Integer, default=0)
+    # Documento de busca textual (Postgres). No SQLite o indice vive em `musicas_fts`.
+    busca_documento = db.deferred(db.Column(db.Text().with_variant(TSVECTOR(), 'postgresql')))
     
     def __init__(self, titulo, album_id, arquivo_url, duracao=None, numero_faixa=None):
         self.titulo = titulo
@@ -19,45 +67,71 @@ class Music(db.Model):
         self.duracao = duracao
         self.numero_faixa = numero_faixa
     
+    @staticmethod
+    def com_album_e_artista(query, ja_unido=False, campos=None):
+        """Carrega album e artista na mesma consulta, evitando N+1 no to_dict de listas.
+
+        Com `ja_unido=True` a query ja faz JOIN em Album e Artist e as colunas
+        deles sao aproveitadas (contains_eager) em vez de um novo JOIN. Se
+        `campos` nao pede `album`, a query volta sem carregar nada.
+        """
+        if not incluir_campo(campos, 'album'):
+            return query
+        if ja_unido:
+            return query.options(db.contains_eager(Music.album).contains_eager(Album.artista))
+        return query.options(db.joinedload(Music.album).joinedload(Album.artista))
+    
     def incrementar_visualizacao(self):
-        """Incrementa contador de visualizações"""
-        self.visualizacoes += 1
-        db.session.commit()
+        """Conta uma visualização no contador em lote (ver PlayCounter), sem commit."""
+        from app.services.play_counter import PlayCounter
+
+        PlayCounter.registrar(self.id)
     
     @property
     def duracao_formatada(self):
         """Retorna duração formatada (MM:SS)"""
-        if not self.duracao:
-            return "00:00"
-        minutos = self.duracao // 60
-        segundos = self.duracao % 60
-        return f"{minutos:02d}:{segundos:02d}"
-    
-    def to_dict(self, include_album=True):
-        """Retorna representação em dicionário"""
-        data = {
-            'id': self.id,
-            'titulo': self.titulo,
-            'album_id': self.album_id,
-            'duracao': self.duracao,
-            'duracao_formatada': self.duracao_formatada,
-            'arquivo_url': self.arquivo_url,
-            'numero_faixa': self.numero_faixa,
-            'visualizacoes': self.visualizacoes
-        }
-        
-        if include_album and self.album:
-            data['album'] = {
-                'id': self.album.id,
-                'titulo': self.album.titulo,
-                'capa_url': self.album.capa_url,
-                'artista': {
-                    'id': self.album.artista.id,
-                    'nome': self.album.artista.nome
-                } if self.album.artista else None
-            }
-        
-        return data
+        return formatar_duracao(self.duracao)
+    
+    def to_dict(self, include_album=True, campos=None):
+        """Retorna representação em dicionário (ver musica_para_dict)"""
+        return musica_para_dict(self, include_album, campos)
     
     def __repr__(self):
-        return f'<Music {self.titulo}>'
\ No newline at end of file
+        return f'<Music {self.titulo}>'
+
+
+# Estruturas de busca textual especificas de cada banco, mantidas pelo
+# CatalogSearchService (ver app/services/search_service.py).
+db.event.listen(
+    Music.__table__,
+    'after_create',
+    DDL(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS musicas_fts USING fts5("
+        "titulo, album, artista, tokenize = 'unicode61 remove_diacritics 2')"
+    ).execute_if(dialect='sqlite'),
+)
+db.event.listen(
+    Music.__table__,
+    'before_drop',
+    DDL('DROP TABLE IF EXISTS musicas_fts').execute_if(dialect='sqlite'),
+)
+db.event.listen(
+    db.metadata,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'),
+)
+db.event.listen(
+    Music.__table__,
+    'after_create',
+    DDL(
+        'CREATE INDEX IF NOT EXISTS ix_musicas_busca_documento ON musicas USING gin (busca_documento)'
+    ).execute_if(dialect='postgresql'),
+)
+db.event.listen(
+    Music.__table__,
+    'after_create',
+    DDL(
+        'CREATE INDEX IF NOT EXISTS ix_musicas_titulo_normalizado_trgm '
+        'ON musicas USING gin (titulo_normalizado gin_trgm_ops)'
+    ).execute_if(dialect='postgresql'),
+)
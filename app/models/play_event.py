@@ -0,0 +1,22 @@
+from app.extensions import db
+
+
+class PlayEvent(db.Model):
+    """Reproducoes de uma musica por usuario num mesmo segundo (log so de insercao).
+
+    Gravado em lote pelo PlayEvents; `quantidade` junta as reproducoes
+    repetidas no mesmo segundo. Linhas alem de PLAY_EVENTS_RETENTION_DAYS
+    sao descartadas; os totais ficam em `reproducoes_agregadas`.
+    """
+
+    __tablename__ = 'reproducoes'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    musica_id = db.Column(db.Integer, db.ForeignKey('musicas.id', ondelete='CASCADE'), nullable=False)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id', ondelete='SET NULL'))
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id', ondelete='CASCADE'), nullable=False)
+    tocado_em = db.Column(db.DateTime, nullable=False, index=True)
+    quantidade = db.Column(db.SmallInteger, nullable=False, default=1)
+
+    def __repr__(self):
+        return f'<PlayEvent musica={self.musica_id} em={self.tocado_em}>'
@@ -0,0 +1,33 @@
+from app.extensions import db
+
+
+class PlayRollup(db.Model):
+    """Total de reproducoes por musica e tenant numa hora ou num dia."""
+
+    __tablename__ = 'reproducoes_agregadas'
+    __table_args__ = (
+        db.UniqueConstraint('periodo', 'inicio', 'tenant_id', 'musica_id', name='uq_reproducoes_agregadas_bucket'),
+        # Leituras de graficos: periodo + tenant + intervalo de tempo.
+        db.Index('ix_reproducoes_agregadas_periodo_tenant_inicio', 'periodo', 'tenant_id', 'inicio'),
+    )
+
+    PERIODOS = ('hora', 'dia')
+
+    id = db.Column(db.Integer, primary_key=True)
+    periodo = db.Column(db.String(4), nullable=False)  # 'hora' ou 'dia'
+    inicio = db.Column(db.DateTime, nullable=False)  # inicio do periodo (UTC)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id', ondelete='CASCADE'), nullable=False)
+    musica_id = db.Column(db.Integer, db.ForeignKey('musicas.id', ondelete='CASCADE'), nullable=False, index=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'periodo': self.periodo,
+            'inicio': self.inicio.isoformat(),
+            'tenant_id': self.tenant_id,
+            'musica_id': self.musica_id,
+            'total': self.total,
+        }
+
+    def __repr__(self):
+        return f'<PlayRollup {self.periodo} {self.inicio} musica={self.musica_id}>'
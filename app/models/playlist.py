@@ -1,6 +1,7 @@
 from datetime import datetime
 
 from app.extensions import db
+from app.models.campos import filtrar_campos, incluir_campo, subcampos
 
 
 class Playlist(db.Model):
@@ -18,6 +19,9 @@ class Playlist(db.Model):
     descricao = db.Column(db.Text)
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     publica = db.Column(db.Boolean, default=False)
+    # Agregados das faixas, mantidos por delta no flush (ver CatalogCounters).
+    total_musicas = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    duracao_total = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # em segundos
 
     musicas = db.relationship(
         'Music',
@@ -33,12 +37,15 @@ class Playlist(db.Model):
         self.nome = nome
         self.descricao = descricao
         self.publica = publica
+        self.total_musicas = 0
+        self.duracao_total = 0
 
     def adicionar_musica(self, musica, posicao=None):
         """Adiciona uma musica a playlist."""
         if not self.tem_musica(musica):
             if posicao is None:
-                posicao = self.musicas.count() + 1
+                # Contador mantido no flush; tem_musica ja descarregou as inclusoes pendentes.
+                posicao = (self.total_musicas or 0) + 1
 
             playlist_musica = PlaylistMusica(
                 playlist_id=self.id,
@@ -52,29 +59,112 @@ class Playlist(db.Model):
     def remover_musica(self, musica):
         """Remove uma musica da playlist."""
         if self.tem_musica(musica):
-            PlaylistMusica.query.filter_by(
-                playlist_id=self.id,
-                musica_id=musica.id,
-            ).delete()
+            # Delete pela sessao (nao em massa) para os contadores verem a remocao no flush.
+            for playlist_musica in PlaylistMusica.query.filter_by(playlist_id=self.id, musica_id=musica.id):
+                db.session.delete(playlist_musica)
             return True
         return False
 
     def tem_musica(self, musica):
-        """Verifica se musica esta na playlist."""
-        return self.musicas.filter_by(id=musica.id).count() > 0
-
-    @property
-    def total_musicas(self):
-        """Retorna total de musicas da playlist."""
-        return self.musicas.count()
-
-    @property
-    def duracao_total(self):
-        """Retorna duracao total da playlist em segundos."""
-        return sum(musica.duracao for musica in self.musicas if musica.duracao)
+        """Verifica se musica esta na playlist (EXISTS, sem contar linhas)."""
+        return db.session.query(
+            db.exists().where(PlaylistMusica.playlist_id == self.id, PlaylistMusica.musica_id == musica.id)
+        ).scalar()
+
+    @staticmethod
+    def playlists_com_musicas(usuario_id, musica_ids):
+        """Retorna {musica_id: [playlist_id]} das playlists do usuario que contem cada musica.
+
+        Uma consulta para a lista inteira; musicas fora de todas as playlists
+        nao aparecem no dict.
+        """
+        if not musica_ids:
+            return {}
+        linhas = db.session.execute(
+            db.select(PlaylistMusica.musica_id, PlaylistMusica.playlist_id)
+            .join(Playlist, Playlist.id == PlaylistMusica.playlist_id)
+            .where(Playlist.usuario_id == usuario_id, PlaylistMusica.musica_id.in_(musica_ids))
+            .distinct()
+            .order_by(PlaylistMusica.musica_id, PlaylistMusica.playlist_id)
+        )
+        por_musica = {}
+        for musica_id, playlist_id in linhas:
+            por_musica.setdefault(musica_id, []).append(playlist_id)
+        return por_musica
+
+    def _query_faixas(self, com_album=True):
+        from app.models.album import Album
+        from app.models.artist import Artist
+        from app.models.music import Music
+
+        query = (
+            db.session.query(PlaylistMusica.posicao, Music, PlaylistMusica.id)
+            .join(Music, Music.id == PlaylistMusica.musica_id)
+            .filter(PlaylistMusica.playlist_id == self.id)
+            .order_by(PlaylistMusica.posicao, PlaylistMusica.id)
+        )
+        if com_album:
+            query = Music.com_album_e_artista(
+                query.join(Album, Album.id == Music.album_id).join(Artist, Artist.id == Album.artista_id),
+                ja_unido=True,
+            )
+        return query
+
+    def faixas_ordenadas(self, com_album=True):
+        """Retorna [(posicao, musica)] com album e artista carregados em uma unica consulta."""
+        return [(posicao, musica) for posicao, musica, _ in self._query_faixas(com_album)]
+
+    def janela_faixas(self, apos=None, limite=100, com_album=True):
+        """Retorna ([(posicao, musica)], proxima) com ate `limite` faixas depois de `apos`.
+
+        A janela e lida por chave (posicao, id de PlaylistMusica) sobre o indice
+        ix_playlist_musicas_playlist_posicao, sem OFFSET. `apos` e `proxima` sao
+        essas chaves (None na primeira/ultima janela).
+        """
+        query = self._query_faixas(com_album)
+        if apos is not None:
+            posicao, faixa_id = apos
+            query = query.filter(
+                db.or_(
+                    PlaylistMusica.posicao > posicao,
+                    db.and_(PlaylistMusica.posicao == posicao, PlaylistMusica.id > faixa_id),
+                )
+            )
+        # Uma linha extra so para saber se existe proxima janela.
+        linhas = query.limit(limite + 1).all()
+        proxima = None
+        if len(linhas) > limite:
+            linhas = linhas[:limite]
+            proxima = (linhas[-1][0], linhas[-1][2])
+        return [(posicao, musica) for posicao, musica, _ in linhas], proxima
+
+    def to_dict(self, include_musicas=False, campos=None, limite_musicas=None):
+        """Retorna representacao em dicionario.
+
+        Com `include_musicas` os totais saem das mesmas linhas das faixas,
+        sem consultas extras de contagem. Com `limite_musicas` so a primeira
+        janela de faixas e lida (ver janela_faixas); os totais vem das colunas
+        e `musicas_proxima` guarda a chave da janela seguinte. `campos` (ver
+        app.models.campos) limita as chaves; as faixas so sao lidas se
+        `musicas` for pedido.
+        """
+        campos_musicas = subcampos(campos, 'musicas')
+        carregar_faixas = include_musicas and incluir_campo(campos, 'musicas')
+        proxima = None
+        if carregar_faixas and limite_musicas is not None:
+            faixas, proxima = self.janela_faixas(
+                limite=limite_musicas, com_album=incluir_campo(campos_musicas, 'album')
+            )
+            total_musicas = self.total_musicas
+            duracao_total = self.duracao_total
+        elif carregar_faixas:
+            faixas = self.faixas_ordenadas(com_album=incluir_campo(campos_musicas, 'album'))
+            total_musicas = len(faixas)
+            duracao_total = sum(musica.duracao or 0 for _, musica in faixas)
+        else:
+            total_musicas = self.total_musicas
+            duracao_total = self.duracao_total
 
-    def to_dict(self, include_musicas=False):
-        """Retorna representacao em dicionario."""
         data = {
             'id': self.id,
             'tenant_id': self.tenant_id,
@@ -83,15 +173,24 @@ class Playlist(db.Model):
             'descricao': self.descricao,
             'data_criacao': self.data_criacao.isoformat(),
             'publica': self.publica,
-            'total_musicas': self.total_musicas,
-            'duracao_total': self.duracao_total,
+            'total_musicas': total_musicas,
+            'duracao_total': duracao_total,
         }
 
-        if include_musicas:
-            musicas_ordenadas = PlaylistMusica.query.filter_by(playlist_id=self.id).order_by(PlaylistMusica.posicao).all()
-            data['musicas'] = [{**pm.musica.to_dict(), 'posicao': pm.posicao} for pm in musicas_ordenadas]
+        if carregar_faixas:
+            data['musicas'] = self.faixas_to_dict(faixas, campos_musicas)
+            if limite_musicas is not None:
+                data['musicas_proxima'] = proxima
 
-        return data
+        return filtrar_campos(data, campos)
+
+    @staticmethod
+    def faixas_to_dict(faixas, campos=None):
+        """Serializa [(posicao, musica)] como as `musicas` de to_dict."""
+        return [
+            {**musica.to_dict(include_album=incluir_campo(campos, 'album')), 'posicao': posicao}
+            for posicao, musica in faixas
+        ]
 
     def __repr__(self):
         return f'<Playlist {self.nome}>'
@@ -101,6 +200,11 @@ class PlaylistMusica(db.Model):
     """Tabela associativa entre playlist e music."""
 
     __tablename__ = 'playlist_musicas'
+    __table_args__ = (
+        # Sustenta a leitura das faixas por janela (posicao, id) em janela_faixas;
+        # o id desempata posicoes repetidas.
+        db.Index('ix_playlist_musicas_playlist_posicao', 'playlist_id', 'posicao', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     playlist_id = db.Column(db.Integer, db.ForeignKey('playlists.id'), nullable=False)
@@ -108,8 +212,18 @@ class PlaylistMusica(db.Model):
     posicao = db.Column(db.Integer, default=1)
     data_adicao = db.Column(db.DateTime, default=datetime.utcnow)
 
-    playlist = db.relationship('Playlist', backref='playlist_musicas_rel', overlaps='musicas,playlists')
-    musica = db.relationship('Music', backref='playlist_musicas_rel', overlaps='musicas,playlists')
+    # As linhas somem pelo relacionamento `musicas` (secondary) quando a playlist
+    # ou a musica e removida; os backrefs nao tentam anular as chaves.
+    playlist = db.relationship(
+        'Playlist',
+        backref=db.backref('playlist_musicas_rel', passive_deletes='all'),
+        overlaps='musicas,playlists',
+    )
+    musica = db.relationship(
+        'Music',
+        backref=db.backref('playlist_musicas_rel', passive_deletes='all'),
+        overlaps='musicas,playlists',
+    )
 
     def __repr__(self):
         return f'<PlaylistMusica playlist_id={self.playlist_id} musica_id={self.musica_id}>'
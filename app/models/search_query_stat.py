@@ -0,0 +1,32 @@
+from app.extensions import db
+
+
+class SearchQueryStat(db.Model):
+    """Agregado diario de uma busca (termo normalizado), gravado em lote."""
+
+    __tablename__ = 'busca_estatisticas'
+    __table_args__ = (db.UniqueConstraint('termo', 'dia', name='uq_busca_estatisticas_termo_dia'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    termo = db.Column(db.String(150), nullable=False)
+    dia = db.Column(db.Date, nullable=False, index=True)
+    total_buscas = db.Column(db.Integer, nullable=False, default=0)
+    total_sem_resultado = db.Column(db.Integer, nullable=False, default=0)
+    soma_resultados = db.Column(db.BigInteger, nullable=False, default=0)
+    soma_latencia_ms = db.Column(db.Float, nullable=False, default=0.0)
+    max_latencia_ms = db.Column(db.Float, nullable=False, default=0.0)
+    ultima_busca_em = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'termo': self.termo,
+            'dia': self.dia.isoformat(),
+            'total_buscas': self.total_buscas,
+            'total_sem_resultado': self.total_sem_resultado,
+            'media_resultados': self.soma_resultados / self.total_buscas if self.total_buscas else 0,
+            'media_latencia_ms': self.soma_latencia_ms / self.total_buscas if self.total_buscas else 0,
+            'max_latencia_ms': self.max_latencia_ms,
+        }
+
+    def __repr__(self):
+        return f'<SearchQueryStat {self.termo} {self.dia}>'
@@ -21,6 +21,10 @@ class User(UserMixin, db.Model):
     reset_senha_expira_em = db.Column(db.DateTime)
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     ativo = db.Column(db.Boolean, default=True)
+    # Contadores do perfil: playlists mantidas no flush (ver CatalogCounters),
+    # favoritos por add_favorito/remove_favorito.
+    total_playlists = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_favoritos = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     playlists = db.relationship('Playlist', backref='usuario', lazy='dynamic', cascade='all, delete-orphan')
     favoritos = db.relationship('Music', secondary='favoritos', backref='usuarios_favoritaram', lazy='dynamic')
@@ -49,6 +53,8 @@ class User(UserMixin, db.Model):
         self.email_verificacao_token = email_verificacao_token
         self.reset_senha_token = reset_senha_token
         self.reset_senha_expira_em = reset_senha_expira_em
+        self.total_playlists = 0
+        self.total_favoritos = 0
         self.set_password(senha)
 
     def set_password(self, senha):
@@ -73,18 +79,33 @@ class User(UserMixin, db.Model):
         return self.email_verificado_em is not None
 
     def add_favorito(self, musica):
-        """Adiciona musica aos favoritos."""
+        """Adiciona musica aos favoritos (total_favoritos e atualizado no flush)."""
         if not self.is_favorito(musica):
             self.favoritos.append(musica)
 
     def remove_favorito(self, musica):
-        """Remove musica dos favoritos."""
+        """Remove musica dos favoritos (total_favoritos e atualizado no flush)."""
         if self.is_favorito(musica):
             self.favoritos.remove(musica)
 
     def is_favorito(self, musica):
-        """Verifica se musica esta nos favoritos."""
-        return self.favoritos.filter_by(id=musica.id).count() > 0
+        """Verifica se musica esta nos favoritos (EXISTS, sem contar linhas)."""
+        return db.session.query(
+            db.exists().where(favoritos.c.usuario_id == self.id, favoritos.c.musica_id == musica.id)
+        ).scalar()
+
+    def favoritos_entre(self, musica_ids):
+        """Retorna o conjunto dos ids de `musica_ids` que estao nos favoritos (uma consulta)."""
+        if not musica_ids:
+            return set()
+        return set(
+            db.session.scalars(
+                db.select(favoritos.c.musica_id).where(
+                    favoritos.c.usuario_id == self.id,
+                    favoritos.c.musica_id.in_(musica_ids),
+                )
+            )
+        )
 
     def to_dict(self):
         """Retorna representacao em dicionario."""
@@ -96,8 +117,8 @@ class User(UserMixin, db.Model):
             'email_verificado': self.email_verificado,
             'email_verificado_em': self.email_verificado_em.isoformat() if self.email_verificado_em else None,
             'data_criacao': self.data_criacao.isoformat(),
-            'total_playlists': self.playlists.count(),
-            'total_favoritos': self.favoritos.count(),
+            'total_playlists': self.total_playlists,
+            'total_favoritos': self.total_favoritos,
         }
 
     def __repr__(self):
@@ -0,0 +1,262 @@
+from collections import defaultdict
+
+import sqlalchemy as sa
+
+from app.extensions import db
+
+
+def valor_anterior(instancia, campo):
+    """Valor do atributo como estava no banco antes das alteracoes pendentes.
+
+    Atributo expirado (ex.: depois de um commit) nao tem historico: trocar so a
+    relacao (`musica.album = outro`) deixa album_id sem valor ate o flush. Nesse
+    caso o valor e carregado do banco, que ainda tem o anterior.
+    """
+    estado = db.inspect(instancia)
+    if campo in estado.unloaded and estado.has_identity and estado.session is not None:
+        with estado.session.no_autoflush:
+            getattr(instancia, campo)
+    historico = estado.attrs[campo].history
+    if historico.deleted:
+        return historico.deleted[0]
+    if historico.unchanged:
+        return historico.unchanged[0]
+    return None
+
+
+class CatalogCounters:
+    """Contadores desnormalizados de faixas e duracao por album e por playlist,
+    e de playlists e favoritos por usuario.
+
+    Alteracoes feitas pela sessao viram deltas (`total = total + n`) aplicados
+    no mesmo flush, sem recontar as faixas. `recalcular_albuns` e
+    `recalcular_playlists` recompoem os valores para backfill e reparo.
+    """
+
+    @staticmethod
+    def valores_anteriores(musica):
+        """(album_id, duracao) como estavam no banco antes do flush."""
+        return valor_anterior(musica, 'album_id'), valor_anterior(musica, 'duracao')
+
+    @staticmethod
+    def deltas_albuns(alteracoes):
+        """Converte (musica|None, album_anterior, duracao_anterior) em {album_id: (faixas, segundos)}.
+
+        `musica` e None quando a faixa foi removida; album_anterior e None para faixas novas.
+        """
+        deltas = defaultdict(lambda: [0, 0])
+        for musica, album_anterior, duracao_anterior in alteracoes:
+            if album_anterior is not None:
+                deltas[album_anterior][0] -= 1
+                deltas[album_anterior][1] -= duracao_anterior or 0
+            if musica is not None and musica.album_id is not None:
+                deltas[musica.album_id][0] += 1
+                deltas[musica.album_id][1] += musica.duracao or 0
+        return {album_id: tuple(delta) for album_id, delta in deltas.items() if any(delta)}
+
+    @staticmethod
+    def _aplicar_deltas(connection, tabela, deltas, colunas=('total_musicas', 'duracao_total')):
+        if not deltas:
+            return
+        connection.execute(
+            sa.update(tabela)
+            .where(tabela.c.id == sa.bindparam('b_id'))
+            .values({coluna: tabela.c[coluna] + sa.bindparam(f'b_{coluna}') for coluna in colunas}),
+            [
+                {'b_id': item_id, **{f'b_{coluna}': valor for coluna, valor in zip(colunas, delta)}}
+                for item_id, delta in deltas.items()
+            ],
+        )
+
+    @classmethod
+    def aplicar_deltas_albuns(cls, connection, deltas):
+        from app.models import Album
+
+        cls._aplicar_deltas(connection, Album.__table__, deltas)
+
+    @staticmethod
+    def deltas_playlists_por_musica(session, duracoes, removidas):
+        """Deltas das playlists que contem musicas alteradas ou removidas.
+
+        `duracoes` e {musica_id: (duracao_anterior, duracao_nova)}; `removidas` sao
+        ids de musicas cujas entradas em playlist_musicas somem junto com elas.
+        Precisa rodar antes do flush, enquanto o banco ainda tem o estado anterior.
+        """
+        from app.models import Music
+        from app.models.playlist import PlaylistMusica
+
+        musica_ids = set(duracoes) | set(removidas)
+        deltas = defaultdict(lambda: [0, 0])
+        if not musica_ids:
+            return deltas
+        linhas = (
+            session.query(PlaylistMusica.playlist_id, PlaylistMusica.musica_id, sa.func.count(), Music.duracao)
+            .join(Music, Music.id == PlaylistMusica.musica_id)
+            .filter(PlaylistMusica.musica_id.in_(musica_ids))
+            .group_by(PlaylistMusica.playlist_id, PlaylistMusica.musica_id, Music.duracao)
+        )
+        for playlist_id, musica_id, vezes, duracao in linhas:
+            if musica_id in removidas:
+                deltas[playlist_id][0] -= vezes
+                deltas[playlist_id][1] -= vezes * (duracao or 0)
+            else:
+                anterior, nova = duracoes[musica_id]
+                deltas[playlist_id][1] += vezes * ((nova or 0) - (anterior or 0))
+        return deltas
+
+    @staticmethod
+    def deltas_playlists_por_faixa(connection, faixas, deltas=None):
+        """Soma aos deltas as entradas (playlist_id, musica_id, +1|-1) incluidas ou removidas.
+
+        A duracao e lida do banco depois do flush, ja com o valor novo da musica.
+        """
+        from app.models import Music
+
+        deltas = deltas if deltas is not None else defaultdict(lambda: [0, 0])
+        if not faixas:
+            return deltas
+        musicas = Music.__table__
+        duracoes = dict(
+            connection.execute(
+                sa.select(musicas.c.id, musicas.c.duracao).where(
+                    musicas.c.id.in_({musica_id for _, musica_id, _ in faixas})
+                )
+            ).all()
+        )
+        for playlist_id, musica_id, sinal in faixas:
+            deltas[playlist_id][0] += sinal
+            deltas[playlist_id][1] += sinal * (duracoes.get(musica_id) or 0)
+        return deltas
+
+    @classmethod
+    def aplicar_deltas_playlists(cls, connection, deltas):
+        from app.models import Playlist
+
+        deltas = {playlist_id: tuple(delta) for playlist_id, delta in deltas.items() if any(delta)}
+        cls._aplicar_deltas(connection, Playlist.__table__, deltas)
+        return deltas
+
+    @staticmethod
+    def deltas_usuarios(session, playlists, musicas_removidas):
+        """{usuario_id: (playlists, favoritos)} das playlists criadas/removidas e das musicas removidas.
+
+        `playlists` e uma lista de (usuario_id, +1|-1). Os favoritos das musicas
+        removidas sao contados antes do flush, enquanto as linhas ainda existem.
+        """
+        from app.models.user import favoritos
+
+        deltas = defaultdict(lambda: [0, 0])
+        for usuario_id, sinal in playlists:
+            if usuario_id is not None:
+                deltas[usuario_id][0] += sinal
+        if musicas_removidas:
+            linhas = (
+                session.query(favoritos.c.usuario_id, sa.func.count())
+                .filter(favoritos.c.musica_id.in_(musicas_removidas))
+                .group_by(favoritos.c.usuario_id)
+            )
+            for usuario_id, vezes in linhas:
+                deltas[usuario_id][1] -= vezes
+        return deltas
+
+    @classmethod
+    def aplicar_deltas_usuarios(cls, connection, deltas):
+        from app.models import User
+
+        deltas = {usuario_id: tuple(delta) for usuario_id, delta in deltas.items() if any(delta)}
+        cls._aplicar_deltas(connection, User.__table__, deltas, colunas=('total_playlists', 'total_favoritos'))
+        return deltas
+
+    @staticmethod
+    def recalcular_albuns(album_ids=None):
+        """Recalcula os agregados a partir das faixas e retorna quantos albuns estavam divergentes."""
+        from app.models import Album, Music
+
+        albuns = Album.__table__
+        musicas = Music.__table__
+        total = (
+            sa.select(sa.func.count(musicas.c.id))
+            .where(musicas.c.album_id == albuns.c.id)
+            .scalar_subquery()
+        )
+        duracao = (
+            sa.select(sa.func.coalesce(sa.func.sum(musicas.c.duracao), 0))
+            .where(musicas.c.album_id == albuns.c.id)
+            .scalar_subquery()
+        )
+        stmt = (
+            sa.update(albuns)
+            .where(sa.or_(albuns.c.total_musicas != total, albuns.c.duracao_total != duracao))
+            .values(total_musicas=total, duracao_total=duracao)
+        )
+        if album_ids is not None:
+            stmt = stmt.where(albuns.c.id.in_(album_ids))
+        resultado = db.session.execute(stmt)
+        db.session.commit()
+        return resultado.rowcount
+
+    @staticmethod
+    def recalcular_playlists(playlist_ids=None):
+        """Recalcula os agregados a partir de playlist_musicas e retorna quantas playlists estavam divergentes."""
+        from app.models import Music, Playlist
+        from app.models.playlist import PlaylistMusica
+
+        playlists = Playlist.__table__
+        faixas = PlaylistMusica.__table__
+        musicas = Music.__table__
+        total = (
+            sa.select(sa.func.count(faixas.c.id))
+            .where(faixas.c.playlist_id == playlists.c.id)
+            .scalar_subquery()
+        )
+        duracao = (
+            sa.select(sa.func.coalesce(sa.func.sum(musicas.c.duracao), 0))
+            .select_from(faixas.join(musicas, musicas.c.id == faixas.c.musica_id))
+            .where(faixas.c.playlist_id == playlists.c.id)
+            .scalar_subquery()
+        )
+        stmt = (
+            sa.update(playlists)
+            .where(sa.or_(playlists.c.total_musicas != total, playlists.c.duracao_total != duracao))
+            .values(total_musicas=total, duracao_total=duracao)
+        )
+        if playlist_ids is not None:
+            stmt = stmt.where(playlists.c.id.in_(playlist_ids))
+        resultado = db.session.execute(stmt)
+        db.session.commit()
+        return resultado.rowcount
+
+    @staticmethod
+    def recalcular_usuarios(usuario_ids=None):
+        """Recalcula playlists e favoritos por usuario e retorna quantos estavam divergentes."""
+        from app.models import Playlist, User
+        from app.models.user import favoritos
+
+        usuarios = User.__table__
+        playlists = Playlist.__table__
+        total_playlists = (
+            sa.select(sa.func.count(playlists.c.id))
+            .where(playlists.c.usuario_id == usuarios.c.id)
+            .scalar_subquery()
+        )
+        total_favoritos = (
+            sa.select(sa.func.count())
+            .select_from(favoritos)
+            .where(favoritos.c.usuario_id == usuarios.c.id)
+            .scalar_subquery()
+        )
+        stmt = (
+            sa.update(usuarios)
+            .where(
+                sa.or_(
+                    usuarios.c.total_playlists != total_playlists,
+                    usuarios.c.total_favoritos != total_favoritos,
+                )
+            )
+            .values(total_playlists=total_playlists, total_favoritos=total_favoritos)
+        )
+        if usuario_ids is not None:
+            stmt = stmt.where(usuarios.c.id.in_(usuario_ids))
+        resultado = db.session.execute(stmt)
+        db.session.commit()
+        return resultado.rowcount
@@ -0,0 +1,115 @@
+from app.extensions import db
+from app.models.campos import incluir_campo
+from app.models.music import COLUNAS_SERIALIZADAS, formatar_duracao, musica_para_dict
+
+
+class ArtistaResumo:
+    __slots__ = ('id', 'nome')
+
+    def __init__(self, id, nome):
+        self.id = id
+        self.nome = nome
+
+
+class AlbumResumo:
+    __slots__ = ('id', 'titulo', 'capa_url', 'artista')
+
+    def __init__(self, id, titulo, capa_url, artista):
+        self.id = id
+        self.titulo = titulo
+        self.capa_url = capa_url
+        self.artista = artista
+
+
+class MusicaResumo:
+    """Musica somente leitura, sem sessao nem rastreamento de alteracoes.
+
+    Tem as colunas serializadas de Music e usa o mesmo `musica_para_dict`;
+    `album` e None quando o album nao foi selecionado.
+    """
+
+    __slots__ = COLUNAS_SERIALIZADAS + ('album',)
+
+    def __init__(self, *valores, album=None):
+        for coluna, valor in zip(COLUNAS_SERIALIZADAS, valores, strict=True):
+            setattr(self, coluna, valor)
+        self.album = album
+
+    @property
+    def duracao_formatada(self):
+        """Retorna duração formatada (MM:SS)"""
+        return formatar_duracao(self.duracao)
+
+    def to_dict(self, campos=None):
+        """Mesmo formato de Music.to_dict() (`campos`: ver app.models.campos)"""
+        return musica_para_dict(self, campos=campos)
+
+
+class CatalogReader:
+    """Leitura de listas do catalogo sem instancias do ORM.
+
+    Recebe as queries de Music ja filtradas e ordenadas pelos controllers,
+    troca as entidades so pelas colunas que a resposta usa e executa o
+    SELECT resultante, mapeando cada linha para um MusicaResumo. Albuns e
+    artistas repetidos na mesma leitura compartilham o mesmo objeto.
+    """
+
+    @staticmethod
+    def _colunas(campos):
+        from app.models import Album, Artist, Music
+
+        colunas = [getattr(Music, coluna) for coluna in COLUNAS_SERIALIZADAS]
+        if incluir_campo(campos, 'album'):
+            colunas += [Album.titulo, Album.capa_url, Artist.id, Artist.nome]
+        return colunas
+
+    @staticmethod
+    def consulta(query, campos=None, ja_unido=False):
+        """SELECT so com as colunas de MusicaResumo (e de album/artista, se pedidos).
+
+        Com `ja_unido=True` a query ja faz JOIN em Album e Artist.
+        """
+        from app.models import Album, Artist, Music
+
+        consulta = query.with_entities(*CatalogReader._colunas(campos)).statement
+        if incluir_campo(campos, 'album') and not ja_unido:
+            consulta = consulta.outerjoin(Album, Music.album_id == Album.id).outerjoin(
+                Artist, Album.artista_id == Artist.id
+            )
+        return consulta
+
+    @staticmethod
+    def _mapear(linhas, com_album):
+        albuns = {}
+        artistas = {}
+        total = len(COLUNAS_SERIALIZADAS)
+        posicao_album = COLUNAS_SERIALIZADAS.index('album_id')
+        for linha in linhas:
+            album = None
+            if com_album:
+                album_id = linha[posicao_album]
+                album_titulo, capa_url, artista_id, artista_nome = linha[total:]
+                album = albuns.get(album_id)
+                if album is None:
+                    artista = None
+                    if artista_id is not None:
+                        artista = artistas.get(artista_id)
+                        if artista is None:
+                            artista = artistas[artista_id] = ArtistaResumo(artista_id, artista_nome)
+                    album = albuns[album_id] = AlbumResumo(album_id, album_titulo, capa_url, artista)
+            yield MusicaResumo(*linha[:total], album=album)
+
+    @staticmethod
+    def musicas(query, campos=None, ja_unido=False):
+        """Lista de MusicaResumo para a query de Music."""
+        linhas = db.session.execute(CatalogReader.consulta(query, campos, ja_unido)).all()
+        return list(CatalogReader._mapear(linhas, incluir_campo(campos, 'album')))
+
+    @staticmethod
+    def musicas_em_lotes(query, tamanho_lote, campos=None, ja_unido=False):
+        """Gera MusicaResumo lendo o resultado em lotes (cursor no servidor)."""
+        resultado = db.session.execute(
+            CatalogReader.consulta(query, campos, ja_unido),
+            execution_options={'yield_per': tamanho_lote},
+        )
+        return CatalogReader._mapear(resultado, incluir_campo(campos, 'album'))
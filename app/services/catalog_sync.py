@@ -0,0 +1,297 @@
+from flask import has_app_context
+from sqlalchemy import event
+
+from app.extensions import db
+from app.services.catalog_counters import CatalogCounters, valor_anterior
+from app.services.discography_service import DiscographyService
+from app.services.facet_service import FacetService
+from app.services.result_cache import search_cache
+from app.services.search_service import CatalogSearchService, normalizar_texto
+from app.services.suggestion_service import SuggestionService
+
+_PENDENCIAS_KEY = 'catalog_sync_pendencias'
+_CONFIRMACAO_KEY = 'catalog_sync_confirmacao'
+_EXPIRAR_KEY = 'catalog_sync_expirar'
+
+
+def _novas_pendencias():
+    return {
+        'musicas': [],
+        'album_ids': set(),
+        'artista_ids': set(),
+        'musicas_removidas': set(),
+        'sugestoes_alteradas': [],
+        'sugestoes_removidas': set(),
+        'facetas': False,
+        'faixas_albuns': [],
+        'discografias': set(),
+        'albuns_discografia': [],
+        'faixas_incluidas': [],
+        'faixas_removidas': [],
+        'duracoes_musicas': {},
+        'deltas_playlists': {},
+        'playlists_usuarios': [],
+        'playlists_donos': [],
+        'favoritos_usuarios': [],
+        'deltas_usuarios': {},
+    }
+
+
+def _tipo_sugestao(instancia, Album, Artist, Music):
+    if isinstance(instancia, Music):
+        return 'musica', instancia.titulo
+    if isinstance(instancia, Album):
+        return 'album', instancia.titulo
+    if isinstance(instancia, Artist):
+        return 'artista', instancia.nome
+    return None, None
+
+
+def _alterou(instancia, *campos):
+    estado = db.inspect(instancia)
+    return any(estado.attrs[campo].history.has_changes() for campo in campos)
+
+
+def _saldo(instancia, colecao):
+    """Itens incluidos menos removidos na colecao desde o ultimo flush."""
+    historico = db.inspect(instancia).attrs[colecao].history
+    return len(historico.added) - len(historico.deleted)
+
+
+def _ids_musicas_de(session, Music, Album, album_ids=(), artista_ids=()):
+    query = session.query(Music.id).join(Album, Album.id == Music.album_id)
+    if album_ids:
+        query = query.filter(Album.id.in_(album_ids))
+    else:
+        query = query.filter(Album.artista_id.in_(artista_ids))
+    return {row[0] for row in query}
+
+
+def _atualizar_colunas_normalizadas(instancia, Album, Artist, Music):
+    if isinstance(instancia, (Music, Album)):
+        instancia.titulo_normalizado = normalizar_texto(instancia.titulo)
+    elif isinstance(instancia, Artist):
+        instancia.nome_normalizado = normalizar_texto(instancia.nome)
+
+
+def _coletar_alteracoes(session, flush_context, instances):
+    """Registra, antes do flush, quais entidades do catalogo mudaram."""
+    from app.models import Album, Artist, Music, Playlist, User
+    from app.models.playlist import PlaylistMusica
+
+    pendencias = session.info.setdefault(_PENDENCIAS_KEY, _novas_pendencias())
+
+    for instancia in session.new:
+        _atualizar_colunas_normalizadas(instancia, Album, Artist, Music)
+        if isinstance(instancia, Music):
+            pendencias['musicas'].append(instancia)
+            pendencias['faixas_albuns'].append((instancia, None, None))
+        if isinstance(instancia, (Music, Album, Artist)):
+            pendencias['sugestoes_alteradas'].append(instancia)
+            pendencias['facetas'] = True
+        if isinstance(instancia, Album):
+            pendencias['albuns_discografia'].append(instancia)
+        if isinstance(instancia, PlaylistMusica):
+            pendencias['faixas_incluidas'].append(instancia)
+        if isinstance(instancia, Playlist):
+            pendencias['playlists_donos'].append(instancia)
+        if isinstance(instancia, User) and _alterou(instancia, 'favoritos'):
+            pendencias['favoritos_usuarios'].append((instancia, _saldo(instancia, 'favoritos')))
+
+    for instancia in session.dirty:
+        if isinstance(instancia, Artist) and session.is_modified(instancia):
+            pendencias['discografias'].add(instancia.id)
+        elif isinstance(instancia, Album) and session.is_modified(instancia):
+            pendencias['discografias'].add(valor_anterior(instancia, 'artista_id'))
+            pendencias['albuns_discografia'].append(instancia)
+        if isinstance(instancia, Music) and _alterou(instancia, 'album_id', 'album', 'duracao'):
+            pendencias['faixas_albuns'].append((instancia, *CatalogCounters.valores_anteriores(instancia)))
+        if isinstance(instancia, Music) and _alterou(instancia, 'duracao'):
+            pendencias['duracoes_musicas'][instancia.id] = (valor_anterior(instancia, 'duracao'), instancia.duracao)
+        if isinstance(instancia, PlaylistMusica) and _alterou(instancia, 'playlist', 'playlist_id', 'musica', 'musica_id'):
+            pendencias['faixas_removidas'].append(
+                (valor_anterior(instancia, 'playlist_id'), valor_anterior(instancia, 'musica_id'), -1)
+            )
+            pendencias['faixas_incluidas'].append(instancia)
+        if isinstance(instancia, Playlist) and _alterou(instancia, 'usuario_id', 'usuario'):
+            # O novo dono so e conhecido depois do flush quando a troca foi pela relacao.
+            pendencias['playlists_usuarios'].append((valor_anterior(instancia, 'usuario_id'), -1))
+            pendencias['playlists_donos'].append(instancia)
+        if isinstance(instancia, User) and _alterou(instancia, 'favoritos'):
+            pendencias['favoritos_usuarios'].append((instancia, _saldo(instancia, 'favoritos')))
+        # Trocar `musica.album` so preenche album_id durante o flush; a relacao tambem conta.
+        if isinstance(instancia, Music) and _alterou(instancia, 'titulo', 'album_id', 'album'):
+            _atualizar_colunas_normalizadas(instancia, Album, Artist, Music)
+            pendencias['musicas'].append(instancia)
+        elif isinstance(instancia, Album) and _alterou(instancia, 'titulo', 'artista_id', 'artista'):
+            _atualizar_colunas_normalizadas(instancia, Album, Artist, Music)
+            pendencias['album_ids'].add(instancia.id)
+        elif isinstance(instancia, Artist) and _alterou(instancia, 'nome'):
+            _atualizar_colunas_normalizadas(instancia, Album, Artist, Music)
+            pendencias['artista_ids'].add(instancia.id)
+        if isinstance(instancia, (Music, Album, Artist)) and _alterou(
+            instancia, 'nome' if isinstance(instancia, Artist) else 'titulo'
+        ):
+            pendencias['sugestoes_alteradas'].append(instancia)
+        if (
+            (isinstance(instancia, Music) and _alterou(instancia, 'duracao', 'album_id', 'album'))
+            or (isinstance(instancia, Album) and _alterou(instancia, 'ano_lancamento', 'artista_id', 'artista'))
+            or (isinstance(instancia, Artist) and _alterou(instancia, 'genero'))
+        ):
+            pendencias['facetas'] = True
+
+    albuns_removidos = set()
+    artistas_removidos = set()
+    for instancia in session.deleted:
+        tipo, _ = _tipo_sugestao(instancia, Album, Artist, Music)
+        if tipo:
+            pendencias['sugestoes_removidas'].add((tipo, instancia.id))
+            pendencias['facetas'] = True
+        if isinstance(instancia, Music):
+            pendencias['musicas_removidas'].add(instancia.id)
+            pendencias['faixas_albuns'].append((None, *CatalogCounters.valores_anteriores(instancia)))
+        elif isinstance(instancia, Album):
+            albuns_removidos.add(instancia.id)
+            pendencias['discografias'].add(instancia.artista_id)
+        elif isinstance(instancia, Artist):
+            artistas_removidos.add(instancia.id)
+            pendencias['discografias'].add(instancia.id)
+        elif isinstance(instancia, PlaylistMusica):
+            pendencias['faixas_removidas'].append(
+                (valor_anterior(instancia, 'playlist_id'), valor_anterior(instancia, 'musica_id'), -1)
+            )
+        elif isinstance(instancia, Playlist):
+            pendencias['playlists_usuarios'].append((valor_anterior(instancia, 'usuario_id'), -1))
+
+    # As faixas de albuns/artistas removidos precisam ser resolvidas antes do
+    # DELETE, enquanto ainda existem no banco.
+    with session.no_autoflush:
+        if albuns_removidos:
+            pendencias['musicas_removidas'] |= _ids_musicas_de(session, Music, Album, album_ids=albuns_removidos)
+        if artistas_removidos:
+            pendencias['musicas_removidas'] |= _ids_musicas_de(session, Music, Album, artista_ids=artistas_removidos)
+        # Entradas de playlist das musicas removidas ou com nova duracao.
+        pendencias['deltas_playlists'] = CatalogCounters.deltas_playlists_por_musica(
+            session, pendencias['duracoes_musicas'], pendencias['musicas_removidas']
+        )
+        pendencias['deltas_usuarios'] = CatalogCounters.deltas_usuarios(
+            session, pendencias['playlists_usuarios'], pendencias['musicas_removidas']
+        )
+
+
+def _aplicar_alteracoes(session, flush_context):
+    """Atualiza as estruturas derivadas do catalogo dentro da mesma transacao."""
+    pendencias = session.info.pop(_PENDENCIAS_KEY, None)
+    if not pendencias:
+        return
+
+    removidas = pendencias['musicas_removidas']
+    musica_ids = {musica.id for musica in pendencias['musicas'] if musica.id is not None} - removidas
+    album_ids = pendencias['album_ids']
+    artista_ids = pendencias['artista_ids']
+
+    connection = session.connection()
+    CatalogSearchService.remover(connection, removidas)
+    CatalogSearchService.sincronizar(
+        connection,
+        musica_ids=musica_ids,
+        album_ids=album_ids,
+        artista_ids=artista_ids,
+    )
+
+    deltas = CatalogCounters.deltas_albuns(pendencias['faixas_albuns'])
+    CatalogCounters.aplicar_deltas_albuns(connection, deltas)
+
+    # Entradas das musicas removidas ja foram descontadas em deltas_playlists.
+    faixas = [
+        faixa
+        for faixa in pendencias['faixas_removidas']
+        + [(pm.playlist_id, pm.musica_id, 1) for pm in pendencias['faixas_incluidas']]
+        if faixa[0] is not None and faixa[1] is not None and faixa[1] not in removidas
+    ]
+    deltas_playlists = CatalogCounters.aplicar_deltas_playlists(
+        connection, CatalogCounters.deltas_playlists_por_faixa(connection, faixas, pendencias['deltas_playlists'])
+    )
+
+    deltas_usuarios = pendencias['deltas_usuarios']
+    for playlist in pendencias['playlists_donos']:
+        if playlist.usuario_id is not None:
+            deltas_usuarios[playlist.usuario_id][0] += 1
+    for usuario, saldo in pendencias['favoritos_usuarios']:
+        deltas_usuarios[usuario.id][1] += saldo
+    deltas_usuarios = CatalogCounters.aplicar_deltas_usuarios(connection, deltas_usuarios)
+
+    from app.models import Album, Artist, Music, Playlist, User
+
+    agregados = ('total_musicas', 'duracao_total')
+    expirar = session.info.setdefault(_EXPIRAR_KEY, {})
+    expirar.update((session.identity_key(Album, album_id), agregados) for album_id in deltas)
+    expirar.update((session.identity_key(Playlist, playlist_id), agregados) for playlist_id in deltas_playlists)
+    expirar.update(
+        (session.identity_key(User, usuario_id), ('total_playlists', 'total_favoritos'))
+        for usuario_id in deltas_usuarios
+    )
+
+    artistas = pendencias['discografias'] | {album.artista_id for album in pendencias['albuns_discografia']}
+    DiscographyService.invalidar(connection, artista_ids=artistas - {None}, album_ids=deltas)
+
+    # Sugestoes, facetas e o cache de busca vivem em memoria por worker; so
+    # recebem as alteracoes quando a transacao e confirmada.
+    confirmacao = session.info.setdefault(
+        _CONFIRMACAO_KEY,
+        {'sugestoes_alteradas': {}, 'sugestoes_removidas': set(), 'facetas': False, 'busca': False},
+    )
+    for instancia in pendencias['sugestoes_alteradas']:
+        tipo, nome = _tipo_sugestao(instancia, Album, Artist, Music)
+        if instancia.id is not None:
+            confirmacao['sugestoes_alteradas'][(tipo, instancia.id)] = nome
+    confirmacao['sugestoes_removidas'] |= pendencias['sugestoes_removidas']
+    confirmacao['facetas'] = confirmacao['facetas'] or pendencias['facetas']
+    # Resultados em cache trazem titulo do album e nome do artista, nao so da faixa.
+    confirmacao['busca'] = confirmacao['busca'] or bool(removidas or musica_ids or album_ids or artista_ids)
+
+
+def _expirar_agregados(session, flush_context):
+    """Descarta das instancias em memoria os contadores alterados direto no banco."""
+    for chave, atributos in session.info.pop(_EXPIRAR_KEY, {}).items():
+        instancia = session.identity_map.get(chave)
+        if instancia is not None:
+            session.expire(instancia, list(atributos))
+
+
+def _publicar_alteracoes(session):
+    confirmacao = session.info.pop(_CONFIRMACAO_KEY, None)
+    if not confirmacao:
+        return
+    engine = session.get_bind()
+    removidas = confirmacao['sugestoes_removidas']
+    alteradas = [
+        (tipo, item_id, nome)
+        for (tipo, item_id), nome in confirmacao['sugestoes_alteradas'].items()
+        if (tipo, item_id) not in removidas
+    ]
+    SuggestionService.aplicar_alteracoes(engine, alteradas, removidas)
+    if confirmacao['facetas']:
+        FacetService.marcar_desatualizado(engine)
+    if confirmacao['busca'] and has_app_context():
+        search_cache().limpar()
+
+
+def _descartar_pendencias(session, *args):
+    session.info.pop(_PENDENCIAS_KEY, None)
+    session.info.pop(_CONFIRMACAO_KEY, None)
+    session.info.pop(_EXPIRAR_KEY, None)
+
+
+def init_catalog_sync(app):
+    """Registra os listeners de sessao que mantem as estruturas derivadas do catalogo em dia."""
+    listeners = (
+        ('before_flush', _coletar_alteracoes),
+        ('after_flush', _aplicar_alteracoes),
+        ('after_flush_postexec', _expirar_agregados),
+        ('after_commit', _publicar_alteracoes),
+        ('after_soft_rollback', _descartar_pendencias),
+    )
+    for nome_evento, listener in listeners:
+        if not event.contains(db.session, nome_evento, listener):
+            event.listen(db.session, nome_evento, listener)
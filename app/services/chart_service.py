@@ -0,0 +1,339 @@
+import logging
+from datetime import datetime, timedelta
+from threading import Lock, Thread
+from time import monotonic
+from weakref import WeakKeyDictionary
+
+import sqlalchemy as sa
+from flask import current_app
+
+from app.extensions import db
+
+# Linhas por INSERT (limite de parametros por comando no Postgres).
+TAMANHO_LOTE = 1000
+
+logger = logging.getLogger(__name__)
+
+_estado_por_engine = WeakKeyDictionary()
+_estado_lock = Lock()
+# Um recalculo por vez no worker; as demais leituras seguem com as posicoes gravadas.
+_recalculo_lock = Lock()
+
+
+def _recalcular_em_segundo_plano(app, tenant_id, anterior_a):
+    try:
+        with app.app_context():
+            ChartService.recalcular(tenant_id, anterior_a=anterior_a)
+    except Exception:
+        logger.exception('Falha ao recalcular as paradas do tenant %s.', tenant_id)
+    finally:
+        _recalculo_lock.release()
+
+
+class ChartService:
+    """Paradas de musicas mais tocadas pre-calculadas por tenant, janela e genero.
+
+    As pontuacoes saem dos agregados de reproducao (`reproducoes_agregadas`):
+    na janela 'dia' cada hora das ultimas 24h vale metade a cada
+    CHARTS_HALF_LIFE_DAY_HOURS; na 'semana' cada dia dos ultimos 7 vale metade a
+    cada CHARTS_HALF_LIFE_WEEK_HOURS; 'sempre' soma todos os dias, sem
+    decaimento, mais as visualizacoes do catalogo anteriores ao log. Cada lista
+    guarda ate CHARTS_TOP_N posicoes em `paradas`; listas com menos musicas
+    tocadas sao completadas pelas visualizacoes do catalogo. A leitura so busca
+    as posicoes: passado CHARTS_REFRESH_SECONDS, uma thread do worker recalcula
+    a parada enquanto as leituras seguem com a anterior (`refresh-charts` faz o
+    mesmo fora das requisicoes, e e o unico caminho com CHARTS_REFRESH_ON_READ
+    desligado).
+    """
+
+    # janela -> (periodo dos agregados, alcance, configuracao da meia-vida em horas, meia-vida padrao)
+    JANELAS = {
+        'dia': ('hora', timedelta(hours=24), 'CHARTS_HALF_LIFE_DAY_HOURS', 6),
+        'semana': ('dia', timedelta(days=7), 'CHARTS_HALF_LIFE_WEEK_HOURS', 48),
+        'sempre': ('dia', None, None, None),
+    }
+    DURACAO_PERIODO = {'hora': timedelta(hours=1), 'dia': timedelta(days=1)}
+
+    @staticmethod
+    def top_n():
+        return int(current_app.config.get('CHARTS_TOP_N', 100))
+
+    @staticmethod
+    def _historico():
+        """SELECT (musica_id, genero, pontos) das visualizacoes anteriores ao log de reproducoes.
+
+        E o contador do catalogo menos o que os agregados diarios (de todos os
+        tenants) ja somam, para que a janela 'sempre' nao conte duas vezes.
+        """
+        from app.models import Album, Artist, Music, PlayRollup
+
+        musicas = Music.__table__
+        agregados = PlayRollup.__table__
+        registradas = (
+            sa.select(agregados.c.musica_id, sa.func.sum(agregados.c.total).label('total'))
+            .where(agregados.c.periodo == 'dia')
+            .group_by(agregados.c.musica_id)
+            .subquery()
+        )
+        anteriores = sa.func.coalesce(musicas.c.visualizacoes, 0) - sa.func.coalesce(registradas.c.total, 0)
+        return (
+            sa.select(musicas.c.id, Artist.__table__.c.genero, anteriores)
+            .select_from(
+                musicas.outerjoin(registradas, registradas.c.musica_id == musicas.c.id)
+                .outerjoin(Album.__table__, Album.__table__.c.id == musicas.c.album_id)
+                .outerjoin(Artist.__table__, Artist.__table__.c.id == Album.__table__.c.artista_id)
+            )
+            .where(anteriores > 0)
+        )
+
+    @classmethod
+    def _pontuacoes(cls, connection, tenant_id, janela, agora, limite):
+        """{genero: [(musica_id, pontuacao)]} com as `limite` melhores da janela; a chave '' junta todos os generos.
+
+        Soma, ordem e corte saem do banco (GROUP BY e row_number por genero).
+        O peso do decaimento so depende do inicio do periodo, entao vai como
+        CASE sobre os inicios presentes na janela (no maximo 24 horas ou 7 dias).
+        """
+        from app.models import Album, Artist, Music, PlayRollup
+
+        periodo, alcance, chave_meia_vida, meia_vida_padrao = cls.JANELAS[janela]
+        agregados = PlayRollup.__table__
+        filtros = [agregados.c.periodo == periodo, agregados.c.tenant_id == tenant_id]
+        if alcance is not None:
+            filtros.append(agregados.c.inicio > agora - alcance)
+
+        if chave_meia_vida is None:
+            pontos = agregados.c.total
+        else:
+            meia_vida = float(current_app.config.get(chave_meia_vida, meia_vida_padrao)) * 3600
+            meio_periodo = cls.DURACAO_PERIODO[periodo] / 2
+            inicios = connection.scalars(sa.select(agregados.c.inicio).where(*filtros).distinct()).all()
+            pesos = [
+                (agregados.c.inicio == inicio,
+                 0.5 ** (max((agora - inicio - meio_periodo).total_seconds(), 0) / meia_vida))
+                for inicio in inicios
+            ]
+            pontos = agregados.c.total * sa.case(*pesos, else_=0.0) if pesos else None
+
+        partes = []
+        if pontos is not None:
+            partes.append(
+                sa.select(agregados.c.musica_id, Artist.__table__.c.genero, pontos)
+                # JOIN em musicas: agregados de musicas removidas ficam ate a retencao, mas nao entram.
+                .select_from(
+                    agregados.join(Music.__table__, Music.__table__.c.id == agregados.c.musica_id)
+                    .outerjoin(Album.__table__, Album.__table__.c.id == Music.__table__.c.album_id)
+                    .outerjoin(Artist.__table__, Artist.__table__.c.id == Album.__table__.c.artista_id)
+                )
+                .where(*filtros)
+            )
+        if alcance is None:
+            partes.append(cls._historico())
+        if not partes:
+            return {}
+
+        linhas = sa.union_all(*partes).subquery('linhas') if len(partes) > 1 else partes[0].subquery('linhas')
+        musica_id, genero, valor = linhas.c
+        somadas = (
+            sa.select(musica_id.label('musica_id'), genero.label('genero'), sa.func.sum(valor).label('pontuacao'))
+            .group_by(musica_id, genero)
+            .subquery('somadas')
+        )
+        ordem = (somadas.c.pontuacao.desc(), somadas.c.musica_id)
+        classificadas = sa.select(
+            somadas.c.musica_id,
+            somadas.c.genero,
+            somadas.c.pontuacao,
+            sa.func.row_number().over(order_by=ordem).label('geral'),
+            sa.func.row_number().over(partition_by=somadas.c.genero, order_by=ordem).label('no_genero'),
+        ).subquery('classificadas')
+        consulta = sa.select(classificadas).where(
+            sa.or_(classificadas.c.geral <= limite, classificadas.c.no_genero <= limite)
+        )
+
+        posicoes = {}
+        for musica, genero_musica, pontuacao, geral, no_genero in connection.execute(consulta):
+            if geral <= limite:
+                posicoes.setdefault('', []).append((geral, musica, float(pontuacao)))
+            if genero_musica and no_genero <= limite:
+                posicoes.setdefault(genero_musica, []).append((no_genero, musica, float(pontuacao)))
+        return {
+            chave: [(musica, pontuacao) for _, musica, pontuacao in sorted(lista)]
+            for chave, lista in posicoes.items()
+        }
+
+    @classmethod
+    def _complementos(cls, connection, limite):
+        """{genero: [musica_id]} das mais vistas do catalogo, usadas para completar as paradas."""
+        from app.models import Album, Artist, Music
+
+        musicas = Music.__table__
+        ordem = (musicas.c.visualizacoes.desc(), musicas.c.id)
+        complementos = {
+            '': list(connection.scalars(sa.select(musicas.c.id).order_by(*ordem).limit(limite)))
+        }
+
+        genero = Artist.__table__.c.genero
+        posicao = sa.func.row_number().over(partition_by=genero, order_by=ordem).label('posicao')
+        por_genero = (
+            sa.select(musicas.c.id, genero, posicao)
+            .select_from(
+                musicas.join(Album.__table__, Album.__table__.c.id == musicas.c.album_id)
+                .join(Artist.__table__, Artist.__table__.c.id == Album.__table__.c.artista_id)
+            )
+            .where(genero.isnot(None), genero != '')
+            .subquery()
+        )
+        consulta = (
+            sa.select(por_genero.c.id, por_genero.c.genero)
+            .where(por_genero.c.posicao <= limite)
+            .order_by(por_genero.c.genero, por_genero.c.posicao)
+        )
+        for musica_id, genero_musica in connection.execute(consulta):
+            complementos.setdefault(genero_musica, []).append(musica_id)
+        return complementos
+
+    @staticmethod
+    def _lista(ordenadas, complemento, limite):
+        """Completa as `ordenadas` [(musica_id, pontuacao)] com o `complemento` ate `limite`."""
+        ordenadas = list(ordenadas)
+        vistas = {musica_id for musica_id, _ in ordenadas}
+        for musica_id in complemento:
+            if len(ordenadas) >= limite:
+                break
+            if musica_id not in vistas:
+                ordenadas.append((musica_id, 0.0))
+                vistas.add(musica_id)
+        return ordenadas
+
+    @classmethod
+    def recalcular(cls, tenant_id=None, anterior_a=None):
+        """Recalcula as paradas do tenant (ou de todos) em uma unica transacao.
+
+        Com `anterior_a`, so recalcula os tenants cuja parada foi calculada
+        antes desse instante (conferido depois da trava, para que workers
+        concorrentes nao repitam o trabalho). Retorna o numero de posicoes gravadas.
+        """
+        from app.models import ChartEntry, Tenant
+
+        agora = datetime.utcnow()
+        limite = cls.top_n()
+        paradas = ChartEntry.__table__
+        linhas = []
+        # Conexao propria: o recalculo nao pode confirmar a transacao da requisicao.
+        with db.engine.begin() as connection:
+            if tenant_id is None:
+                tenant_ids = list(connection.scalars(sa.select(Tenant.__table__.c.id)))
+            else:
+                tenant_ids = [tenant_id]
+            if connection.dialect.name == 'postgresql':
+                # Serializa recalculos concorrentes de workers diferentes.
+                for tenant in sorted(tenant_ids):
+                    connection.execute(
+                        sa.text("SELECT pg_advisory_xact_lock(hashtext('paradas'), :tenant)"), {'tenant': tenant}
+                    )
+            if anterior_a is not None:
+                ultimas = dict(connection.execute(
+                    sa.select(paradas.c.tenant_id, sa.func.max(paradas.c.calculado_em))
+                    .where(paradas.c.tenant_id.in_(tenant_ids))
+                    .group_by(paradas.c.tenant_id)
+                ).all())
+                tenant_ids = [
+                    tenant for tenant in tenant_ids if ultimas.get(tenant) is None or ultimas[tenant] < anterior_a
+                ]
+                if not tenant_ids:
+                    return 0
+
+            complementos = cls._complementos(connection, limite)
+            for tenant in tenant_ids:
+                for janela in ChartEntry.JANELAS:
+                    pontuacoes = cls._pontuacoes(connection, tenant, janela, agora, limite)
+                    for genero in sorted(set(pontuacoes) | set(complementos)):
+                        lista = cls._lista(pontuacoes.get(genero, ()), complementos.get(genero, ()), limite)
+                        linhas.extend(
+                            {
+                                'tenant_id': tenant,
+                                'janela': janela,
+                                'genero': genero,
+                                'posicao': posicao,
+                                'musica_id': musica_id,
+                                'pontuacao': pontos,
+                                'calculado_em': agora,
+                            }
+                            for posicao, (musica_id, pontos) in enumerate(lista, start=1)
+                        )
+
+            connection.execute(sa.delete(paradas).where(paradas.c.tenant_id.in_(tenant_ids)))
+            for inicio in range(0, len(linhas), TAMANHO_LOTE):
+                connection.execute(sa.insert(paradas), linhas[inicio:inicio + TAMANHO_LOTE])
+
+        proxima = monotonic() + float(current_app.config.get('CHARTS_REFRESH_SECONDS', 900))
+        with _estado_lock:
+            estado = _estado_por_engine.setdefault(db.engine, {})
+            for tenant in tenant_ids:
+                estado[tenant] = proxima
+        return len(linhas)
+
+    @classmethod
+    def _garantir_atualizada(cls, tenant_id):
+        """Diz se o tenant ja tem parada gravada; agenda o recalculo se ela passou de CHARTS_REFRESH_SECONDS.
+
+        Cada worker lembra ate quando a parada vale e so volta ao banco depois
+        disso. O recalculo nunca roda na requisicao: uma thread recalcula, uma
+        por vez, e a leitura segue com as posicoes gravadas (ou, antes do
+        primeiro calculo do tenant, com o catalogo). Com CHARTS_REFRESH_ON_READ
+        desligado so o `refresh-charts` agendado recalcula.
+        """
+        from app.models import ChartEntry
+
+        engine = db.engine
+        with _estado_lock:
+            proxima = _estado_por_engine.get(engine, {}).get(tenant_id)
+        if proxima is not None and monotonic() < proxima:
+            return True
+
+        intervalo = float(current_app.config.get('CHARTS_REFRESH_SECONDS', 900))
+        ultima = db.session.query(sa.func.max(ChartEntry.calculado_em)).filter(
+            ChartEntry.tenant_id == tenant_id
+        ).scalar()
+        agora = datetime.utcnow()
+        idade = (agora - ultima).total_seconds() if ultima is not None else None
+        if idade is not None and idade <= intervalo:
+            with _estado_lock:
+                _estado_por_engine.setdefault(engine, {})[tenant_id] = monotonic() + intervalo - idade
+            return True
+
+        if current_app.config.get('CHARTS_REFRESH_ON_READ', True) and _recalculo_lock.acquire(blocking=False):
+            try:
+                Thread(
+                    target=_recalcular_em_segundo_plano,
+                    args=(current_app._get_current_object(), tenant_id, agora - timedelta(seconds=intervalo)),
+                    name='paradas',
+                    daemon=True,
+                ).start()
+            except Exception:
+                _recalculo_lock.release()
+                raise
+        return ultima is not None
+
+    @classmethod
+    def consulta(cls, tenant_id, janela='sempre', genero=None):
+        """Query de Music nas posicoes da parada, em ordem (agenda o recalculo se vencida).
+
+        Retorna None enquanto o tenant nao tem parada calculada.
+        """
+        from app.models import ChartEntry, Music
+
+        if janela not in ChartEntry.JANELAS:
+            raise ValueError(f'Janela invalida: {janela}')
+        if not cls._garantir_atualizada(tenant_id):
+            return None
+        return (
+            Music.query.join(ChartEntry, ChartEntry.musica_id == Music.id)
+            .filter(
+                ChartEntry.tenant_id == tenant_id,
+                ChartEntry.janela == janela,
+                ChartEntry.genero == (genero or ''),
+            )
+            .order_by(ChartEntry.posicao)
+        )
@@ -0,0 +1,108 @@
+import json
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import Album, Artist, ArtistDiscography
+
+
+class DiscographyService:
+    """Discografia materializada por artista em `artista_discografias`.
+
+    A pagina do artista le uma unica linha. As escritas no catalogo apagam as
+    linhas afetadas no mesmo flush (`invalidar`) e a proxima leitura reconstroi;
+    DISCOGRAPHY_MAX_AGE_SECONDS limita a idade de uma linha gravada por uma
+    leitura concorrente com uma escrita.
+    """
+
+    @staticmethod
+    def _montar(artista_id):
+        artista = db.session.get(Artist, artista_id)
+        if not artista:
+            return None
+
+        albuns = [
+            {
+                'id': album.id,
+                'titulo': album.titulo,
+                'ano_lancamento': album.ano_lancamento,
+                'capa_url': album.capa_url,
+                'total_musicas': album.total_musicas,
+                'duracao_total': album.duracao_total,
+            }
+            for album in db.session.query(
+                Album.id,
+                Album.titulo,
+                Album.ano_lancamento,
+                Album.capa_url,
+                Album.total_musicas,
+                Album.duracao_total,
+            )
+            .filter(Album.artista_id == artista_id)
+            .order_by(Album.id)
+        ]
+        return {
+            'artista': {
+                'id': artista.id,
+                'nome': artista.nome,
+                'genero': artista.genero,
+                'bio': artista.bio,
+                'imagem_url': artista.imagem_url,
+                'total_albuns': len(albuns),
+                'total_musicas': sum(album['total_musicas'] for album in albuns),
+                'duracao_total': sum(album['duracao_total'] for album in albuns),
+            },
+            'albuns': albuns,
+        }
+
+    @classmethod
+    def obter(cls, artista_id):
+        """Retorna a discografia do artista (ou None se ele nao existe)."""
+        idade_maxima = int(current_app.config.get('DISCOGRAPHY_MAX_AGE_SECONDS', 3600))
+        linha = db.session.query(
+            ArtistDiscography.payload_json, ArtistDiscography.atualizado_em
+        ).filter(ArtistDiscography.artista_id == artista_id).first()
+        if linha and datetime.utcnow() - linha.atualizado_em < timedelta(seconds=idade_maxima):
+            return json.loads(linha.payload_json)
+
+        discografia = cls._montar(artista_id)
+        if discografia is None:
+            return None
+
+        tabela = ArtistDiscography.__table__
+        payload = json.dumps(discografia, ensure_ascii=False)
+        # Conexao propria: a leitura nao confirma a transacao da requisicao.
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(sa.delete(tabela).where(tabela.c.artista_id == artista_id))
+                connection.execute(
+                    sa.insert(tabela).values(
+                        artista_id=artista_id,
+                        payload_json=payload,
+                        atualizado_em=datetime.utcnow(),
+                    )
+                )
+        except IntegrityError:
+            # Outro worker gravou a mesma discografia ao mesmo tempo.
+            pass
+        return discografia
+
+    @staticmethod
+    def invalidar(connection, artista_ids=(), album_ids=()):
+        """Apaga as discografias dos artistas informados e dos donos dos albuns informados."""
+        tabela = ArtistDiscography.__table__
+        condicoes = []
+        if artista_ids:
+            condicoes.append(tabela.c.artista_id.in_(list(artista_ids)))
+        if album_ids:
+            albuns = Album.__table__
+            condicoes.append(
+                tabela.c.artista_id.in_(
+                    sa.select(albuns.c.artista_id).where(albuns.c.id.in_(list(album_ids)))
+                )
+            )
+        if condicoes:
+            connection.execute(sa.delete(tabela).where(sa.or_(*condicoes)))
@@ -0,0 +1,246 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from threading import Lock, Thread
+from time import monotonic
+from weakref import WeakKeyDictionary
+
+import sqlalchemy as sa
+from flask import current_app
+
+from app.extensions import db
+
+logger = logging.getLogger(__name__)
+
+_estado_por_engine = WeakKeyDictionary()
+_estado_lock = Lock()
+# Um recalculo por vez no worker; as leituras seguem com o cubo anterior.
+_recalculo_lock = Lock()
+
+
+def _recarregar_em_segundo_plano(app, engine):
+    try:
+        with app.app_context():
+            FacetService._recarregar(engine)
+    except Exception:
+        logger.exception('Falha ao recalcular o cubo de facetas.')
+    finally:
+        _recalculo_lock.release()
+
+
+class FacetService:
+    """Navegacao facetada do catalogo sobre contagens pre-calculadas.
+
+    `catalogo_facetas` guarda quantas musicas existem em cada combinacao
+    (genero, ano_lancamento, faixa_duracao). Cada worker mantem o cubo em
+    memoria e deriva dele as contagens de qualquer combinacao de filtros, sem
+    GROUP BY sobre o catalogo a cada requisicao. O cubo e recalculado em lote,
+    numa thread do worker com conexao propria, quando passa de
+    FACETS_REFRESH_SECONDS ou quando o catalogo muda neste worker (no maximo uma
+    vez por FACETS_REFRESH_SECONDS); enquanto isso as leituras seguem com o cubo
+    anterior. Um recalculo recente de outro worker e reaproveitado.
+    """
+
+    # (nome, minimo inclusivo, maximo exclusivo) em segundos.
+    FAIXAS_DURACAO = (
+        ('ate_3min', None, 180),
+        ('3_a_5min', 180, 300),
+        ('5_a_8min', 300, 480),
+        ('acima_8min', 480, None),
+    )
+    FACETAS = ('genero', 'ano_lancamento', 'duracao')
+
+    @classmethod
+    def _predicado_faixa(cls, coluna, nome):
+        for faixa, minimo, maximo in cls.FAIXAS_DURACAO:
+            if faixa == nome:
+                condicoes = []
+                if minimo is not None:
+                    condicoes.append(coluna >= minimo)
+                if maximo is not None:
+                    condicoes.append(coluna < maximo)
+                return sa.and_(*condicoes)
+        raise ValueError(f'Faixa de duracao invalida: {nome}')
+
+    @classmethod
+    def expressao_faixa_duracao(cls, coluna):
+        return sa.case(
+            *[(cls._predicado_faixa(coluna, faixa), faixa) for faixa, _, _ in cls.FAIXAS_DURACAO],
+            else_=None,
+        )
+
+    @classmethod
+    def filtrar(cls, query, filtros):
+        """Aplica filtros {'genero', 'ano_lancamento', 'duracao'} a uma query de Music."""
+        from app.models import Album, Artist, Music
+
+        if filtros.get('genero'):
+            query = query.filter(Artist.genero.in_(filtros['genero']))
+        if filtros.get('ano_lancamento'):
+            query = query.filter(Album.ano_lancamento.in_(filtros['ano_lancamento']))
+        if filtros.get('duracao'):
+            query = query.filter(
+                sa.or_(*[cls._predicado_faixa(Music.duracao, faixa) for faixa in filtros['duracao']])
+            )
+        return query
+
+    @classmethod
+    def recalcular(cls, anterior_a=None):
+        """Recalcula `catalogo_facetas` em uma unica transacao e retorna o numero de combinacoes.
+
+        Com `anterior_a`, so recalcula se o cubo gravado for mais antigo que
+        ele: outro worker pode ter recalculado enquanto este esperava o lock.
+        """
+        from app.models import Album, Artist, CatalogFacet, Music
+
+        tabela = CatalogFacet.__table__
+        # Conexao propria: o recalculo nao pode confirmar a transacao da requisicao.
+        with db.engine.begin() as connection:
+            if connection.dialect.name == 'postgresql':
+                # Serializa recalculos concorrentes de workers diferentes.
+                connection.execute(sa.text("SELECT pg_advisory_xact_lock(hashtext('catalogo_facetas'))"))
+
+            ultima = connection.scalar(sa.select(sa.func.max(tabela.c.atualizado_em)))
+            if anterior_a is None or ultima is None or ultima < anterior_a:
+                faixa = cls.expressao_faixa_duracao(Music.duracao)
+                origem = (
+                    sa.select(
+                        Artist.genero,
+                        Album.ano_lancamento,
+                        faixa,
+                        sa.func.count(Music.id),
+                        sa.literal(datetime.utcnow(), sa.DateTime()),
+                    )
+                    .select_from(Music)
+                    .join(Album, Album.id == Music.album_id)
+                    .join(Artist, Artist.id == Album.artista_id)
+                    .group_by(Artist.genero, Album.ano_lancamento, faixa)
+                )
+                connection.execute(sa.delete(tabela))
+                connection.execute(
+                    sa.insert(tabela).from_select(
+                        ['genero', 'ano_lancamento', 'faixa_duracao', 'total_musicas', 'atualizado_em'],
+                        origem,
+                    )
+                )
+            return connection.scalar(sa.select(sa.func.count(tabela.c.id)))
+
+    @staticmethod
+    def marcar_desatualizado(engine):
+        """Sinaliza que o catalogo mudou; o cubo e recalculado assim que o intervalo permitir."""
+        with _estado_lock:
+            estado = _estado_por_engine.get(engine)
+            if estado:
+                estado['desatualizado_em'] = datetime.utcnow()
+
+    @classmethod
+    def _recarregar(cls, engine):
+        """Recalcula o cubo se preciso e o carrega na memoria do worker (com `_recalculo_lock`)."""
+        from app.models import CatalogFacet
+
+        intervalo = float(current_app.config.get('FACETS_REFRESH_SECONDS', 300))
+        with _estado_lock:
+            estado = _estado_por_engine.get(engine)
+        marcado_em = estado['desatualizado_em'] if estado else None
+        recalculado_em = estado['recalculado_em'] if estado else monotonic()
+
+        tabela = CatalogFacet.__table__
+        if marcado_em:
+            cls.recalcular(anterior_a=marcado_em)
+            recalculado_em = monotonic()
+        else:
+            with engine.connect() as connection:
+                ultima = connection.scalar(sa.select(sa.func.max(tabela.c.atualizado_em)))
+            limite = datetime.utcnow() - timedelta(seconds=intervalo)
+            if ultima is None or ultima < limite:
+                cls.recalcular(anterior_a=limite)
+                recalculado_em = monotonic()
+
+        with engine.connect() as connection:
+            cubo = [
+                tuple(linha)
+                for linha in connection.execute(
+                    sa.select(tabela.c.genero, tabela.c.ano_lancamento, tabela.c.faixa_duracao, tabela.c.total_musicas)
+                )
+            ]
+        with _estado_lock:
+            atual = _estado_por_engine.get(engine)
+            # Alteracoes marcadas durante o recalculo ficam para o proximo.
+            pendente = atual['desatualizado_em'] if atual and atual['desatualizado_em'] != marcado_em else None
+            _estado_por_engine[engine] = {
+                'cubo': cubo,
+                'carregado_em': monotonic(),
+                'recalculado_em': recalculado_em,
+                'desatualizado_em': pendente,
+            }
+        return cubo
+
+    @classmethod
+    def _cubo(cls):
+        """Cubo do worker; agenda o recarregamento quando ele vence ou o catalogo muda.
+
+        So a primeira carga do worker espera. Depois disso uma thread recalcula
+        por vez e as leituras seguem com o cubo anterior; alteracoes do catalogo
+        disparam no maximo um recalculo por FACETS_REFRESH_SECONDS.
+        """
+        engine = db.engine
+        with _estado_lock:
+            estado = _estado_por_engine.get(engine)
+        if estado is None:
+            with _recalculo_lock:
+                with _estado_lock:
+                    estado = _estado_por_engine.get(engine)
+                if estado is None:
+                    return cls._recarregar(engine)
+            return estado['cubo']
+
+        intervalo = float(current_app.config.get('FACETS_REFRESH_SECONDS', 300))
+        agora = monotonic()
+        vencido = agora - estado['carregado_em'] >= intervalo
+        alterado = estado['desatualizado_em'] is not None and agora - estado['recalculado_em'] >= intervalo
+        if (vencido or alterado) and _recalculo_lock.acquire(blocking=False):
+            try:
+                Thread(
+                    target=_recarregar_em_segundo_plano,
+                    args=(current_app._get_current_object(), engine),
+                    name='facetas',
+                    daemon=True,
+                ).start()
+            except Exception:
+                _recalculo_lock.release()
+                raise
+        return estado['cubo']
+
+    @classmethod
+    def contagens(cls, filtros):
+        """Retorna (total filtrado, contagens por faceta).
+
+        A contagem de cada faceta aplica os filtros das demais, para que o
+        usuario veja quantas musicas teria ao trocar ou somar valores dela.
+        """
+        cubo = cls._cubo()
+        selecionados = [set(filtros.get(faceta) or ()) for faceta in cls.FACETAS]
+
+        def casa(linha, ignorar=None):
+            return all(
+                not selecionados[i] or linha[i] in selecionados[i]
+                for i in range(len(cls.FACETAS))
+                if i != ignorar
+            )
+
+        total = sum(linha[3] for linha in cubo if casa(linha))
+        facetas = {}
+        for i, faceta in enumerate(cls.FACETAS):
+            por_valor = defaultdict(int)
+            for linha in cubo:
+                if linha[i] is not None and casa(linha, ignorar=i):
+                    por_valor[linha[i]] += linha[3]
+            if faceta == 'duracao':
+                ordem = [faixa for faixa, _, _ in cls.FAIXAS_DURACAO if faixa in por_valor]
+            else:
+                ordem = sorted(por_valor)
+            facetas[faceta] = [
+                {'valor': valor, 'total': por_valor[valor], 'selecionado': valor in selecionados[i]}
+                for valor in ordem
+            ]
+        return total, facetas
@@ -0,0 +1,101 @@
+from flask import current_app, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+from app.services.negociacao import MIMETYPE_MSGPACK, empacotar, responder_msgpack
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # orjson e opcional; sem ele vale o json da stdlib.
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Provider JSON do Flask que usa orjson quando instalado.
+
+    A saida segue a do provider padrao (chaves ordenadas, datas em formato
+    HTTP via `default`); so a indentacao de debug e chamadas com argumentos
+    extras do `json.dumps` caem na implementacao da stdlib.
+
+    Em requisicoes da API que pediram `Accept: application/msgpack`,
+    `jsonify` responde em msgpack com o mesmo `default` de conversao.
+    """
+
+    def _opcoes(self):
+        opcoes = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            opcoes |= orjson.OPT_SORT_KEYS
+        return opcoes
+
+    def _indentado(self):
+        return self.compact is False or (self.compact is None and self._app.debug)
+
+    def dumps_bytes(self, obj):
+        """Serializa direto para bytes UTF-8, sem a volta por str."""
+        if orjson is None:
+            return self.dumps(obj).encode('utf-8')
+        return orjson.dumps(obj, default=self.default, option=self._opcoes())
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if responder_msgpack():
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(empacotar(obj, self.default), mimetype=MIMETYPE_MSGPACK)
+        if orjson is None or self._indentado():
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+def resposta_em_fluxo(resultado, chave='musicas'):
+    """Resposta JSON que codifica `resultado[chave]` (um iteravel) item a item.
+
+    As demais chaves vao no fim do objeto; os itens saem em blocos de
+    API_STREAM_CHUNK_ITEMS, sem montar a lista inteira em memoria. Em msgpack
+    (que precisa do tamanho da lista no cabecalho) a lista e montada e enviada
+    de uma vez.
+
+    O status 200 ja foi enviado quando os itens sao lidos: um erro no meio da
+    leitura e registrado no log e o documento fecha com os itens ja enviados,
+    `success: false` e `incompleto: true`, ainda como JSON valido.
+    """
+    provider = current_app.json
+    if responder_msgpack():
+        return provider.response({**resultado, chave: list(resultado[chave])})
+    itens = resultado[chave]
+    demais = {k: v for k, v in resultado.items() if k != chave}
+    tamanho_bloco = max(int(current_app.config.get('API_STREAM_CHUNK_ITEMS', 100)), 1)
+
+    def gerar():
+        bloco = [b'{' + provider.dumps_bytes(chave) + b':[']
+        separador = b''
+        final = demais
+        try:
+            for item in itens:
+                bloco.append(separador + provider.dumps_bytes(item))
+                separador = b','
+                if len(bloco) >= tamanho_bloco:
+                    yield b''.join(bloco)
+                    bloco = []
+        except Exception:
+            current_app.logger.exception('Erro ao transmitir a lista %r em fluxo', chave)
+            final = {
+                **demais,
+                'success': False,
+                'message': 'Erro ao ler a lista; resposta incompleta',
+                'incompleto': True,
+            }
+        restante = provider.dumps_bytes(final)
+        bloco.append(b']}' if restante == b'{}' else b'],' + restante[1:])
+        bloco.append(b'\n')
+        yield b''.join(bloco)
+
+    return current_app.response_class(stream_with_context(gerar()), mimetype=provider.mimetype)
@@ -0,0 +1,48 @@
+from flask import g, has_request_context, request
+
+try:
+    import msgpack  # type: ignore
+except ImportError:  # msgpack e opcional; sem ele a API responde so JSON.
+    msgpack = None
+
+MIMETYPE_MSGPACK = 'application/msgpack'
+MIMETYPES_MSGPACK = (MIMETYPE_MSGPACK, 'application/x-msgpack')
+
+
+def prefere_msgpack():
+    """True quando o `Accept` da requisicao prefere msgpack a JSON.
+
+    Sem `Accept`, com `*/*` ou empate de qualidade vale JSON; sem o pacote
+    msgpack instalado a resposta tambem continua em JSON.
+    """
+    if msgpack is None:
+        return False
+    aceitos = request.accept_mimetypes
+    melhor = aceitos.best_match(('application/json',) + MIMETYPES_MSGPACK)
+    return melhor in MIMETYPES_MSGPACK
+
+
+def responder_msgpack():
+    """Marcado por requisicao em `g` (ver `api_bp.before_request`)."""
+    return has_request_context() and g.get('responder_msgpack', False)
+
+
+def empacotar(obj, default=None):
+    return msgpack.packb(obj, default=default, use_bin_type=True)
+
+
+def dados_requisicao():
+    """Corpo da requisicao como dict, em JSON ou msgpack conforme o Content-Type.
+
+    Mesmo contrato de `request.get_json(silent=True) or {}`: corpo ausente,
+    invalido ou que nao seja um objeto vira `{}`.
+    """
+    if request.mimetype not in MIMETYPES_MSGPACK:
+        return request.get_json(silent=True) or {}
+    if msgpack is None:
+        return {}
+    try:
+        dados = msgpack.unpackb(request.get_data(cache=True), raw=False)
+    except (ValueError, TypeError, msgpack.UnpackException):
+        return {}
+    return dados if isinstance(dados, dict) else {}
@@ -0,0 +1,63 @@
+import operator
+
+import sqlalchemy as sa
+from flask import current_app
+
+from app.extensions import db
+from app.services.write_behind import WriteBehindBuffer
+
+
+class PlayCounter:
+    """Contador de reproducoes com escrita em lote (write-behind).
+
+    Cada reproducao so soma 1 em memoria no worker; o lote e gravado com um
+    UPDATE atomico `visualizacoes = visualizacoes + n` por musica, por uma
+    thread do worker a cada PLAY_COUNTER_FLUSH_SECONDS, na requisicao que
+    completa PLAY_COUNTER_MAX_PENDING musicas distintas e no encerramento do
+    processo. Um worker morto perde o que acumulou desde o ultimo lote gravado.
+    """
+
+    @staticmethod
+    def buffer(app=None):
+        app = app or current_app._get_current_object()
+        return app.extensions['play_counter']
+
+    @classmethod
+    def registrar(cls, musica_id, quantidade=1):
+        cls.buffer().adicionar(musica_id, quantidade)
+
+    @classmethod
+    def pendentes(cls, musica_id):
+        """Reproducoes deste worker ainda nao gravadas para a musica."""
+        return cls.buffer().pendente(musica_id, 0)
+
+    @staticmethod
+    def _gravar(pendentes):
+        from app.models import Music
+
+        musicas = Music.__table__
+        stmt = (
+            sa.update(musicas)
+            .where(musicas.c.id == sa.bindparam('b_id'))
+            .values(visualizacoes=sa.func.coalesce(musicas.c.visualizacoes, 0) + sa.bindparam('b_quantidade'))
+        )
+        # Conexao propria: o lote nao pode confirmar a transacao da requisicao.
+        # Ordenado por id para travar as linhas sempre na mesma ordem entre workers.
+        with db.engine.begin() as connection:
+            connection.execute(
+                stmt,
+                [{'b_id': musica_id, 'b_quantidade': quantidade} for musica_id, quantidade in sorted(pendentes.items())],
+            )
+
+
+def init_play_counter(app):
+    """Cria o buffer de reproducoes do worker e grava o restante no encerramento."""
+    buffer = WriteBehindBuffer(
+        PlayCounter._gravar,
+        operator.add,
+        intervalo_segundos=app.config.get('PLAY_COUNTER_FLUSH_SECONDS', 10),
+        max_pendentes=app.config.get('PLAY_COUNTER_MAX_PENDING', 1000),
+    )
+    app.extensions['play_counter'] = buffer
+    buffer.iniciar_descarga_periodica(app)
+    buffer.registrar_descarga_na_saida(app)
@@ -0,0 +1,216 @@
+import operator
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from flask import current_app
+
+from app.extensions import db
+from app.models import Music, PlayEvent, PlayRollup
+from app.services.write_behind import WriteBehindBuffer
+
+# Linhas por INSERT/upsert (limite de parametros por comando no Postgres).
+TAMANHO_LOTE = 1000
+
+
+def _inicio_periodo(quando, periodo):
+    if periodo == 'hora':
+        return quando.replace(minute=0, second=0, microsecond=0)
+    return quando.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _em_lotes(linhas):
+    for inicio in range(0, len(linhas), TAMANHO_LOTE):
+        yield linhas[inicio:inicio + TAMANHO_LOTE]
+
+
+class PlayEvents:
+    """Log de reproducoes (`reproducoes`) e agregados por hora/dia (`reproducoes_agregadas`).
+
+    As reproducoes ficam em memoria por worker, juntadas por (musica, usuario,
+    tenant, segundo), e cada lote grava na mesma transacao os eventos e a soma
+    deles nos agregados de hora e de dia. Relatorios e graficos leem so os
+    agregados. A retencao (eventos alem de PLAY_EVENTS_RETENTION_DAYS e
+    agregados por hora alem de PLAY_HOURLY_RETENTION_DAYS; os diarios ficam) so
+    roda em `reconstruir_agregados` (`flask rollup-plays`), fora das requisicoes.
+    """
+
+    @staticmethod
+    def buffer(app=None):
+        app = app or current_app._get_current_object()
+        return app.extensions['play_events']
+
+    @classmethod
+    def registrar(cls, musica_id, usuario_id, tenant_id, quando=None):
+        quando = (quando or datetime.utcnow()).replace(microsecond=0)
+        cls.buffer().adicionar((musica_id, usuario_id, tenant_id, quando), 1)
+
+    @staticmethod
+    def _upsert_agregados(linhas, somar=True):
+        dialeto = db.engine.dialect.name
+        if dialeto == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialeto == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise RuntimeError(f'Upsert de reproducoes agregadas nao suportado em {dialeto}')
+
+        tabela = PlayRollup.__table__
+        stmt = insert(tabela).values(linhas)
+        return stmt.on_conflict_do_update(
+            index_elements=['periodo', 'inicio', 'tenant_id', 'musica_id'],
+            set_={'total': tabela.c.total + stmt.excluded.total if somar else stmt.excluded.total},
+        )
+
+    @staticmethod
+    def _agregar(eventos):
+        """[(musica_id, tenant_id, quando, quantidade)] -> linhas de PlayRollup, uma por periodo."""
+        totais = {}
+        for musica_id, tenant_id, quando, quantidade in eventos:
+            for periodo in PlayRollup.PERIODOS:
+                chave = (periodo, _inicio_periodo(quando, periodo), tenant_id, musica_id)
+                totais[chave] = totais.get(chave, 0) + quantidade
+        return [
+            {'periodo': periodo, 'inicio': inicio, 'tenant_id': tenant_id, 'musica_id': musica_id, 'total': total}
+            for (periodo, inicio, tenant_id, musica_id), total in totais.items()
+        ]
+
+    @staticmethod
+    def _travar(connection, exclusivo=False):
+        """Lotes travam em modo compartilhado e a reconstrucao em exclusivo (Postgres)."""
+        if connection.dialect.name == 'postgresql':
+            funcao = 'pg_advisory_xact_lock' if exclusivo else 'pg_advisory_xact_lock_shared'
+            connection.execute(sa.text(f"SELECT {funcao}(hashtext('reproducoes'))"))
+
+    @staticmethod
+    def _aplicar_retencao(connection):
+        agora = datetime.utcnow()
+        dias_eventos = int(current_app.config.get('PLAY_EVENTS_RETENTION_DAYS', 14))
+        dias_hora = int(current_app.config.get('PLAY_HOURLY_RETENTION_DAYS', 30))
+        eventos = PlayEvent.__table__
+        agregados = PlayRollup.__table__
+        connection.execute(sa.delete(eventos).where(eventos.c.tocado_em < agora - timedelta(days=dias_eventos)))
+        connection.execute(
+            sa.delete(agregados).where(
+                agregados.c.periodo == 'hora',
+                agregados.c.inicio < agora - timedelta(days=dias_hora),
+            )
+        )
+
+    @classmethod
+    def _gravar(cls, pendentes):
+        musica_ids = {musica_id for musica_id, _, _, _ in pendentes}
+        # Conexao propria: o lote nao pode confirmar a transacao da requisicao.
+        with db.engine.begin() as connection:
+            cls._travar(connection)
+            # Musicas removidas desde a reproducao nao podem travar o lote por FK.
+            existentes = set(
+                connection.scalars(sa.select(Music.__table__.c.id).where(Music.__table__.c.id.in_(musica_ids)))
+            )
+            eventos = [
+                {
+                    'musica_id': musica_id,
+                    'usuario_id': usuario_id,
+                    'tenant_id': tenant_id,
+                    'tocado_em': quando,
+                    'quantidade': quantidade,
+                }
+                for (musica_id, usuario_id, tenant_id, quando), quantidade in pendentes.items()
+                if musica_id in existentes
+            ]
+            if eventos:
+                for lote in _em_lotes(eventos):
+                    connection.execute(sa.insert(PlayEvent.__table__), lote)
+                agregados = cls._agregar(
+                    (e['musica_id'], e['tenant_id'], e['tocado_em'], e['quantidade']) for e in eventos
+                )
+                for lote in _em_lotes(agregados):
+                    connection.execute(cls._upsert_agregados(lote))
+
+    @staticmethod
+    def _expressao_inicio(coluna, periodo):
+        if db.engine.dialect.name == 'postgresql':
+            return sa.func.date_trunc('hour' if periodo == 'hora' else 'day', coluna)
+        return sa.func.strftime('%Y-%m-%d %H:00:00' if periodo == 'hora' else '%Y-%m-%d 00:00:00', coluna)
+
+    @classmethod
+    def reconstruir_agregados(cls, horas=48):
+        """Refaz os agregados a partir dos eventos das ultimas `horas` e aplica a retencao.
+
+        A janela comeca no inicio do dia e nunca antes do primeiro dia completo
+        ainda coberto pelos eventos retidos. Retorna o numero de linhas gravadas.
+        """
+        agora = datetime.utcnow()
+        retencao = int(current_app.config.get('PLAY_EVENTS_RETENTION_DAYS', 14))
+        desde = _inicio_periodo(agora - timedelta(hours=horas), 'dia')
+        desde = max(desde, _inicio_periodo(agora - timedelta(days=retencao), 'dia') + timedelta(days=1))
+
+        eventos = PlayEvent.__table__
+        agregados = PlayRollup.__table__
+        linhas = []
+        with db.engine.begin() as connection:
+            # Nenhum lote pode confirmar entre a leitura dos eventos e a troca dos agregados:
+            # no Postgres a trava exclusiva espera os lotes em andamento; no SQLite o DELETE
+            # abre a transacao de escrita antes da leitura e bloqueia os outros escritores.
+            cls._travar(connection, exclusivo=True)
+            connection.execute(sa.delete(agregados).where(agregados.c.inicio >= desde))
+            for periodo in PlayRollup.PERIODOS:
+                inicio = cls._expressao_inicio(eventos.c.tocado_em, periodo)
+                consulta = (
+                    sa.select(inicio, eventos.c.tenant_id, eventos.c.musica_id, sa.func.sum(eventos.c.quantidade))
+                    .where(eventos.c.tocado_em >= desde)
+                    .group_by(inicio, eventos.c.tenant_id, eventos.c.musica_id)
+                )
+                for bucket, tenant_id, musica_id, total in connection.execute(consulta):
+                    if isinstance(bucket, str):
+                        bucket = datetime.fromisoformat(bucket)
+                    linhas.append({
+                        'periodo': periodo,
+                        'inicio': bucket,
+                        'tenant_id': tenant_id,
+                        'musica_id': musica_id,
+                        'total': int(total),
+                    })
+
+            for lote in _em_lotes(linhas):
+                connection.execute(cls._upsert_agregados(lote, somar=False))
+            cls._aplicar_retencao(connection)
+        return len(linhas)
+
+    @staticmethod
+    def mais_tocadas(tenant_id, dias=7, limite=20):
+        """[(musica_id, total)] das musicas mais tocadas no tenant nos ultimos `dias` (agregados diarios)."""
+        desde = _inicio_periodo(datetime.utcnow() - timedelta(days=dias - 1), 'dia')
+        total = sa.func.sum(PlayRollup.total)
+        consulta = (
+            db.session.query(PlayRollup.musica_id, total)
+            .filter(PlayRollup.periodo == 'dia', PlayRollup.tenant_id == tenant_id, PlayRollup.inicio >= desde)
+            .group_by(PlayRollup.musica_id)
+            .order_by(total.desc(), PlayRollup.musica_id)
+            .limit(limite)
+        )
+        return [(musica_id, int(soma)) for musica_id, soma in consulta]
+
+    @staticmethod
+    def serie(musica_id, tenant_id, periodo='dia', desde=None):
+        """[(inicio, total)] da musica no tenant, em ordem de tempo."""
+        consulta = db.session.query(PlayRollup.inicio, PlayRollup.total).filter(
+            PlayRollup.periodo == periodo,
+            PlayRollup.tenant_id == tenant_id,
+            PlayRollup.musica_id == musica_id,
+        )
+        if desde is not None:
+            consulta = consulta.filter(PlayRollup.inicio >= desde)
+        return [tuple(linha) for linha in consulta.order_by(PlayRollup.inicio)]
+
+
+def init_play_events(app):
+    """Cria o buffer de eventos de reproducao do worker e grava o restante no encerramento."""
+    buffer = WriteBehindBuffer(
+        PlayEvents._gravar,
+        operator.add,
+        intervalo_segundos=app.config.get('PLAY_EVENTS_FLUSH_SECONDS', 30),
+        max_pendentes=app.config.get('PLAY_EVENTS_MAX_PENDING', 2000),
+    )
+    app.extensions['play_events'] = buffer
+    buffer.iniciar_descarga_periodica(app)
+    buffer.registrar_descarga_na_saida(app)
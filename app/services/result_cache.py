@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from flask import current_app
+
+
+class TTLCache:
+    """Cache LRU limitado em memoria com expiracao por entrada e contadores de acerto."""
+
+    def __init__(self, max_entradas=512, ttl_segundos=60.0):
+        self.max_entradas = max(int(max_entradas), 0)
+        self.ttl_segundos = float(ttl_segundos)
+        self._entradas = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def obter(self, chave):
+        """Retorna o valor guardado ou None (expiradas contam como miss)."""
+        agora = monotonic()
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None or entrada[0] <= agora:
+                if entrada is not None:
+                    del self._entradas[chave]
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.hits += 1
+            return entrada[1]
+
+    def guardar(self, chave, valor):
+        if not self.max_entradas or self.ttl_segundos <= 0:
+            return
+        with self._lock:
+            self._entradas[chave] = (monotonic() + self.ttl_segundos, valor)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'taxa_acerto': round(self.hits / consultas, 4) if consultas else 0.0,
+                'entradas': len(self._entradas),
+                'max_entradas': self.max_entradas,
+                'ttl_segundos': self.ttl_segundos,
+            }
+
+
+def search_cache(app=None):
+    """Cache de resultados de busca da aplicacao (um por worker)."""
+    app = app or current_app._get_current_object()
+    cache = app.extensions.get('search_cache')
+    if cache is None:
+        cache = app.extensions.setdefault(
+            'search_cache',
+            TTLCache(
+                max_entradas=app.config.get('SEARCH_CACHE_MAX_ENTRIES', 512),
+                ttl_segundos=app.config.get('SEARCH_CACHE_TTL_SECONDS', 60),
+            ),
+        )
+    return cache
@@ -0,0 +1,168 @@
+import logging
+import os
+from datetime import date, datetime, timedelta
+from threading import Thread
+
+import sqlalchemy as sa
+from flask import current_app
+
+from app.extensions import db
+from app.models import SearchQueryStat
+from app.services.search_service import normalizar_texto
+from app.services.write_behind import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+
+def _combinar(atual, novo):
+    buscas, sem_resultado, resultados, latencia, max_latencia, ultima = atual
+    return (
+        buscas + novo[0],
+        sem_resultado + novo[1],
+        resultados + novo[2],
+        latencia + novo[3],
+        max(max_latencia, novo[4]),
+        max(ultima, novo[5]),
+    )
+
+
+class SearchAnalytics:
+    """Agregado diario das buscas (termo normalizado, resultados e latencia).
+
+    As buscas sao acumuladas em memoria por worker e gravadas em lote com
+    upsert em `busca_estatisticas`; nenhuma requisicao faz INSERT proprio.
+    """
+
+    @staticmethod
+    def buffer(app=None):
+        app = app or current_app._get_current_object()
+        return app.extensions['search_analytics']
+
+    @classmethod
+    def registrar(cls, termo, total_resultados, latencia_ms):
+        termo = normalizar_texto(termo)[:150]
+        if not termo:
+            return
+        total_resultados = total_resultados or 0
+        cls.buffer().adicionar(
+            (termo, date.today()),
+            (1, 0 if total_resultados else 1, total_resultados, latencia_ms, latencia_ms, datetime.utcnow()),
+        )
+
+    @staticmethod
+    def _upsert(tabela, linhas):
+        dialeto = db.engine.dialect.name
+        if dialeto == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialeto == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise RuntimeError(f'Upsert de estatisticas de busca nao suportado em {dialeto}')
+
+        stmt = insert(tabela).values(linhas)
+        novo = stmt.excluded
+        return stmt.on_conflict_do_update(
+            index_elements=['termo', 'dia'],
+            set_={
+                'total_buscas': tabela.c.total_buscas + novo.total_buscas,
+                'total_sem_resultado': tabela.c.total_sem_resultado + novo.total_sem_resultado,
+                'soma_resultados': tabela.c.soma_resultados + novo.soma_resultados,
+                'soma_latencia_ms': tabela.c.soma_latencia_ms + novo.soma_latencia_ms,
+                'max_latencia_ms': sa.case(
+                    (novo.max_latencia_ms > tabela.c.max_latencia_ms, novo.max_latencia_ms),
+                    else_=tabela.c.max_latencia_ms,
+                ),
+                'ultima_busca_em': novo.ultima_busca_em,
+            },
+        )
+
+    @classmethod
+    def _gravar(cls, pendentes):
+        tabela = SearchQueryStat.__table__
+        linhas = [
+            {
+                'termo': termo,
+                'dia': dia,
+                'total_buscas': valores[0],
+                'total_sem_resultado': valores[1],
+                'soma_resultados': valores[2],
+                'soma_latencia_ms': valores[3],
+                'max_latencia_ms': valores[4],
+                'ultima_busca_em': valores[5],
+            }
+            for (termo, dia), valores in pendentes.items()
+        ]
+        # Conexao propria: o lote nao pode confirmar a transacao da requisicao.
+        with db.engine.begin() as connection:
+            connection.execute(cls._upsert(tabela, linhas))
+            retencao = int(current_app.config.get('SEARCH_ANALYTICS_RETENTION_DAYS', 90))
+            connection.execute(sa.delete(tabela).where(tabela.c.dia < date.today() - timedelta(days=retencao)))
+
+    @staticmethod
+    def _consulta_periodo(dias):
+        buscas = sa.func.sum(SearchQueryStat.total_buscas)
+        return (
+            db.session.query(
+                SearchQueryStat.termo,
+                buscas.label('buscas'),
+                sa.func.sum(SearchQueryStat.total_sem_resultado).label('sem_resultado'),
+                (sa.cast(sa.func.sum(SearchQueryStat.soma_resultados), sa.Float) / buscas).label('media_resultados'),
+                (sa.func.sum(SearchQueryStat.soma_latencia_ms) / buscas).label('media_latencia_ms'),
+            )
+            .filter(SearchQueryStat.dia >= date.today() - timedelta(days=dias))
+            .group_by(SearchQueryStat.termo)
+        )
+
+    @classmethod
+    def top_termos(cls, dias=7, limite=20):
+        """Termos mais buscados no periodo, com medias de resultados e latencia."""
+        consulta = cls._consulta_periodo(dias).order_by(sa.desc('buscas'), SearchQueryStat.termo)
+        return [linha._asdict() for linha in consulta.limit(limite)]
+
+    @classmethod
+    def termos_sem_resultado(cls, dias=7, limite=20):
+        """Termos que mais vezes voltaram sem nenhum resultado no periodo."""
+        consulta = (
+            cls._consulta_periodo(dias)
+            .having(sa.func.sum(SearchQueryStat.total_sem_resultado) > 0)
+            .order_by(sa.desc('sem_resultado'), SearchQueryStat.termo)
+        )
+        return [linha._asdict() for linha in consulta.limit(limite)]
+
+    @classmethod
+    def termos_para_aquecimento(cls, limite=20, dias=7):
+        """Termos mais buscados que retornaram resultados, para pre-aquecer o cache."""
+        consulta = (
+            cls._consulta_periodo(dias)
+            .having(sa.func.sum(SearchQueryStat.soma_resultados) > 0)
+            .order_by(sa.desc('buscas'), SearchQueryStat.termo)
+        )
+        return [linha.termo for linha in consulta.limit(limite)]
+
+
+def _aquecer_em_segundo_plano(app):
+    from app.controllers.music_controller import MusicController
+
+    try:
+        with app.app_context():
+            termos = MusicController.aquecer_cache_busca(app.config.get('SEARCH_WARMUP_TOP_QUERIES', 20))
+            app.logger.info('Cache de busca aquecido com %s termo(s).', len(termos))
+    except Exception:
+        logger.exception('Falha ao aquecer o cache de busca.')
+
+
+def init_search_analytics(app):
+    """Cria o buffer de estatisticas do worker e, se configurado, aquece o cache de busca."""
+    buffer = WriteBehindBuffer(
+        SearchAnalytics._gravar,
+        _combinar,
+        intervalo_segundos=app.config.get('SEARCH_ANALYTICS_FLUSH_SECONDS', 30),
+        max_pendentes=app.config.get('SEARCH_ANALYTICS_MAX_PENDING', 500),
+    )
+    app.extensions['search_analytics'] = buffer
+    buffer.iniciar_descarga_periodica(app)
+    buffer.registrar_descarga_na_saida(app)
+
+    # Comandos `flask ...` (migrations, CLI) nao servem requisicoes: nao aquecem.
+    if app.config.get('SEARCH_WARMUP_ON_START') and os.environ.get('FLASK_RUN_FROM_CLI') != 'true':
+        Thread(target=_aquecer_em_segundo_plano, args=(app,), daemon=True, name='search-warmup').start()
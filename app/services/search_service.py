@@ -0,0 +1,438 @@
+import re
+import unicodedata
+from threading import Lock
+from weakref import WeakKeyDictionary
+
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+
+from app.extensions import db
+
+_TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+_fts_sqlite_por_engine = WeakKeyDictionary()
+_indices_trigramas = WeakKeyDictionary()
+_indices_trigramas_lock = Lock()
+
+# Filtro usado na sincronizacao incremental: uma musica entra no lote quando
+# ela, o album dela ou o artista do album foram alterados.
+_FILTRO_INCREMENTAL = (
+    'musicas.id IN :musica_ids OR albuns.id IN :album_ids OR artistas.id IN :artista_ids'
+)
+
+_SQL_SINCRONIZAR_POSTGRES = """
+    UPDATE musicas SET busca_documento =
+        setweight(to_tsvector(CAST(:config AS regconfig), coalesce(musicas.titulo_normalizado, '')), 'A') ||
+        setweight(to_tsvector(CAST(:config AS regconfig), coalesce(albuns.titulo_normalizado, '')), 'B') ||
+        setweight(to_tsvector(CAST(:config AS regconfig), coalesce(artistas.nome_normalizado, '')), 'B')
+    FROM albuns JOIN artistas ON artistas.id = albuns.artista_id
+    WHERE albuns.id = musicas.album_id AND ({filtro})
+"""
+
+_SQL_REMOVER_SQLITE = """
+    DELETE FROM musicas_fts WHERE rowid IN (
+        SELECT musicas.id FROM musicas
+        JOIN albuns ON albuns.id = musicas.album_id
+        JOIN artistas ON artistas.id = albuns.artista_id
+        WHERE {filtro}
+    )
+"""
+
+_SQL_INSERIR_SQLITE = """
+    INSERT INTO musicas_fts (rowid, titulo, album, artista)
+    SELECT musicas.id, musicas.titulo_normalizado, albuns.titulo_normalizado, artistas.nome_normalizado
+    FROM musicas
+    JOIN albuns ON albuns.id = musicas.album_id
+    JOIN artistas ON artistas.id = albuns.artista_id
+    WHERE {filtro}
+"""
+
+
+def _texto_incremental(sql):
+    return sa.text(sql.format(filtro=_FILTRO_INCREMENTAL)).bindparams(
+        sa.bindparam('musica_ids', expanding=True),
+        sa.bindparam('album_ids', expanding=True),
+        sa.bindparam('artista_ids', expanding=True),
+    )
+
+
+def normalizar_texto(valor):
+    """Remove acentos e pontuacao, converte para minusculas e compacta espacos."""
+    if not valor:
+        return ''
+    decomposto = unicodedata.normalize('NFKD', valor)
+    sem_acentos = ''.join(char for char in decomposto if not unicodedata.combining(char))
+    return ' '.join(_TOKEN_PATTERN.findall(sem_acentos.lower()))
+
+
+def _trigramas(texto):
+    """Trigramas no formato do pg_trgm: cada palavra recebe dois espacos antes e um depois."""
+    trigramas = set()
+    for palavra in texto.split():
+        preenchida = f'  {palavra} '
+        trigramas.update(preenchida[i:i + 3] for i in range(len(preenchida) - 2))
+    return trigramas
+
+
+class TrigramIndex:
+    """Indice invertido de trigramas em memoria, usado na busca aproximada do SQLite."""
+
+    def __init__(self):
+        self._postings = {}
+        self._documentos = {}
+
+    def __len__(self):
+        return len(self._documentos)
+
+    def adicionar(self, documento_id, *textos):
+        campos = [_trigramas(texto) for texto in textos if texto]
+        self._documentos[documento_id] = campos
+        for trigramas in campos:
+            for trigrama in trigramas:
+                self._postings.setdefault(trigrama, set()).add(documento_id)
+
+    def buscar(self, termo, limiar=0.5, limite=200):
+        """Retorna [(documento_id, similaridade)] ordenado por similaridade.
+
+        A similaridade segue a ideia do `word_similarity` do pg_trgm: fracao dos
+        trigramas do termo presentes no melhor campo do documento.
+        """
+        consulta = _trigramas(termo)
+        if not consulta:
+            return []
+
+        candidatos = {}
+        for trigrama in consulta:
+            for documento_id in self._postings.get(trigrama, ()):
+                candidatos[documento_id] = candidatos.get(documento_id, 0) + 1
+
+        minimo = limiar * len(consulta)
+        resultados = []
+        for documento_id, ocorrencias in candidatos.items():
+            if ocorrencias < minimo:
+                continue
+            melhor = max(len(consulta & campo) for campo in self._documentos[documento_id]) / len(consulta)
+            if melhor >= limiar:
+                resultados.append((documento_id, melhor))
+
+        resultados.sort(key=lambda item: (-item[1], item[0]))
+        return resultados[:limite]
+
+
+class CatalogSearchService:
+    """Indice de busca textual do catalogo (tsvector no Postgres, FTS5 no SQLite)."""
+
+    # Pesos do bm25 na ordem das colunas da tabela musicas_fts (titulo, album, artista).
+    SQLITE_BM25_PESOS = (10.0, 4.0, 4.0)
+    MAX_RESULTADOS_APROXIMADOS = 200
+    # Pontos por tipo de correspondencia no ranking combinado. Os niveis ficam
+    # a DISTANCIA_NIVEIS um do outro e o bonus de popularidade e limitado a
+    # essa distancia (e nunca chega a ela), entao uma correspondencia melhor
+    # nunca perde para uma pior so por ser menos tocada.
+    DISTANCIA_NIVEIS = 20
+    PONTOS_CORRESPONDENCIA = {
+        'titulo_exato': 180,
+        'titulo_prefixo': 160,
+        'titulo_palavra': 140,
+        'artista_exato': 120,
+        'album_exato': 100,
+        'titulo_trecho': 80,
+        'artista_prefixo': 60,
+        'album_prefixo': 40,
+        'documento': 20,
+    }
+
+    @staticmethod
+    def _config(chave, padrao):
+        if has_app_context():
+            valor = current_app.config.get(chave)
+            return padrao if valor is None else valor
+        return padrao
+
+    @classmethod
+    def _config_texto(cls):
+        return cls._config('SEARCH_TEXT_CONFIG', 'portuguese') or 'portuguese'
+
+    @classmethod
+    def _limiar_aproximado(cls):
+        return float(cls._config('SEARCH_FUZZY_THRESHOLD', 0.5))
+
+    @staticmethod
+    def tokenizar(termo):
+        """Quebra o termo normalizado em tokens seguros para as sintaxes de busca."""
+        return normalizar_texto(termo).split()
+
+    @staticmethod
+    def _sqlite_fts_disponivel(connection):
+        # Apenas o resultado positivo fica em cache: bancos locais antigos passam a
+        # usar o FTS assim que a tabela for criada (db upgrade ou create_all).
+        engine = connection.engine
+        if _fts_sqlite_por_engine.get(engine):
+            return True
+        disponivel = connection.execute(
+            sa.text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'musicas_fts'")
+        ).first() is not None
+        if disponivel:
+            _fts_sqlite_por_engine[engine] = True
+        return disponivel
+
+    @classmethod
+    def backend(cls, connection=None):
+        """Retorna o backend de busca ativo ou None quando so o ILIKE esta disponivel."""
+        connection = connection or db.session.connection()
+        dialeto = connection.dialect.name
+        if dialeto == 'postgresql':
+            return 'postgresql'
+        if dialeto == 'sqlite' and cls._sqlite_fts_disponivel(connection):
+            return 'sqlite'
+        return None
+
+    @classmethod
+    def subconsulta_relevancia(cls, termo):
+        """Subconsulta (musica_id, relevancia) das faixas que casam com o termo.
+
+        Cada token vira uma busca por prefixo e todos precisam casar. Retorna None
+        quando nao ha backend de texto ou o termo nao tem tokens utilizaveis.
+        """
+        tokens = cls.tokenizar(termo)
+        if not tokens:
+            return None
+
+        backend = cls.backend()
+        if backend == 'postgresql':
+            consulta = ' & '.join(f'{token}:*' for token in tokens)
+            stmt = sa.text(
+                """
+                SELECT musicas.id AS musica_id,
+                       ts_rank_cd(musicas.busca_documento, to_tsquery(CAST(:config AS regconfig), :consulta))
+                           AS relevancia
+                FROM musicas
+                WHERE musicas.busca_documento @@ to_tsquery(CAST(:config AS regconfig), :consulta)
+                """
+            ).bindparams(config=cls._config_texto(), consulta=consulta)
+        elif backend == 'sqlite':
+            consulta = ' '.join(f'"{token}"*' for token in tokens)
+            pesos = ', '.join(str(peso) for peso in cls.SQLITE_BM25_PESOS)
+            stmt = sa.text(
+                f"""
+                SELECT rowid AS musica_id, -bm25(musicas_fts, {pesos}) AS relevancia
+                FROM musicas_fts
+                WHERE musicas_fts MATCH :consulta
+                """
+            ).bindparams(consulta=consulta)
+        else:
+            return None
+
+        return stmt.columns(musica_id=db.Integer, relevancia=db.Float).subquery('busca_textual')
+
+    @classmethod
+    def _subconsulta_aproximada_postgres(cls, termo):
+        # Uma busca por tabela, cada uma no seu indice GIN (gin_trgm_ops), unidas por faixa:
+        # um OR sobre o JOIN das tres tabelas nao usa os indices. O limiar vale so para a transacao.
+        db.session.execute(
+            sa.text("SELECT set_config('pg_trgm.word_similarity_threshold', :limiar, true)"),
+            {'limiar': str(cls._limiar_aproximado())},
+        )
+        stmt = sa.text(
+            """
+            SELECT candidatas.musica_id, max(candidatas.relevancia) AS relevancia
+            FROM (
+                SELECT musicas.id AS musica_id,
+                       word_similarity(:termo, musicas.titulo_normalizado) AS relevancia
+                FROM musicas
+                WHERE :termo <% musicas.titulo_normalizado
+                UNION ALL
+                SELECT musicas.id, word_similarity(:termo, albuns.titulo_normalizado)
+                FROM albuns
+                JOIN musicas ON musicas.album_id = albuns.id
+                WHERE :termo <% albuns.titulo_normalizado
+                UNION ALL
+                SELECT musicas.id, word_similarity(:termo, artistas.nome_normalizado)
+                FROM artistas
+                JOIN albuns ON albuns.artista_id = artistas.id
+                JOIN musicas ON musicas.album_id = albuns.id
+                WHERE :termo <% artistas.nome_normalizado
+            ) AS candidatas
+            GROUP BY candidatas.musica_id
+            """
+        ).bindparams(termo=normalizar_texto(termo))
+        return stmt.columns(musica_id=db.Integer, relevancia=db.Float).subquery('busca_aproximada')
+
+    @staticmethod
+    def invalidar_indice_aproximado(engine):
+        """Descarta o indice de trigramas em memoria; sera reconstruido na proxima busca."""
+        with _indices_trigramas_lock:
+            _indices_trigramas.pop(engine, None)
+
+    @staticmethod
+    def _indice_aproximado_sqlite():
+        engine = db.session.get_bind()
+        with _indices_trigramas_lock:
+            indice = _indices_trigramas.get(engine)
+        if indice is not None:
+            return indice
+
+        indice = TrigramIndex()
+        linhas = db.session.execute(
+            sa.text(
+                """
+                SELECT musicas.id, musicas.titulo_normalizado, albuns.titulo_normalizado,
+                       artistas.nome_normalizado
+                FROM musicas
+                JOIN albuns ON albuns.id = musicas.album_id
+                JOIN artistas ON artistas.id = albuns.artista_id
+                """
+            )
+        )
+        for musica_id, titulo, album, artista in linhas:
+            indice.adicionar(musica_id, titulo, album, artista)
+
+        with _indices_trigramas_lock:
+            _indices_trigramas[engine] = indice
+        return indice
+
+    @classmethod
+    def aplicar_busca(cls, query, termo, aproximada=False):
+        """Restringe `query` (Music JOIN Album JOIN Artist) ao termo buscado.
+
+        Usa o indice textual ou, com `aproximada`, a busca por trigramas
+        (acentos e erros de digitacao); quem chama so tenta a aproximada quando
+        a textual nao encontra nada. Retorna (query, expressao_de_relevancia)
+        ou None quando nao ha backend de busca; na busca aproximada a relevancia
+        e a similaridade (0-1).
+        """
+        from app.models import Music
+
+        if not aproximada:
+            relevancia = cls.subconsulta_relevancia(termo)
+            if relevancia is None:
+                return None
+            return query.join(relevancia, relevancia.c.musica_id == Music.id), relevancia.c.relevancia
+
+        backend = cls.backend()
+        if backend is None or not cls.tokenizar(termo):
+            return None
+        if backend == 'postgresql':
+            similares = cls._subconsulta_aproximada_postgres(termo)
+            return query.join(similares, similares.c.musica_id == Music.id), similares.c.relevancia
+
+        similares = cls._indice_aproximado_sqlite().buscar(
+            normalizar_texto(termo),
+            limiar=cls._limiar_aproximado(),
+            limite=cls.MAX_RESULTADOS_APROXIMADOS,
+        )
+        pontuacao = dict(similares)
+        expressao = sa.case(pontuacao, value=Music.id, else_=0.0) if pontuacao else sa.literal(0.0)
+        return query.filter(Music.id.in_(list(pontuacao))), expressao
+
+    @classmethod
+    def expressao_ranking(cls, termo, relevancia, aproximada=False):
+        """Pontuacao combinada (correspondencia + popularidade) calculada no banco.
+
+        So e avaliada sobre as faixas ja selecionadas pelo indice textual ou
+        aproximado, com comparacoes nas colunas normalizadas. A popularidade soma
+        ate SEARCH_POPULARITY_BOOST pontos (no maximo DISTANCIA_NIVEIS), saturando
+        em visualizacoes / (visualizacoes + SEARCH_POPULARITY_SATURATION).
+        """
+        from app.models import Album, Artist, Music
+
+        normalizado = normalizar_texto(termo)
+        pontos = cls.PONTOS_CORRESPONDENCIA
+        titulo = Music.titulo_normalizado
+        album = Album.titulo_normalizado
+        artista = Artist.nome_normalizado
+
+        if aproximada:
+            # Sem token exato, a similaridade de trigramas define o nivel base.
+            base = pontos['documento'] * relevancia
+        else:
+            base = sa.literal(pontos['documento'])
+
+        correspondencia = sa.case(
+            (titulo == normalizado, pontos['titulo_exato']),
+            (titulo.startswith(normalizado, autoescape=True), pontos['titulo_prefixo']),
+            (titulo.contains(' ' + normalizado, autoescape=True), pontos['titulo_palavra']),
+            (artista == normalizado, pontos['artista_exato']),
+            (album == normalizado, pontos['album_exato']),
+            (titulo.contains(normalizado, autoescape=True), pontos['titulo_trecho']),
+            (artista.startswith(normalizado, autoescape=True), pontos['artista_prefixo']),
+            (album.startswith(normalizado, autoescape=True), pontos['album_prefixo']),
+            else_=base,
+        )
+
+        bonus = min(float(cls._config('SEARCH_POPULARITY_BOOST', 15.0)), cls.DISTANCIA_NIVEIS)
+        saturacao = max(float(cls._config('SEARCH_POPULARITY_SATURATION', 100)), 1.0)
+        visualizacoes = sa.cast(sa.func.coalesce(Music.visualizacoes, 0), sa.Float)
+        popularidade = bonus * visualizacoes / (visualizacoes + saturacao)
+        return correspondencia + popularidade
+
+    @classmethod
+    def sincronizar(cls, connection, musica_ids=(), album_ids=(), artista_ids=()):
+        """Reindexa as musicas afetadas por alteracoes em faixas, albuns ou artistas."""
+        if not (musica_ids or album_ids or artista_ids):
+            return
+
+        backend = cls.backend(connection)
+        params = {
+            'musica_ids': list(musica_ids),
+            'album_ids': list(album_ids),
+            'artista_ids': list(artista_ids),
+        }
+        if backend == 'postgresql':
+            connection.execute(
+                _texto_incremental(_SQL_SINCRONIZAR_POSTGRES),
+                {**params, 'config': cls._config_texto()},
+            )
+        elif backend == 'sqlite':
+            connection.execute(_texto_incremental(_SQL_REMOVER_SQLITE), params)
+            connection.execute(_texto_incremental(_SQL_INSERIR_SQLITE), params)
+            cls.invalidar_indice_aproximado(connection.engine)
+
+    @classmethod
+    def remover(cls, connection, musica_ids):
+        """Remove faixas apagadas do indice (no Postgres o documento sai junto com a linha)."""
+        if musica_ids and cls.backend(connection) == 'sqlite':
+            connection.execute(
+                sa.text('DELETE FROM musicas_fts WHERE rowid IN :musica_ids').bindparams(
+                    sa.bindparam('musica_ids', expanding=True)
+                ),
+                {'musica_ids': list(musica_ids)},
+            )
+            cls.invalidar_indice_aproximado(connection.engine)
+
+    @staticmethod
+    def normalizar_catalogo():
+        """Recalcula as colunas normalizadas de faixas, albuns e artistas."""
+        from app.models import Album, Artist, Music
+
+        for modelo, origem, destino in (
+            (Music, 'titulo', 'titulo_normalizado'),
+            (Album, 'titulo', 'titulo_normalizado'),
+            (Artist, 'nome', 'nome_normalizado'),
+        ):
+            for instancia in modelo.query.yield_per(1000):
+                setattr(instancia, destino, normalizar_texto(getattr(instancia, origem)))
+        db.session.flush()
+
+    @classmethod
+    def reconstruir_indice(cls):
+        """Reconstroi colunas normalizadas e indice inteiro. Retorna o total de musicas indexadas."""
+        cls.normalizar_catalogo()
+
+        connection = db.session.connection()
+        backend = cls.backend(connection)
+        if backend == 'postgresql':
+            connection.execute(
+                sa.text(_SQL_SINCRONIZAR_POSTGRES.format(filtro='1 = 1')),
+                {'config': cls._config_texto()},
+            )
+        elif backend == 'sqlite':
+            connection.execute(sa.text('DELETE FROM musicas_fts'))
+            connection.execute(sa.text(_SQL_INSERIR_SQLITE.format(filtro='1 = 1')))
+            cls.invalidar_indice_aproximado(connection.engine)
+        else:
+            db.session.commit()
+            return 0
+
+        total = connection.execute(sa.text('SELECT count(*) FROM musicas')).scalar()
+        db.session.commit()
+        return total
@@ -0,0 +1,29 @@
+def separar_relacionados(musicas):
+    """Troca o album/artista aninhado em cada musica por referencias.
+
+    Recebe os dicts de `Music.to_dict()` e retorna (musicas, included), em que
+    cada musica fica com `album_id` e `included` traz uma unica copia de cada
+    album (com `artista_id`) e de cada artista:
+    {'albuns': {id: album}, 'artistas': {id: artista}}. Os dicts recebidos nao
+    sao alterados (podem vir do cache de busca).
+    """
+    albuns = {}
+    artistas = {}
+    compactas = []
+    for musica in musicas:
+        album = musica.get('album')
+        if album is None:
+            compactas.append(musica)
+            continue
+
+        compactas.append({chave: valor for chave, valor in musica.items() if chave != 'album'})
+        if album['id'] in albuns:
+            continue
+        artista = album.get('artista')
+        albuns[album['id']] = {
+            **{chave: valor for chave, valor in album.items() if chave != 'artista'},
+            'artista_id': artista['id'] if artista else None,
+        }
+        if artista:
+            artistas.setdefault(artista['id'], artista)
+    return compactas, {'albuns': albuns, 'artistas': artistas}
@@ -0,0 +1,262 @@
+import heapq
+from bisect import bisect_left
+from threading import Lock
+from time import monotonic
+from weakref import WeakKeyDictionary
+
+import sqlalchemy as sa
+from flask import current_app
+
+from app.extensions import db
+from app.services.search_service import normalizar_texto
+
+_indices_por_engine = WeakKeyDictionary()
+_indices_lock = Lock()
+# Uma reconstrucao por vez; as demais requisicoes seguem com o indice anterior.
+_reconstrucao_lock = Lock()
+
+
+class _No:
+    """No da trie: filhos por caractere, itens cujas chaves terminam aqui e o topo da subarvore."""
+
+    __slots__ = ('filhos', 'itens', 'topo')
+
+    def __init__(self):
+        self.filhos = {}
+        self.itens = set()
+        self.topo = []
+
+
+class PrefixIndex:
+    """Trie de chaves normalizadas para autocomplete por prefixo.
+
+    Cada nome e indexado pelo texto completo e a partir de cada palavra, de modo
+    que "dom" encontra "Manha de Domingo". Cada no guarda, em ordem, os
+    LIMITE_MAXIMO itens de maior peso (popularidade) da sua subarvore: a busca
+    so desce pelo prefixo e corta a lista. A trie para em PROFUNDIDADE_MAXIMA
+    caracteres; prefixos mais longos filtram apenas os itens do ultimo no.
+    """
+
+    LIMITE_MAXIMO = 50
+    PROFUNDIDADE_MAXIMA = 12
+
+    def __init__(self):
+        self._raiz = _No()
+        self._entidades = {}
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entidades)
+
+    @staticmethod
+    def _chaves_de(nome_normalizado):
+        palavras = nome_normalizado.split()
+        return {' '.join(palavras[i:]) for i in range(len(palavras))}
+
+    @staticmethod
+    def _entidade(tipo, item_id, nome, peso, normalizado):
+        peso = peso or 0
+        return {
+            'nome': nome,
+            'peso': peso,
+            'chaves': PrefixIndex._chaves_de(normalizado),
+            # Ordem de exibicao: mais popular primeiro, depois nome e identidade.
+            'ordem': (-peso, nome, tipo, item_id),
+        }
+
+    @classmethod
+    def _incluir_no_topo(cls, no, ordem):
+        topo = no.topo
+        posicao = bisect_left(topo, ordem)
+        if posicao >= cls.LIMITE_MAXIMO or (posicao < len(topo) and topo[posicao] == ordem):
+            return
+        topo.insert(posicao, ordem)
+        del topo[cls.LIMITE_MAXIMO:]
+
+    @classmethod
+    def _indexar(cls, raiz, entidade):
+        ordem = entidade['ordem']
+        for chave in entidade['chaves']:
+            no = raiz
+            for caractere in chave[:cls.PROFUNDIDADE_MAXIMA]:
+                filho = no.filhos.get(caractere)
+                if filho is None:
+                    filho = no.filhos[caractere] = _No()
+                no = filho
+                cls._incluir_no_topo(no, ordem)
+            no.itens.add(ordem[2:])
+
+    def carregar(self, itens):
+        """Carga inicial em lote: itens sao (tipo, id, nome, peso)."""
+        entidades = {}
+        for tipo, item_id, nome, peso in itens:
+            normalizado = normalizar_texto(nome)
+            if normalizado:
+                entidades[(tipo, item_id)] = self._entidade(tipo, item_id, nome, peso, normalizado)
+        # Em ordem de exibicao, cada topo so cresce pelo fim.
+        raiz = _No()
+        for entidade in sorted(entidades.values(), key=lambda entidade: entidade['ordem']):
+            self._indexar(raiz, entidade)
+        with self._lock:
+            self._raiz = raiz
+            self._entidades = entidades
+
+    def _refazer_topo(self, no):
+        # Itens ja retirados de `_entidades` (remocao em andamento) nao voltam.
+        candidatos = {self._entidades[item]['ordem'] for item in no.itens if item in self._entidades}
+        for filho in no.filhos.values():
+            candidatos.update(filho.topo)
+        no.topo = heapq.nsmallest(self.LIMITE_MAXIMO, candidatos)
+
+    def _remover_sem_lock(self, tipo, item_id):
+        entidade = self._entidades.pop((tipo, item_id), None)
+        if not entidade:
+            return None
+        ordem = entidade['ordem']
+        for chave in entidade['chaves']:
+            caminho = [self._raiz]
+            for caractere in chave[:self.PROFUNDIDADE_MAXIMA]:
+                caminho.append(caminho[-1].filhos[caractere])
+            caminho[-1].itens.discard((tipo, item_id))
+            # De baixo para cima: o topo do pai e refeito a partir dos topos ja corrigidos dos filhos.
+            for profundidade in range(len(caminho) - 1, 0, -1):
+                no = caminho[profundidade]
+                posicao = bisect_left(no.topo, ordem)
+                if posicao < len(no.topo) and no.topo[posicao] == ordem:
+                    cheio = len(no.topo) >= self.LIMITE_MAXIMO
+                    del no.topo[posicao]
+                    if cheio:
+                        self._refazer_topo(no)
+                if not (no.itens or no.filhos):
+                    del caminho[profundidade - 1].filhos[chave[profundidade - 1]]
+        return entidade
+
+    def remover(self, tipo, item_id):
+        with self._lock:
+            self._remover_sem_lock(tipo, item_id)
+
+    def atualizar(self, tipo, item_id, nome, peso=None):
+        """Insere ou renomeia um item; sem `peso` mantem a popularidade conhecida."""
+        normalizado = normalizar_texto(nome)
+        with self._lock:
+            anterior = self._remover_sem_lock(tipo, item_id)
+            if normalizado:
+                if peso is None:
+                    peso = anterior['peso'] if anterior else 0
+                entidade = self._entidade(tipo, item_id, nome, peso, normalizado)
+                self._entidades[(tipo, item_id)] = entidade
+                self._indexar(self._raiz, entidade)
+
+    def buscar(self, prefixo, limite=10):
+        """Retorna ate `limite` itens {'tipo', 'id', 'nome'} cujo nome casa com o prefixo.
+
+        `limite` vai ate LIMITE_MAXIMO; cada chamada devolve uma lista nova.
+        """
+        prefixo = normalizar_texto(prefixo)
+        if not prefixo:
+            return []
+
+        limite = min(limite, self.LIMITE_MAXIMO)
+        with self._lock:
+            no = self._raiz
+            for caractere in prefixo[:self.PROFUNDIDADE_MAXIMA]:
+                no = no.filhos.get(caractere)
+                if no is None:
+                    return []
+            if len(prefixo) <= self.PROFUNDIDADE_MAXIMA:
+                melhores = no.topo[:limite]
+            else:
+                melhores = heapq.nsmallest(
+                    limite,
+                    (
+                        self._entidades[item]['ordem']
+                        for item in no.itens
+                        if any(chave.startswith(prefixo) for chave in self._entidades[item]['chaves'])
+                    ),
+                )
+        return [{'tipo': tipo, 'id': item_id, 'nome': nome} for _, nome, tipo, item_id in melhores]
+
+
+class SuggestionService:
+    """Mantem um PrefixIndex por worker com musicas, albuns e artistas."""
+
+    @staticmethod
+    def _itens_do_catalogo():
+        """Carrega nomes e popularidade (visualizacoes somadas) em tres consultas."""
+        musicas = db.session.execute(
+            sa.text('SELECT id, titulo, coalesce(visualizacoes, 0) FROM musicas')
+        )
+        albuns = db.session.execute(
+            sa.text(
+                """
+                SELECT albuns.id, albuns.titulo, coalesce(sum(musicas.visualizacoes), 0)
+                FROM albuns LEFT JOIN musicas ON musicas.album_id = albuns.id
+                GROUP BY albuns.id, albuns.titulo
+                """
+            )
+        )
+        artistas = db.session.execute(
+            sa.text(
+                """
+                SELECT artistas.id, artistas.nome, coalesce(sum(musicas.visualizacoes), 0)
+                FROM artistas
+                LEFT JOIN albuns ON albuns.artista_id = artistas.id
+                LEFT JOIN musicas ON musicas.album_id = albuns.id
+                GROUP BY artistas.id, artistas.nome
+                """
+            )
+        )
+        for tipo, linhas in (('musica', musicas), ('album', albuns), ('artista', artistas)):
+            for item_id, nome, peso in linhas:
+                yield tipo, item_id, nome, peso
+
+    @classmethod
+    def indice(cls):
+        """Retorna o indice do worker, reconstruindo-o quando passa do intervalo de refresh.
+
+        O refresh periodico traz alteracoes feitas por outros workers; as deste
+        worker ja sao aplicadas incrementalmente apos cada commit. So uma thread
+        recarrega o catalogo: enquanto isso as outras respondem com o indice
+        anterior, e so a primeira carga do worker espera por ela.
+        """
+        engine = db.session.get_bind()
+        intervalo = float(current_app.config.get('SUGGESTIONS_REFRESH_SECONDS', 300))
+        with _indices_lock:
+            registro = _indices_por_engine.get(engine)
+        if registro and monotonic() - registro['construido_em'] < intervalo:
+            return registro['indice']
+
+        if not _reconstrucao_lock.acquire(blocking=registro is None):
+            return registro['indice']
+        try:
+            with _indices_lock:
+                registro = _indices_por_engine.get(engine)
+            if registro and monotonic() - registro['construido_em'] < intervalo:
+                return registro['indice']
+            indice = registro['indice'] if registro else PrefixIndex()
+            indice.carregar(cls._itens_do_catalogo())
+            with _indices_lock:
+                _indices_por_engine[engine] = {'indice': indice, 'construido_em': monotonic()}
+            return indice
+        finally:
+            _reconstrucao_lock.release()
+
+    @staticmethod
+    def aplicar_alteracoes(engine, atualizados, removidos):
+        """Aplica no indice ja carregado as alteracoes confirmadas neste worker.
+
+        `atualizados` contem (tipo, id, nome) e `removidos` contem (tipo, id).
+        """
+        with _indices_lock:
+            registro = _indices_por_engine.get(engine)
+        if not registro:
+            return
+        indice = registro['indice']
+        for tipo, item_id in removidos:
+            indice.remover(tipo, item_id)
+        for tipo, item_id, nome in atualizados:
+            indice.atualizar(tipo, item_id, nome)
+
+    @classmethod
+    def sugerir(cls, prefixo, limite=10):
+        return cls.indice().buscar(prefixo, limite)
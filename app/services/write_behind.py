@@ -0,0 +1,145 @@
+import atexit
+import logging
+import os
+import weakref
+from threading import Lock, Thread
+from time import monotonic, sleep
+
+logger = logging.getLogger(__name__)
+
+# A thread de descarga acorda ao menos uma vez por este intervalo para ver mudancas de configuracao.
+ESPERA_MAXIMA_SEGUNDOS = 1.0
+
+
+def _descarga_periodica(buffer_ref, app_ref):
+    """Corpo da thread de descarga; termina quando o buffer ou a aplicacao deixam de existir."""
+    while True:
+        buffer = buffer_ref()
+        if buffer is None:
+            return
+        espera = buffer.intervalo_segundos - (monotonic() - buffer._ultimo_flush)
+        del buffer
+        sleep(min(max(espera, 0.05), ESPERA_MAXIMA_SEGUNDOS))
+
+        buffer, app = buffer_ref(), app_ref()
+        if buffer is None or app is None:
+            return
+        if monotonic() - buffer._ultimo_flush >= buffer.intervalo_segundos:
+            try:
+                with app.app_context():
+                    buffer.descarregar()
+            except Exception:
+                logger.exception('Falha na descarga periodica do buffer.')
+        del buffer, app
+
+
+class WriteBehindBuffer:
+    """Acumula valores por chave em memoria e os grava em lote.
+
+    `combinar(atual, novo)` junta dois valores da mesma chave e `gravar(pendentes)`
+    recebe o dicionario acumulado. O lote e gravado quando passa de
+    `intervalo_segundos` desde a ultima gravacao ou de `max_pendentes` chaves,
+    sempre fora do lock. Se a gravacao falhar, os valores voltam para o buffer
+    e entram no proximo lote.
+
+    Com `iniciar_descarga_periodica` o intervalo e cumprido por uma thread do
+    worker, mesmo sem novas chamadas, e a requisicao so grava o lote quando
+    passa de `max_pendentes`.
+    """
+
+    def __init__(self, gravar, combinar, intervalo_segundos=30.0, max_pendentes=500):
+        self._gravar = gravar
+        self._combinar = combinar
+        self.intervalo_segundos = float(intervalo_segundos)
+        self.max_pendentes = max(int(max_pendentes), 1)
+        self._pendentes = {}
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._ultimo_flush = monotonic()
+        self._app_ref = None
+        self._thread = None
+        self._thread_pid = None
+        self._thread_lock = Lock()
+
+    def __len__(self):
+        return len(self._pendentes)
+
+    def pendente(self, chave, padrao=None):
+        """Valor acumulado e ainda nao gravado de `chave`."""
+        with self._lock:
+            return self._pendentes.get(chave, padrao)
+
+    def adicionar(self, chave, valor):
+        """Acumula `valor` e grava o lote se o tamanho (ou, sem thread de descarga, o intervalo) estourou."""
+        periodica = self._garantir_thread()
+        with self._lock:
+            atual = self._pendentes.get(chave)
+            self._pendentes[chave] = valor if atual is None else self._combinar(atual, valor)
+            vencido = len(self._pendentes) >= self.max_pendentes or (
+                not periodica and monotonic() - self._ultimo_flush >= self.intervalo_segundos
+            )
+        if vencido:
+            self.descarregar()
+
+    def iniciar_descarga_periodica(self, app):
+        """Grava os pendentes a cada `intervalo_segundos` numa thread daemon do worker.
+
+        A thread nasce no primeiro `adicionar` de cada processo, para que
+        workers criados por fork tenham a sua.
+        """
+        self._app_ref = weakref.ref(app)
+
+    def _garantir_thread(self):
+        if self._app_ref is None:
+            return False
+        pid = os.getpid()
+        thread = self._thread
+        if thread is not None and self._thread_pid == pid and thread.is_alive():
+            return True
+        with self._thread_lock:
+            if self._thread is None or self._thread_pid != pid or not self._thread.is_alive():
+                self._thread = Thread(
+                    target=_descarga_periodica,
+                    args=(weakref.ref(self), self._app_ref),
+                    name='write-behind',
+                    daemon=True,
+                )
+                self._thread_pid = pid
+                self._thread.start()
+        return True
+
+    def descarregar(self):
+        """Grava tudo o que esta pendente; retorna o numero de chaves gravadas."""
+        # Um unico flush por vez: outra thread que chegue aqui segue sem esperar.
+        if not self._flush_lock.acquire(blocking=False):
+            return 0
+        try:
+            with self._lock:
+                pendentes, self._pendentes = self._pendentes, {}
+                self._ultimo_flush = monotonic()
+            if not pendentes:
+                return 0
+            try:
+                self._gravar(pendentes)
+            except Exception:
+                logger.exception('Falha ao gravar lote de %s item(ns); mantidos para a proxima tentativa.', len(pendentes))
+                with self._lock:
+                    for chave, valor in pendentes.items():
+                        atual = self._pendentes.get(chave)
+                        self._pendentes[chave] = valor if atual is None else self._combinar(valor, atual)
+                return 0
+            return len(pendentes)
+        finally:
+            self._flush_lock.release()
+
+    def registrar_descarga_na_saida(self, app):
+        """Grava o que restar quando o processo (worker) terminar."""
+
+        def _descarregar_na_saida():
+            try:
+                with app.app_context():
+                    self.descarregar()
+            except Exception:
+                logger.exception('Falha ao gravar buffer pendente no encerramento.')
+
+        atexit.register(_descarregar_na_saida)
@@ -58,6 +58,84 @@
     }, 5500);
   }
 
+  const suggestInput = document.querySelector('input[data-suggest-url]');
+  if (suggestInput && 'fetch' in window) {
+    const datalist = document.getElementById(suggestInput.getAttribute('list'));
+    let suggestTimer = null;
+    let suggestController = null;
+
+    suggestInput.addEventListener('input', () => {
+      window.clearTimeout(suggestTimer);
+      const prefix = suggestInput.value.trim();
+      if (!prefix) {
+        datalist.replaceChildren();
+        return;
+      }
+
+      suggestTimer = window.setTimeout(() => {
+        if (suggestController) {
+          suggestController.abort();
+        }
+        suggestController = new AbortController();
+        const url = `${suggestInput.dataset.suggestUrl}?prefix=${encodeURIComponent(prefix)}&limite=8`;
+        fetch(url, { signal: suggestController.signal })
+          .then((response) => response.json())
+          .then((data) => {
+            if (!data.success) {
+              return;
+            }
+            datalist.replaceChildren(
+              ...data.sugestoes.map((sugestao) => {
+                const option = document.createElement('option');
+                option.value = sugestao.nome;
+                option.label = sugestao.tipo;
+                return option;
+              })
+            );
+          })
+          .catch(() => {
+            // requisicao cancelada ou falha de rede: mantem sugestoes atuais
+          });
+      }, 150);
+    });
+  }
+
+  const loadMoreButton = document.querySelector('button[data-carregar-faixas]');
+  const trackList = document.querySelector('[data-playlist-faixas]');
+  if (loadMoreButton && trackList && 'fetch' in window) {
+    loadMoreButton.addEventListener('click', () => {
+      loadMoreButton.disabled = true;
+      const url = `${loadMoreButton.dataset.carregarFaixas}?cursor=${encodeURIComponent(loadMoreButton.dataset.cursor)}`;
+      fetch(url, { credentials: 'same-origin' })
+        .then((response) => {
+          if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+          }
+          const nextCursor = response.headers.get('X-Next-Cursor');
+          return response.text().then((html) => ({ html, nextCursor }));
+        })
+        .then(({ html, nextCursor }) => {
+          const container = document.createElement('template');
+          container.innerHTML = html;
+          container.content.querySelectorAll('[data-animate]').forEach((element) => {
+            element.style.setProperty('--delay', '0ms');
+            element.classList.add('in-view');
+          });
+          trackList.append(container.content);
+          if (nextCursor) {
+            loadMoreButton.dataset.cursor = nextCursor;
+            loadMoreButton.disabled = false;
+          } else {
+            loadMoreButton.remove();
+          }
+        })
+        .catch(() => {
+          // falha de rede: permite tentar de novo
+          loadMoreButton.disabled = false;
+        });
+    });
+  }
+
   const audioElement = document.querySelector('audio');
   if (audioElement) {
     audioElement.addEventListener('play', () => {
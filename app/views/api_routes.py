@@ -1,45 +1,179 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, g, jsonify, request
 from flask_login import current_user, login_required
 
 from app.controllers.auth_controller import AuthController
 from app.controllers.billing_controller import BillingController
 from app.controllers.music_controller import MusicController
 from app.controllers.playlist_controller import PlaylistController
+from app.models.campos import interpretar_campos
+from app.services.json_provider import resposta_em_fluxo
+from app.services.negociacao import dados_requisicao, prefere_msgpack
 
 api_bp = Blueprint('api', __name__)
 
 
+@api_bp.before_request
+def negociar_formato():
+    """`Accept: application/msgpack` troca o formato das respostas desta requisicao."""
+    g.responder_msgpack = prefere_msgpack()
+
+
+@api_bp.after_request
+def variar_por_accept(response):
+    response.vary.add('Accept')
+    return response
+
+
+def _em_fluxo(limite):
+    return limite >= current_app.config.get('API_STREAM_MIN_ROWS', 500)
+
+
+def _campos():
+    """Campos pedidos em `?fields=id,titulo,album.titulo` (None = todos)."""
+    return interpretar_campos(request.args.get('fields'))
+
+
+def _resposta_lista(resultado, chave='musicas'):
+    """jsonify, ou resposta em fluxo quando o controller devolveu um gerador."""
+    if resultado.get('success') and not isinstance(resultado.get(chave), list):
+        return resposta_em_fluxo(resultado, chave)
+    return jsonify(resultado)
+
+
+def _ids():
+    """Ids de `?ids=1,2,3` na ordem pedida e sem repeticao (ValueError se invalidos)."""
+    ids = []
+    for valor in request.args.get('ids', '').split(','):
+        if not valor.strip():
+            continue
+        try:
+            item = int(valor)
+        except ValueError:
+            raise ValueError(f'Id invalido: {valor.strip()}') from None
+        if item not in ids:
+            ids.append(item)
+    if not ids:
+        raise ValueError('Parametro ids e obrigatorio')
+    maximo = current_app.config.get('API_BATCH_MAX_IDS', 100)
+    if len(ids) > maximo:
+        raise ValueError(f'Maximo de {maximo} ids por consulta')
+    return ids
+
+
+def _por_ids(obter):
+    """Resposta de uma consulta em lote (`obter(ids, campos)`), com 400 para `ids` invalido."""
+    try:
+        ids = _ids()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify(obter(ids, campos=_campos()))
+
+
 @api_bp.route('/musicas', methods=['GET'])
 def listar_musicas():
-    """API: lista musicas."""
+    """API: lista musicas (paginacao por offset ou por `cursor`; `ordem` relevancia ou titulo; `fields`).
+
+    Com `ids=1,2,3` retorna essas musicas, na ordem pedida.
+    """
+    if 'ids' in request.args:
+        return _por_ids(MusicController.obter_musicas_por_ids)
+
     termo = request.args.get('q')
     limite = max(request.args.get('limite', 50, type=int) or 50, 1)
     offset = max(request.args.get('offset', 0, type=int) or 0, 0)
+    cursor = request.args.get('cursor')
+    incluir_total = request.args.get('incluir_total') == 'true'
+    ordem = request.args.get('ordem', 'relevancia')
+
+    resultado = MusicController.buscar_musicas(
+        termo,
+        limite,
+        offset,
+        cursor=cursor,
+        incluir_total=incluir_total,
+        ordem=ordem,
+        em_fluxo=_em_fluxo(limite),
+        campos=_campos(),
+    )
+    return _resposta_lista(resultado)
+
+
+@api_bp.route('/musicas/sugestoes', methods=['GET'])
+def sugestoes_musicas():
+    """API: autocomplete de musicas, albuns e artistas por prefixo."""
+    prefixo = request.args.get('prefix', '')
+    limite = min(max(request.args.get('limite', 10, type=int) or 10, 1), 50)
+    resultado = MusicController.obter_sugestoes(prefixo, limite)
+    return jsonify(resultado)
+
+
+@api_bp.route('/musicas/busca/cache', methods=['GET'])
+def estatisticas_cache_busca():
+    """API: contadores de hit/miss do cache de busca do worker."""
+    resultado = MusicController.estatisticas_cache_busca()
+    return jsonify(resultado)
+
 
-    resultado = MusicController.buscar_musicas(termo, limite, offset)
+@api_bp.route('/musicas/navegar', methods=['GET'])
+def navegar_musicas():
+    """API: navegacao facetada por genero, ano de lancamento e faixa de duracao."""
+    filtros = {
+        'genero': request.args.getlist('genero'),
+        'ano_lancamento': request.args.getlist('ano', type=int),
+        'duracao': request.args.getlist('duracao'),
+    }
+    limite = max(request.args.get('limite', 50, type=int) or 50, 1)
+    offset = max(request.args.get('offset', 0, type=int) or 0, 0)
+    resultado = MusicController.navegar_catalogo(filtros, limite, offset, campos=_campos())
     return jsonify(resultado)
 
 
 @api_bp.route('/musicas/<int:musica_id>', methods=['GET'])
 def obter_musica(musica_id):
     """API: obtem detalhes de musica."""
-    resultado = MusicController.obter_musica(musica_id)
+    resultado = MusicController.obter_musica(musica_id, campos=_campos())
     return jsonify(resultado)
 
 
 @api_bp.route('/musicas/populares', methods=['GET'])
 def musicas_populares():
-    """API: musicas mais populares."""
+    """API: musicas mais populares do tenant corrente (`janela=dia|semana|sempre`, `genero=`)."""
     limite = max(request.args.get('limite', 20, type=int) or 20, 1)
-    resultado = MusicController.obter_musicas_populares(limite)
-    return jsonify(resultado)
+    resultado = MusicController.obter_musicas_populares(
+        limite,
+        em_fluxo=_em_fluxo(limite),
+        campos=_campos(),
+        tenant_id=current_user.tenant_id if current_user.is_authenticated else None,
+        janela=request.args.get('janela', 'sempre'),
+        genero=request.args.get('genero', '').strip() or None,
+    )
+    return _resposta_lista(resultado)
 
 
 @api_bp.route('/musicas/<int:musica_id>/reproduzir', methods=['POST'])
 @login_required
 def reproduzir_musica(musica_id):
     """API: registra reproducao de musica."""
-    resultado = MusicController.registrar_reproducao(musica_id)
+    resultado = MusicController.registrar_reproducao(musica_id, current_user.id, current_user.tenant_id)
+    return jsonify(resultado)
+
+
+@api_bp.route('/albuns', methods=['GET'])
+def listar_albuns():
+    """API: albuns de `ids=1,2,3`, na ordem pedida."""
+    return _por_ids(MusicController.obter_albuns_por_ids)
+
+
+@api_bp.route('/artistas', methods=['GET'])
+def listar_artistas():
+    """API: artistas de `ids=1,2,3`, na ordem pedida."""
+    return _por_ids(MusicController.obter_artistas_por_ids)
+
+
+@api_bp.route('/artistas/<int:artista_id>/discografia', methods=['GET'])
+def discografia_artista(artista_id):
+    """API: discografia pre-calculada do artista."""
+    resultado = MusicController.obter_discografia(artista_id, campos=_campos())
     return jsonify(resultado)
 
 
@@ -51,10 +185,11 @@ def playlists():
         resultado = PlaylistController.obter_playlists_usuario(
             current_user.id,
             include_musicas=request.args.get('include_musicas') == 'true',
+            campos=_campos(),
         )
         return jsonify(resultado)
 
-    dados = request.get_json(silent=True) or {}
+    dados = dados_requisicao()
     if not dados.get('nome'):
         return jsonify({'success': False, 'message': 'Campo nome e obrigatorio'}), 400
 
@@ -76,11 +211,12 @@ def playlist_detalhes(playlist_id):
             playlist_id,
             current_user.id,
             tenant_id=current_user.tenant_id,
+            campos=_campos(),
         )
         return jsonify(resultado)
 
     if request.method == 'PUT':
-        dados = request.get_json(silent=True) or {}
+        dados = dados_requisicao()
         resultado = PlaylistController.atualizar_playlist(playlist_id, current_user.id, dados)
         return jsonify(resultado)
 
@@ -93,7 +229,7 @@ def playlist_detalhes(playlist_id):
 def playlist_musicas(playlist_id, musica_id):
     """API: adiciona ou remove musica da playlist."""
     if request.method == 'POST':
-        dados = request.get_json(silent=True) or {}
+        dados = dados_requisicao()
         resultado = PlaylistController.adicionar_musica(
             playlist_id,
             current_user.id,
@@ -106,12 +242,32 @@ def playlist_musicas(playlist_id, musica_id):
     return jsonify(resultado)
 
 
+@api_bp.route('/playlists/<int:playlist_id>/musicas', methods=['GET'])
+def playlist_faixas(playlist_id):
+    """API: janela de faixas da playlist por `cursor` (ordem de posicao) e `limite`."""
+    limite_padrao = current_app.config.get('PLAYLIST_TRACKS_WINDOW', 100)
+    limite = max(request.args.get('limite', limite_padrao, type=int) or limite_padrao, 1)
+    limite = min(limite, current_app.config.get('PLAYLIST_TRACKS_MAX_WINDOW', 500))
+    try:
+        resultado = PlaylistController.obter_faixas_playlist(
+            playlist_id,
+            current_user.id if current_user.is_authenticated else None,
+            tenant_id=current_user.tenant_id if current_user.is_authenticated else None,
+            cursor=request.args.get('cursor'),
+            limite=limite,
+            campos=_campos(),
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify(resultado), 200 if resultado['success'] else 404
+
+
 @api_bp.route('/playlists/publicas', methods=['GET'])
 def playlists_publicas():
     """API: lista playlists publicas do tenant corrente."""
     limite = request.args.get('limite', 20, type=int)
     tenant_id = current_user.tenant_id if current_user.is_authenticated else None
-    resultado = PlaylistController.obter_playlists_publicas(limite, tenant_id=tenant_id)
+    resultado = PlaylistController.obter_playlists_publicas(limite, tenant_id=tenant_id, campos=_campos())
     return jsonify(resultado)
 
 
@@ -134,7 +290,7 @@ def billing_subscription():
 @login_required
 def billing_checkout():
     """API: inicia checkout Stripe para troca/contratacao de plano."""
-    dados = request.get_json(silent=True) or {}
+    dados = dados_requisicao()
     plan_code = dados.get('plan_code')
     success_url = dados.get('success_url')
     cancel_url = dados.get('cancel_url')
@@ -156,7 +312,7 @@ def billing_checkout():
 @login_required
 def billing_portal():
     """API: abre portal de faturamento Stripe."""
-    dados = request.get_json(silent=True) or {}
+    dados = dados_requisicao()
     return_url = dados.get('return_url')
     if not return_url:
         return jsonify({'success': False, 'message': 'return_url e obrigatorio'}), 400
@@ -180,7 +336,7 @@ def billing_webhook():
 @api_bp.route('/auth/verificar-email', methods=['POST'])
 def auth_verificar_email():
     """API: confirma verificacao de email por token."""
-    dados = request.get_json(silent=True) or {}
+    dados = dados_requisicao()
     resultado = AuthController.verificar_email_token(dados.get('token'))
     return jsonify(resultado), 200 if resultado.get('success') else 400
 
@@ -188,7 +344,7 @@ def auth_verificar_email():
 @api_bp.route('/auth/solicitar-reset', methods=['POST'])
 def auth_solicitar_reset():
     """API: solicita reset de senha."""
-    dados = request.get_json(silent=True) or {}
+    dados = dados_requisicao()
     resultado = AuthController.solicitar_reset_senha(dados.get('email'))
     return jsonify(resultado), 200 if resultado.get('success') else 400
 
@@ -196,7 +352,7 @@ def auth_solicitar_reset():
 @api_bp.route('/auth/redefinir-senha', methods=['POST'])
 def auth_redefinir_senha():
     """API: redefine senha com token."""
-    dados = request.get_json(silent=True) or {}
+    dados = dados_requisicao()
     resultado = AuthController.redefinir_senha(
         token=dados.get('token'),
         nova_senha=dados.get('nova_senha'),
@@ -211,11 +367,22 @@ def usuario_perfil():
     if request.method == 'GET':
         return jsonify({'success': True, 'usuario': current_user.to_dict()})
 
-    dados = request.get_json(silent=True) or {}
+    dados = dados_requisicao()
     resultado = AuthController.atualizar_perfil(current_user, dados)
     return jsonify(resultado)
 
 
+@api_bp.route('/usuario/musicas/status', methods=['GET'])
+@login_required
+def usuario_status_musicas():
+    """API: favoritos e playlists do usuario que contem as musicas de `ids=1,2,3`."""
+    try:
+        ids = _ids()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify(PlaylistController.obter_status_musicas(current_user.id, ids))
+
+
 @api_bp.route('/usuario/favoritos/<int:musica_id>', methods=['POST', 'DELETE'])
 @login_required
 def gerenciar_favoritos(musica_id):
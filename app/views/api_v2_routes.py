@@ -0,0 +1,64 @@
+from flask import Blueprint, jsonify, request
+from flask_login import current_user, login_required
+
+from app.controllers.music_controller import MusicController
+from app.controllers.playlist_controller import PlaylistController
+from app.services.side_loading import separar_relacionados
+
+api_v2_bp = Blueprint('api_v2', __name__)
+
+
+def _com_relacionados(resultado, musicas):
+    """Troca `musicas` pelas versoes compactas e adiciona `included` ao resultado."""
+    compactas, included = separar_relacionados(musicas)
+    resultado['included'] = included
+    return compactas
+
+
+@api_v2_bp.route('/musicas', methods=['GET'])
+def listar_musicas():
+    """API v2: busca de musicas com albuns e artistas em `included`."""
+    limite = max(request.args.get('limite', 50, type=int) or 50, 1)
+    offset = max(request.args.get('offset', 0, type=int) or 0, 0)
+
+    resultado = MusicController.buscar_musicas(
+        request.args.get('q'),
+        limite,
+        offset,
+        cursor=request.args.get('cursor'),
+        incluir_total=request.args.get('incluir_total') == 'true',
+        ordem=request.args.get('ordem', 'relevancia'),
+    )
+    if resultado['success']:
+        resultado['musicas'] = _com_relacionados(resultado, resultado['musicas'])
+    return jsonify(resultado)
+
+
+@api_v2_bp.route('/musicas/populares', methods=['GET'])
+def musicas_populares():
+    """API v2: musicas mais populares com albuns e artistas em `included`."""
+    limite = max(request.args.get('limite', 20, type=int) or 20, 1)
+    resultado = MusicController.obter_musicas_populares(
+        limite,
+        tenant_id=current_user.tenant_id if current_user.is_authenticated else None,
+        janela=request.args.get('janela', 'sempre'),
+        genero=request.args.get('genero', '').strip() or None,
+    )
+    if resultado['success']:
+        resultado['musicas'] = _com_relacionados(resultado, resultado['musicas'])
+    return jsonify(resultado)
+
+
+@api_v2_bp.route('/playlists/<int:playlist_id>', methods=['GET'])
+@login_required
+def playlist_detalhes(playlist_id):
+    """API v2: playlist com faixas por referencia e albuns/artistas em `included`."""
+    resultado = PlaylistController.obter_playlist(
+        playlist_id,
+        current_user.id,
+        tenant_id=current_user.tenant_id,
+    )
+    if resultado['success']:
+        playlist = resultado['playlist']
+        playlist['musicas'] = _com_relacionados(resultado, playlist['musicas'])
+    return jsonify(resultado)
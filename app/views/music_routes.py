@@ -1,14 +1,17 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, abort, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 from app.controllers.music_controller import MusicController
-from app.models import Artist, Album
+from app.models import Album
 
 music_bp = Blueprint('music', __name__)
 
 @music_bp.route('/')
 def index():
     """Página inicial"""
-    resultado = MusicController.obter_musicas_populares(limite=10)
+    resultado = MusicController.obter_musicas_populares(
+        limite=10,
+        tenant_id=current_user.tenant_id if current_user.is_authenticated else None,
+    )
     musicas_populares = resultado.get('musicas', []) if resultado['success'] else []
     
     return render_template('index.html', musicas_populares=musicas_populares)
@@ -17,16 +20,28 @@ def index():
 def buscar():
     """Busca de músicas"""
     termo = request.args.get('q', '')
-    pagina = request.args.get('pagina', 1, type=int)
+    pagina = max(request.args.get('pagina', 1, type=int) or 1, 1)
+    cursor = request.args.get('cursor', '')
     limite = 20
-    offset = (pagina - 1) * limite
+    proximo_cursor = None
     
-    resultado = MusicController.buscar_musicas(termo, limite, offset)
+    if termo:
+        # Com termo a ordem e por relevancia: paginas por offset, total sempre exibido.
+        offset = (pagina - 1) * limite
+        resultado = MusicController.buscar_musicas(termo, limite, offset)
+    else:
+        # Navegacao do catalogo inteiro por cursor; o total so e contado na primeira pagina.
+        resultado = MusicController.buscar_musicas(
+            limite=limite,
+            cursor=cursor,
+            incluir_total=not cursor,
+        )
     
     if resultado['success']:
         musicas = resultado['musicas']
         total = resultado['total']
-        total_paginas = (total + limite - 1) // limite
+        proximo_cursor = resultado.get('next_cursor')
+        total_paginas = (total + limite - 1) // limite if total is not None else None
     else:
         musicas = []
         total = 0
@@ -38,7 +53,8 @@ def buscar():
                         termo=termo,
                         pagina=pagina,
                         total_paginas=total_paginas,
-                        total=total)
+                        total=total,
+                        proximo_cursor=proximo_cursor)
 
 @music_bp.route('/musica/<int:musica_id>')
 def musica_detalhes(musica_id):
@@ -55,10 +71,12 @@ def musica_detalhes(musica_id):
 @music_bp.route('/artista/<int:artista_id>')
 def artista_detalhes(artista_id):
     """Detalhes de um artista"""
-    artista = Artist.query.get_or_404(artista_id)
-    albuns = artista.albuns.all()
+    resultado = MusicController.obter_discografia(artista_id)
+    if not resultado['success']:
+        abort(404)
     
-    return render_template('artista_detalhes.html', artista=artista, albuns=albuns)
+    discografia = resultado['discografia']
+    return render_template('artista_detalhes.html', artista=discografia['artista'], albuns=discografia['albuns'])
 
 @music_bp.route('/album/<int:album_id>')
 def album_detalhes(album_id):
@@ -85,7 +103,7 @@ def player():
         return redirect(url_for('music.index'))
     
     # Registra reprodução
-    MusicController.registrar_reproducao(musica_id)
+    MusicController.registrar_reproducao(musica_id, current_user.id, current_user.tenant_id)
     
     musica = resultado['musica']
     return render_template('player.html', musica=musica)
\ No newline at end of file
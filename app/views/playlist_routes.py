@@ -1,4 +1,4 @@
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, current_app, flash, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 
 from app.controllers.playlist_controller import PlaylistController
@@ -44,7 +44,12 @@ def detalhes(playlist_id):
     """Detalhes de uma playlist."""
     usuario_id = current_user.id if current_user.is_authenticated else None
     tenant_id = current_user.tenant_id if current_user.is_authenticated else None
-    resultado = PlaylistController.obter_playlist(playlist_id, usuario_id, tenant_id=tenant_id)
+    resultado = PlaylistController.obter_playlist(
+        playlist_id,
+        usuario_id,
+        tenant_id=tenant_id,
+        limite_musicas=current_app.config.get('PLAYLIST_TRACKS_WINDOW', 100),
+    )
 
     if not resultado['success']:
         flash(resultado.get('message', 'Playlist nao encontrada'), 'error')
@@ -55,6 +60,35 @@ def detalhes(playlist_id):
     return render_template('playlist_detalhes.html', playlist=playlist, is_owner=is_owner)
 
 
+@playlist_bp.route('/<int:playlist_id>/faixas')
+def faixas(playlist_id):
+    """Proxima janela de faixas do detalhe da playlist (fragmento HTML)."""
+    usuario_id = current_user.id if current_user.is_authenticated else None
+    tenant_id = current_user.tenant_id if current_user.is_authenticated else None
+    try:
+        resultado = PlaylistController.obter_faixas_playlist(
+            playlist_id,
+            usuario_id,
+            tenant_id=tenant_id,
+            cursor=request.args.get('cursor'),
+            limite=current_app.config.get('PLAYLIST_TRACKS_WINDOW', 100),
+        )
+    except ValueError as e:
+        return str(e), 400
+
+    if not resultado['success']:
+        return resultado.get('message', 'Playlist nao encontrada'), 404
+
+    is_owner = current_user.is_authenticated and resultado['usuario_id'] == current_user.id
+    html = render_template(
+        '_faixas_playlist.html',
+        musicas=resultado['musicas'],
+        playlist_id=playlist_id,
+        is_owner=is_owner,
+    )
+    return html, 200, {'X-Next-Cursor': resultado['next_cursor'] or ''}
+
+
 @playlist_bp.route('/<int:playlist_id>/editar', methods=['GET', 'POST'])
 @login_required
 def editar(playlist_id):
@@ -0,0 +1,62 @@
+"""Tamanho e tempo de codificacao/decodificacao: jsonify x msgpack.
+
+Mede o caminho atual de `jsonify` (stdlib e FastJSONProvider) contra o
+msgpack servido com `Accept: application/msgpack`, sobre payloads de
+musicas no formato da API.
+
+Uso:
+    python benchmarks/api_formatos.py --itens 1000 --repeticoes 50
+"""
+import argparse
+import json
+import os
+import sys
+from timeit import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Importar `app` cria a aplicacao; o benchmark nao usa o banco.
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from flask import Flask  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+from app.services.json_provider import FastJSONProvider  # noqa: E402
+from app.services.negociacao import empacotar, msgpack  # noqa: E402
+from json_encoders import musica_dict  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--itens', type=int, default=1000)
+    parser.add_argument('--repeticoes', type=int, default=50)
+    args = parser.parse_args()
+
+    if msgpack is None:
+        sys.exit('msgpack nao instalado (pip install msgpack)')
+
+    payload = {'success': True, 'musicas': [musica_dict(i) for i in range(args.itens)], 'total': args.itens}
+
+    app = Flask(__name__)
+    padrao = DefaultJSONProvider(app)
+    rapido = FastJSONProvider(app)
+
+    formatos = [
+        ('jsonify (stdlib)', lambda: padrao.dumps(payload).encode('utf-8'), json.loads),
+        ('jsonify (FastJSONProvider)', lambda: rapido.dumps_bytes(payload), rapido.loads),
+        ('msgpack', lambda: empacotar(payload, rapido.default), msgpack.unpackb),
+    ]
+
+    print(f'{args.itens} musica(s), {args.repeticoes} repeticao(oes)')
+    print(f'  {"formato":<28} {"codificar":>10} {"decodificar":>12} {"bytes":>10}')
+    for nome, codificar, decodificar in formatos:
+        saida = codificar()
+        tempo_codificar = timeit(codificar, number=args.repeticoes) / args.repeticoes
+        tempo_decodificar = timeit(lambda: decodificar(saida), number=args.repeticoes) / args.repeticoes
+        print(
+            f'  {nome:<28} {tempo_codificar * 1000:8.2f} ms {tempo_decodificar * 1000:10.2f} ms'
+            f' {len(saida):10d}'
+        )
+
+
+if __name__ == '__main__':
+    main()
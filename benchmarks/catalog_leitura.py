@@ -0,0 +1,99 @@
+"""CPU e memoria por linha: listas do catalogo via ORM x CatalogReader.
+
+Popula um SQLite em memoria e compara, para a mesma consulta de musicas
+populares com album e artista, o caminho antigo (instancias de Music com
+joinedload + to_dict) e o CatalogReader (SELECT por colunas mapeado para
+MusicaResumo com __slots__).
+
+Uso:
+    python benchmarks/catalog_leitura.py --musicas 5000 --repeticoes 10
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+from timeit import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from sqlalchemy import insert  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app.extensions import db  # noqa: E402
+from app.models import Album, Artist, Music  # noqa: E402
+from app.services.catalog_reader import CatalogReader  # noqa: E402
+
+
+def popular(total_musicas):
+    db.session.execute(insert(Artist), [{'id': i, 'nome': f'Artista {i}'} for i in range(1, total_musicas // 60 + 2)])
+    db.session.execute(insert(Album), [
+        {'id': i, 'titulo': f'Album {i}', 'artista_id': i // 5 + 1, 'capa_url': f'/static/covers/{i}.jpg'}
+        for i in range(1, total_musicas // 12 + 2)
+    ])
+    db.session.execute(insert(Music), [
+        {
+            'titulo': f'Faixa {i}', 'album_id': i // 12 + 1, 'duracao': 180 + i % 240,
+            'arquivo_url': f'/static/music/{i}.mp3', 'numero_faixa': i % 12 + 1, 'visualizacoes': i * 37 % 100000,
+        }
+        for i in range(total_musicas)
+    ])
+    db.session.commit()
+
+
+def via_orm(limite):
+    query = Music.com_album_e_artista(Music.query).order_by(Music.visualizacoes.desc()).limit(limite)
+    musicas = [m.to_dict() for m in query]
+    db.session.expunge_all()
+    return musicas
+
+
+def via_reader(limite):
+    query = Music.query.order_by(Music.visualizacoes.desc()).limit(limite)
+    return [m.to_dict() for m in CatalogReader.musicas(query)]
+
+
+def carregar_orm(limite):
+    return Music.com_album_e_artista(Music.query).order_by(Music.visualizacoes.desc()).limit(limite).all()
+
+
+def carregar_reader(limite):
+    return CatalogReader.musicas(Music.query.order_by(Music.visualizacoes.desc()).limit(limite))
+
+
+def pico_memoria(funcao, limite):
+    db.session.expunge_all()
+    tracemalloc.start()
+    resultado = funcao(limite)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del resultado
+    db.session.expunge_all()
+    return pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--musicas', type=int, default=5000)
+    parser.add_argument('--repeticoes', type=int, default=10)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        popular(args.musicas)
+        limite = args.musicas
+
+        print(f'{limite} musica(s) por consulta, {args.repeticoes} repeticao(oes)')
+        print(f'  {"caminho":<32} {"us/linha":>9} {"memoria/linha":>14}')
+        for nome, completo, carregar in (
+            ('ORM (joinedload + to_dict)', via_orm, carregar_orm),
+            ('CatalogReader (__slots__)', via_reader, carregar_reader),
+        ):
+            segundos = timeit(lambda: completo(limite), number=args.repeticoes) / args.repeticoes
+            memoria = pico_memoria(carregar, limite)
+            print(f'  {nome:<32} {segundos / limite * 1e6:9.1f} {memoria / limite:11.0f} B')
+
+
+if __name__ == '__main__':
+    main()
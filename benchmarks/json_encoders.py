@@ -0,0 +1,98 @@
+"""Micro-benchmark dos encoders JSON sobre payloads de musicas.
+
+Compara o provider padrao do Flask (json da stdlib) com o FastJSONProvider
+(orjson, quando instalado) e mede o pico de memoria da lista completa contra
+a resposta em fluxo.
+
+Uso:
+    python benchmarks/json_encoders.py --itens 1000 --repeticoes 50
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+from timeit import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Importar `app` cria a aplicacao; o benchmark nao usa o banco.
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from flask import Flask  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+from app.services import json_provider  # noqa: E402
+from app.services.json_provider import FastJSONProvider, resposta_em_fluxo  # noqa: E402
+
+
+def musica_dict(indice):
+    """Mesmo formato de Music.to_dict() com album e artista."""
+    return {
+        'id': indice,
+        'titulo': f'Canção número {indice}',
+        'album_id': indice // 12 + 1,
+        'duracao': 180 + indice % 240,
+        'duracao_formatada': f'{(180 + indice % 240) // 60:02d}:{(180 + indice % 240) % 60:02d}',
+        'arquivo_url': f'/static/music/faixa_{indice}.mp3',
+        'numero_faixa': indice % 12 + 1,
+        'visualizacoes': indice * 37 % 100000,
+        'album': {
+            'id': indice // 12 + 1,
+            'titulo': f'Álbum {indice // 12 + 1}',
+            'capa_url': f'/static/covers/{indice // 12 + 1}.jpg',
+            'artista': {'id': indice // 60 + 1, 'nome': f'Artista {indice // 60 + 1}'},
+        },
+    }
+
+
+def medir_memoria(funcao):
+    tracemalloc.start()
+    funcao()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--itens', type=int, default=1000)
+    parser.add_argument('--repeticoes', type=int, default=50)
+    args = parser.parse_args()
+
+    payload = {'success': True, 'musicas': [musica_dict(i) for i in range(args.itens)], 'total': args.itens}
+
+    app = Flask(__name__)
+    padrao = DefaultJSONProvider(app)
+    rapido = FastJSONProvider(app)
+
+    print(f'{args.itens} musica(s), {args.repeticoes} repeticao(oes); orjson: {json_provider.orjson is not None}')
+    resultados = [
+        ('stdlib (DefaultJSONProvider)', lambda: padrao.dumps(payload)),
+        ('FastJSONProvider.dumps', lambda: rapido.dumps(payload)),
+        ('FastJSONProvider.dumps_bytes', lambda: rapido.dumps_bytes(payload)),
+    ]
+    base = None
+    for nome, funcao in resultados:
+        segundos = timeit(funcao, number=args.repeticoes) / args.repeticoes
+        base = base or segundos
+        saida = funcao()
+        tamanho = len(saida if isinstance(saida, bytes) else saida.encode('utf-8'))
+        print(f'  {nome:<30} {segundos * 1000:8.2f} ms  ({base / segundos:4.1f}x)  {tamanho} bytes')
+
+    app.json = rapido
+    with app.app_context():
+        def lista_completa():
+            musicas = [musica_dict(i) for i in range(args.itens)]
+            return b''.join(app.json.response({'success': True, 'musicas': musicas}).response)
+
+        def em_fluxo():
+            musicas = (musica_dict(i) for i in range(args.itens))
+            with app.test_request_context():
+                return b''.join(resposta_em_fluxo({'success': True, 'musicas': musicas}).response)
+
+        print('Pico de memoria (tracemalloc):')
+        print(f'  lista completa + jsonify      {medir_memoria(lista_completa) / 1024:8.1f} KiB')
+        print(f'  resposta em fluxo            {medir_memoria(em_fluxo) / 1024:8.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""015_add_album_aggregates
+
+Revision ID: 2b8e0d4f6a17
+Revises: 9d2f6b3e81c5
+Create Date: 2026-10-17 12:20:51.640833
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b8e0d4f6a17'
+down_revision = '9d2f6b3e81c5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('albuns', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('total_musicas', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('duracao_total', sa.Integer(), nullable=False, server_default='0'))
+
+    op.execute(
+        """
+        UPDATE albuns
+        SET total_musicas = (SELECT count(*) FROM musicas WHERE musicas.album_id = albuns.id),
+            duracao_total = (
+                SELECT coalesce(sum(musicas.duracao), 0) FROM musicas WHERE musicas.album_id = albuns.id
+            )
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('albuns', schema=None) as batch_op:
+        batch_op.drop_column('duracao_total')
+        batch_op.drop_column('total_musicas')
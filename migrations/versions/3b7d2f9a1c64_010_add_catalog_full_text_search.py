@@ -0,0 +1,81 @@
+"""010_add_catalog_full_text_search
+
+Revision ID: 3b7d2f9a1c64
+Revises: 8e23a6da75fd
+Create Date: 2026-10-17 09:12:41.208113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7d2f9a1c64'
+down_revision = '8e23a6da75fd'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+
+    if connection.dialect.name == 'postgresql':
+        op.add_column('musicas', sa.Column('busca_documento', postgresql.TSVECTOR(), nullable=True))
+        op.create_index(
+            'ix_musicas_busca_documento',
+            'musicas',
+            ['busca_documento'],
+            unique=False,
+            postgresql_using='gin',
+        )
+        connection.execute(
+            sa.text(
+                """
+                UPDATE musicas SET busca_documento =
+                    setweight(to_tsvector('portuguese', coalesce(musicas.titulo, '')), 'A') ||
+                    setweight(to_tsvector('portuguese', coalesce(albuns.titulo, '')), 'B') ||
+                    setweight(to_tsvector('portuguese', coalesce(artistas.nome, '')), 'B')
+                FROM albuns JOIN artistas ON artistas.id = albuns.artista_id
+                WHERE albuns.id = musicas.album_id
+                """
+            )
+        )
+        return
+
+    with op.batch_alter_table('musicas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('busca_documento', sa.Text(), nullable=True))
+
+    if connection.dialect.name == 'sqlite':
+        connection.execute(
+            sa.text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS musicas_fts USING fts5("
+                "titulo, album, artista, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        )
+        connection.execute(
+            sa.text(
+                """
+                INSERT INTO musicas_fts (rowid, titulo, album, artista)
+                SELECT musicas.id, musicas.titulo, albuns.titulo, artistas.nome
+                FROM musicas
+                JOIN albuns ON albuns.id = musicas.album_id
+                JOIN artistas ON artistas.id = albuns.artista_id
+                """
+            )
+        )
+
+
+def downgrade():
+    connection = op.get_bind()
+
+    if connection.dialect.name == 'postgresql':
+        op.drop_index('ix_musicas_busca_documento', table_name='musicas')
+        op.drop_column('musicas', 'busca_documento')
+        return
+
+    if connection.dialect.name == 'sqlite':
+        connection.execute(sa.text('DROP TABLE IF EXISTS musicas_fts'))
+
+    with op.batch_alter_table('musicas', schema=None) as batch_op:
+        batch_op.drop_column('busca_documento')
@@ -0,0 +1,36 @@
+"""018_add_user_counters
+
+Revision ID: 4a7d1e9c3b58
+Revises: e3b5c8a1d940
+Create Date: 2026-10-17 13:40:27.903116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a7d1e9c3b58'
+down_revision = 'e3b5c8a1d940'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('usuarios', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('total_playlists', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('total_favoritos', sa.Integer(), nullable=False, server_default='0'))
+
+    op.execute(
+        """
+        UPDATE usuarios
+        SET total_playlists = (SELECT count(*) FROM playlists WHERE playlists.usuario_id = usuarios.id),
+            total_favoritos = (SELECT count(*) FROM favoritos WHERE favoritos.usuario_id = usuarios.id)
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('usuarios', schema=None) as batch_op:
+        batch_op.drop_column('total_favoritos')
+        batch_op.drop_column('total_playlists')
@@ -0,0 +1,65 @@
+"""020_create_play_events
+
+Revision ID: 5c9e2a7f3d14
+Revises: b81f4c2d7a63
+Create Date: 2026-10-17 16:05:31.640912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c9e2a7f3d14'
+down_revision = 'b81f4c2d7a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'reproducoes',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+        sa.Column('musica_id', sa.Integer(), nullable=False),
+        sa.Column('usuario_id', sa.Integer(), nullable=True),
+        sa.Column('tenant_id', sa.Integer(), nullable=False),
+        sa.Column('tocado_em', sa.DateTime(), nullable=False),
+        sa.Column('quantidade', sa.SmallInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['musica_id'], ['musicas.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['usuario_id'], ['usuarios.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    with op.batch_alter_table('reproducoes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_reproducoes_tocado_em'), ['tocado_em'], unique=False)
+
+    op.create_table(
+        'reproducoes_agregadas',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('periodo', sa.String(length=4), nullable=False),
+        sa.Column('inicio', sa.DateTime(), nullable=False),
+        sa.Column('tenant_id', sa.Integer(), nullable=False),
+        sa.Column('musica_id', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['musica_id'], ['musicas.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('periodo', 'inicio', 'tenant_id', 'musica_id', name='uq_reproducoes_agregadas_bucket'),
+    )
+    with op.batch_alter_table('reproducoes_agregadas', schema=None) as batch_op:
+        batch_op.create_index(
+            'ix_reproducoes_agregadas_periodo_tenant_inicio', ['periodo', 'tenant_id', 'inicio'], unique=False
+        )
+        batch_op.create_index(batch_op.f('ix_reproducoes_agregadas_musica_id'), ['musica_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('reproducoes_agregadas', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_reproducoes_agregadas_musica_id'))
+        batch_op.drop_index('ix_reproducoes_agregadas_periodo_tenant_inicio')
+
+    op.drop_table('reproducoes_agregadas')
+    with op.batch_alter_table('reproducoes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_reproducoes_tocado_em'))
+
+    op.drop_table('reproducoes')
@@ -0,0 +1,95 @@
+"""012_add_normalized_catalog_names
+
+Revision ID: 5e0a9c3d7f12
+Revises: a81c4e06d2b9
+Create Date: 2026-10-17 11:26:05.390417
+
+"""
+import re
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e0a9c3d7f12'
+down_revision = 'a81c4e06d2b9'
+branch_labels = None
+depends_on = None
+
+_COLUNAS = (
+    ('musicas', 'titulo', 'titulo_normalizado', 150),
+    ('albuns', 'titulo', 'titulo_normalizado', 150),
+    ('artistas', 'nome', 'nome_normalizado', 100),
+)
+
+
+def _normalizar(valor):
+    if not valor:
+        return ''
+    decomposto = unicodedata.normalize('NFKD', valor)
+    sem_acentos = ''.join(char for char in decomposto if not unicodedata.combining(char))
+    return ' '.join(re.findall(r'\w+', sem_acentos.lower()))
+
+
+def upgrade():
+    connection = op.get_bind()
+    dialeto = connection.dialect.name
+
+    for tabela, _, destino, tamanho in _COLUNAS:
+        with op.batch_alter_table(tabela, schema=None) as batch_op:
+            batch_op.add_column(sa.Column(destino, sa.String(length=tamanho), nullable=True))
+
+    for tabela, origem, destino, _ in _COLUNAS:
+        linhas = connection.execute(sa.text(f'SELECT id, {origem} FROM {tabela}')).fetchall()
+        if linhas:
+            connection.execute(
+                sa.text(f'UPDATE {tabela} SET {destino} = :valor WHERE id = :id'),
+                [{'id': linha[0], 'valor': _normalizar(linha[1])} for linha in linhas],
+            )
+
+    if dialeto == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for tabela, _, destino, _ in _COLUNAS:
+            op.execute(
+                f'CREATE INDEX ix_{tabela}_{destino}_trgm ON {tabela} USING gin ({destino} gin_trgm_ops)'
+            )
+        connection.execute(
+            sa.text(
+                """
+                UPDATE musicas SET busca_documento =
+                    setweight(to_tsvector('portuguese', coalesce(musicas.titulo_normalizado, '')), 'A') ||
+                    setweight(to_tsvector('portuguese', coalesce(albuns.titulo_normalizado, '')), 'B') ||
+                    setweight(to_tsvector('portuguese', coalesce(artistas.nome_normalizado, '')), 'B')
+                FROM albuns JOIN artistas ON artistas.id = albuns.artista_id
+                WHERE albuns.id = musicas.album_id
+                """
+            )
+        )
+    elif dialeto == 'sqlite':
+        connection.execute(sa.text('DELETE FROM musicas_fts'))
+        connection.execute(
+            sa.text(
+                """
+                INSERT INTO musicas_fts (rowid, titulo, album, artista)
+                SELECT musicas.id, musicas.titulo_normalizado, albuns.titulo_normalizado,
+                       artistas.nome_normalizado
+                FROM musicas
+                JOIN albuns ON albuns.id = musicas.album_id
+                JOIN artistas ON artistas.id = albuns.artista_id
+                """
+            )
+        )
+
+
+def downgrade():
+    connection = op.get_bind()
+
+    if connection.dialect.name == 'postgresql':
+        for tabela, _, destino, _ in _COLUNAS:
+            op.execute(f'DROP INDEX IF EXISTS ix_{tabela}_{destino}_trgm')
+
+    for tabela, _, destino, _ in reversed(_COLUNAS):
+        with op.batch_alter_table(tabela, schema=None) as batch_op:
+            batch_op.drop_column(destino)
@@ -0,0 +1,32 @@
+"""016_create_artist_discographies
+
+Revision ID: 6f3a1c8e5b20
+Revises: 2b8e0d4f6a17
+Create Date: 2026-10-17 12:58:12.907114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f3a1c8e5b20'
+down_revision = '2b8e0d4f6a17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Preenchida sob demanda na primeira visita a cada artista.
+    op.create_table(
+        'artista_discografias',
+        sa.Column('artista_id', sa.Integer(), nullable=False),
+        sa.Column('payload_json', sa.Text(), nullable=False),
+        sa.Column('atualizado_em', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.ForeignKeyConstraint(['artista_id'], ['artistas.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('artista_id'),
+    )
+
+
+def downgrade():
+    op.drop_table('artista_discografias')
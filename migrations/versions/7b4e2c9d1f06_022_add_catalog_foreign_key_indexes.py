@@ -0,0 +1,26 @@
+"""022_add_catalog_foreign_key_indexes
+
+Revision ID: 7b4e2c9d1f06
+Revises: 9d3f6b1e8a27
+Create Date: 2026-10-17 23:52:41.208113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b4e2c9d1f06'
+down_revision = '9d3f6b1e8a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_musicas_album_id', 'musicas', ['album_id'], unique=False)
+    op.create_index('ix_albuns_artista_id', 'albuns', ['artista_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_albuns_artista_id', table_name='albuns')
+    op.drop_index('ix_musicas_album_id', table_name='musicas')
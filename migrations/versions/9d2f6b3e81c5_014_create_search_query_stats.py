@@ -0,0 +1,39 @@
+"""014_create_search_query_stats
+
+Revision ID: 9d2f6b3e81c5
+Revises: c7e14b92d0a3
+Create Date: 2026-10-17 11:48:05.102377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2f6b3e81c5'
+down_revision = 'c7e14b92d0a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'busca_estatisticas',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('termo', sa.String(length=150), nullable=False),
+        sa.Column('dia', sa.Date(), nullable=False),
+        sa.Column('total_buscas', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_sem_resultado', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('soma_resultados', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('soma_latencia_ms', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('max_latencia_ms', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('ultima_busca_em', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('termo', 'dia', name='uq_busca_estatisticas_termo_dia'),
+    )
+    op.create_index('ix_busca_estatisticas_dia', 'busca_estatisticas', ['dia'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_busca_estatisticas_dia', table_name='busca_estatisticas')
+    op.drop_table('busca_estatisticas')
@@ -0,0 +1,45 @@
+"""021_create_charts
+
+Revision ID: 9d3f6b1e8a27
+Revises: 5c9e2a7f3d14
+Create Date: 2026-10-17 18:42:09.317245
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3f6b1e8a27'
+down_revision = '5c9e2a7f3d14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'paradas',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tenant_id', sa.Integer(), nullable=False),
+        sa.Column('janela', sa.String(length=6), nullable=False),
+        sa.Column('genero', sa.String(length=50), nullable=False),
+        sa.Column('posicao', sa.Integer(), nullable=False),
+        sa.Column('musica_id', sa.Integer(), nullable=False),
+        sa.Column('pontuacao', sa.Float(), nullable=False),
+        sa.Column('calculado_em', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['musica_id'], ['musicas.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint(
+            'tenant_id', 'janela', 'genero', 'posicao', name='uq_paradas_tenant_janela_genero_posicao'
+        ),
+    )
+    with op.batch_alter_table('paradas', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_paradas_musica_id'), ['musica_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('paradas', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_paradas_musica_id'))
+
+    op.drop_table('paradas')
@@ -0,0 +1,24 @@
+"""011_add_musicas_titulo_id_index
+
+Revision ID: a81c4e06d2b9
+Revises: 3b7d2f9a1c64
+Create Date: 2026-10-17 10:03:17.554920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a81c4e06d2b9'
+down_revision = '3b7d2f9a1c64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_musicas_titulo_id', 'musicas', ['titulo', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_musicas_titulo_id', table_name='musicas')
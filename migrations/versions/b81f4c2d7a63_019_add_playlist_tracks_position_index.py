@@ -0,0 +1,26 @@
+"""019_add_playlist_tracks_position_index
+
+Revision ID: b81f4c2d7a63
+Revises: 4a7d1e9c3b58
+Create Date: 2026-10-17 15:12:44.218530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81f4c2d7a63'
+down_revision = '4a7d1e9c3b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('playlist_musicas', schema=None) as batch_op:
+        batch_op.create_index('ix_playlist_musicas_playlist_posicao', ['playlist_id', 'posicao', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('playlist_musicas', schema=None) as batch_op:
+        batch_op.drop_index('ix_playlist_musicas_playlist_posicao')
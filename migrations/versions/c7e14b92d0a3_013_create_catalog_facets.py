@@ -0,0 +1,39 @@
+"""013_create_catalog_facets
+
+Revision ID: c7e14b92d0a3
+Revises: 5e0a9c3d7f12
+Create Date: 2026-10-17 11:12:40.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e14b92d0a3'
+down_revision = '5e0a9c3d7f12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'catalogo_facetas',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('genero', sa.String(length=50), nullable=True),
+        sa.Column('ano_lancamento', sa.Integer(), nullable=True),
+        sa.Column('faixa_duracao', sa.String(length=20), nullable=True),
+        sa.Column('total_musicas', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('atualizado_em', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_artistas_genero', 'artistas', ['genero'], unique=False)
+    op.create_index('ix_albuns_ano_lancamento', 'albuns', ['ano_lancamento'], unique=False)
+    # As contagens sao preenchidas pelo FacetService na primeira leitura
+    # (ou com `flask refresh-facets`).
+
+
+def downgrade():
+    op.drop_index('ix_albuns_ano_lancamento', table_name='albuns')
+    op.drop_index('ix_artistas_genero', table_name='artistas')
+    op.drop_table('catalogo_facetas')
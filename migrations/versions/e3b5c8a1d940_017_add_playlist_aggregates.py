@@ -0,0 +1,43 @@
+"""017_add_playlist_aggregates
+
+Revision ID: e3b5c8a1d940
+Revises: 6f3a1c8e5b20
+Create Date: 2026-10-17 13:05:12.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b5c8a1d940'
+down_revision = '6f3a1c8e5b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('playlists', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('total_musicas', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('duracao_total', sa.Integer(), nullable=False, server_default='0'))
+
+    op.execute(
+        """
+        UPDATE playlists
+        SET total_musicas = (
+                SELECT count(*) FROM playlist_musicas WHERE playlist_musicas.playlist_id = playlists.id
+            ),
+            duracao_total = (
+                SELECT coalesce(sum(musicas.duracao), 0)
+                FROM playlist_musicas
+                JOIN musicas ON musicas.id = playlist_musicas.musica_id
+                WHERE playlist_musicas.playlist_id = playlists.id
+            )
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('playlists', schema=None) as batch_op:
+        batch_op.drop_column('duracao_total')
+        batch_op.drop_column('total_musicas')
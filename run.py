@@ -6,6 +6,8 @@ import wave
 from datetime import datetime, timezone
 from pathlib import Path
 
+import click
+
 from app import create_app
 from app.extensions import db
 from app.models import (
@@ -22,6 +24,12 @@ from app.models import (
     UsageEvent,
     User,
 )
+from app.services.catalog_counters import CatalogCounters
+from app.services.chart_service import ChartService
+from app.services.facet_service import FacetService
+from app.services.play_events import PlayEvents
+from app.services.search_analytics import SearchAnalytics
+from app.services.search_service import CatalogSearchService
 
 app = create_app()
 UTC = timezone.utc
@@ -521,5 +529,80 @@ def bootstrap_deploy():
     print(f'Stripe price IDs sincronizados: {stripe_ids_atualizados}')
 
 
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    """Reconstroi o indice de busca textual do catalogo (tsvector/FTS5)."""
+    total = CatalogSearchService.reconstruir_indice()
+    if total:
+        print(f'Indice de busca reconstruido para {total} musica(s).')
+    else:
+        print('Nenhuma musica indexada. Verifique se as migrations foram aplicadas.')
+
+
+@app.cli.command('refresh-facets')
+def refresh_facets():
+    """Recalcula as contagens de facetas do catalogo (genero x ano x duracao)."""
+    total = FacetService.recalcular()
+    print(f'Facetas recalculadas: {total} combinacao(oes).')
+
+
+@app.cli.command('repair-album-aggregates')
+def repair_album_aggregates():
+    """Recalcula total de faixas e duracao total dos albuns a partir das musicas."""
+    corrigidos = CatalogCounters.recalcular_albuns()
+    print(f'Agregados de albuns corrigidos: {corrigidos}.')
+
+
+@app.cli.command('repair-playlist-aggregates')
+def repair_playlist_aggregates():
+    """Recalcula total de faixas e duracao total das playlists a partir das faixas."""
+    corrigidas = CatalogCounters.recalcular_playlists()
+    print(f'Agregados de playlists corrigidos: {corrigidas}.')
+
+
+@app.cli.command('repair-user-counters')
+def repair_user_counters():
+    """Recalcula total de playlists e de favoritos de cada usuario."""
+    corrigidos = CatalogCounters.recalcular_usuarios()
+    print(f'Contadores de usuarios corrigidos: {corrigidos}.')
+
+
+@app.cli.command('rollup-plays')
+@click.option('--horas', default=48, show_default=True, help='Janela de eventos reagregada.')
+def rollup_plays(horas):
+    """Refaz os agregados de reproducoes por hora/dia e aplica a retencao dos eventos."""
+    PlayEvents.buffer(app).descarregar()
+    linhas = PlayEvents.reconstruir_agregados(horas)
+    print(f'Agregados de reproducoes gravados: {linhas}.')
+
+
+@app.cli.command('refresh-charts')
+@click.option('--tenant-id', type=int, default=None, help='Recalcula so este tenant.')
+def refresh_charts(tenant_id):
+    """Recalcula as paradas de populares (dia, semana e sempre, geral e por genero)."""
+    PlayEvents.buffer(app).descarregar()
+    posicoes = ChartService.recalcular(tenant_id)
+    print(f'Paradas recalculadas: {posicoes} posicao(oes).')
+
+
+@app.cli.command('search-report')
+@click.option('--dias', default=7, show_default=True, help='Janela de dias analisada.')
+@click.option('--limite', default=20, show_default=True, help='Termos por lista.')
+def search_report(dias, limite):
+    """Relatorio das buscas mais frequentes e das que nao retornaram resultado."""
+    SearchAnalytics.buffer(app).descarregar()
+
+    print(f'Buscas mais frequentes (ultimos {dias} dias):')
+    for linha in SearchAnalytics.top_termos(dias, limite):
+        print(
+            f"  {linha['buscas']:>6}x  {linha['termo']}  "
+            f"(media {linha['media_resultados']:.1f} resultado(s), {linha['media_latencia_ms']:.1f} ms)"
+        )
+
+    print(f'Buscas sem resultado (ultimos {dias} dias):')
+    for linha in SearchAnalytics.termos_sem_resultado(dias, limite):
+        print(f"  {linha['sem_resultado']:>6}x  {linha['termo']}")
+
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -1,17 +1,36 @@
 import json
 import sys
+import time
 import unittest
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
+from sqlalchemy import event
+
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from app import create_app
 from app.controllers.auth_controller import AuthController
+from app.controllers.music_controller import MusicController
 from app.extensions import db
-from app.models import Album, Artist, Music, Plan, Playlist, Subscription, Tenant, User
+from app.models import (
+    Album, Artist, ArtistDiscography, CatalogFacet, ChartEntry, Music, Plan, PlayEvent, PlayRollup, Playlist,
+    SearchQueryStat, Subscription, Tenant, User,
+)
+from app.services import chart_service, facet_service, suggestion_service
+from app.services.catalog_counters import CatalogCounters
+from app.services.catalog_reader import CatalogReader, MusicaResumo
+from app.services.chart_service import ChartService
+from app.services.facet_service import FacetService
+from app.services.json_provider import resposta_em_fluxo
+from app.services.negociacao import msgpack
+from app.services.play_counter import PlayCounter
+from app.services.play_events import PlayEvents
+from app.services.result_cache import search_cache
+from app.services.search_analytics import SearchAnalytics
+from app.services.search_service import CatalogSearchService
 
 UTC = timezone.utc
 
@@ -34,6 +53,32 @@ class ApplicationApiTestCase(unittest.TestCase):
         'test_webhook_invalido_retorna_erro_controlado': 'Valida falha de webhook invalido',
         'test_reset_token_expirado_bloqueia_redefinicao': 'Valida bloqueio para token de reset expirado',
         'test_downgrade_para_free_funciona': 'Valida downgrade de Pro para Free',
+        'test_busca_textual_ordena_por_relevancia': 'Valida ranking da busca textual priorizando o titulo da faixa',
+        'test_indice_de_busca_acompanha_alteracoes_do_catalogo': 'Valida sincronizacao do indice de busca em update/delete',
+        'test_paginacao_por_cursor_em_api_musicas': 'Valida paginacao por cursor (titulo, id) em /api/musicas',
+        'test_busca_ignora_acentos_e_tolera_erro_de_digitacao': 'Valida busca sem acentos e busca aproximada por trigramas',
+        'test_sugestoes_por_prefixo_acompanham_catalogo': 'Valida autocomplete por prefixo e atualizacao incremental do indice',
+        'test_cache_de_busca_conta_acertos_e_invalida_em_escritas': 'Valida cache de busca por termo normalizado e invalidacao em escritas',
+        'test_navegacao_facetada_retorna_contagens_por_faceta': 'Valida filtros por genero/ano/duracao e contagens pre-calculadas',
+        'test_ranking_combina_correspondencia_e_popularidade': 'Valida ranking por tipo de correspondencia com desempate por popularidade',
+        'test_estatisticas_de_busca_gravadas_em_lote_e_aquecimento': 'Valida agregado de buscas em lote, relatorio e aquecimento do cache',
+        'test_listas_de_musicas_usam_numero_fixo_de_consultas': 'Valida carregamento antecipado de album/artista nas listas (sem N+1)',
+        'test_agregados_de_album_acompanham_faixas': 'Valida total de faixas/duracao do album mantidos no flush e reparo',
+        'test_discografia_materializada_do_artista': 'Valida pagina do artista servida da discografia pre-calculada e invalidacao',
+        'test_detalhe_da_playlist_em_consulta_unica': 'Valida faixas e totais da playlist carregados em uma consulta',
+        'test_contadores_da_playlist_acompanham_faixas': 'Valida contadores de faixas/duracao da playlist e listagem sem agregacao',
+        'test_perfil_usa_contadores_do_usuario': 'Valida contadores de playlists/favoritos do usuario sem COUNT no perfil',
+        'test_listas_grandes_sao_transmitidas_em_fluxo': 'Valida resposta em fluxo igual a do jsonify para listas grandes',
+        'test_fields_limita_campos_e_consultas': 'Valida ?fields= podando a resposta e as cargas de album/faixas',
+        'test_api_v2_envia_relacionados_em_included': 'Valida formato v2 com albuns/artistas deduplicados em included',
+        'test_api_negocia_msgpack': 'Valida respostas e corpos msgpack na API com JSON como padrao',
+        'test_leitura_catalogo_sem_orm': 'Valida listas do catalogo lidas por colunas com o mesmo formato do ORM',
+        'test_consulta_em_lote_por_ids': 'Valida ?ids= de musicas, albuns e artistas na ordem pedida com ausentes',
+        'test_faixas_da_playlist_em_janelas': 'Valida faixas da playlist paginadas por posicao na API e no detalhe',
+        'test_status_em_lote_de_favoritos_e_playlists': 'Valida status de favoritos/playlists em lote e checagens com EXISTS',
+        'test_reproducoes_gravadas_em_lote': 'Valida contador de reproducoes em memoria gravado com UPDATE atomico em lote',
+        'test_log_de_reproducoes_e_agregados': 'Valida log de reproducoes em lote, agregados por hora/dia e retencao',
+        'test_paradas_de_populares_por_janela_e_genero': 'Valida paradas pre-calculadas com decaimento por tenant, janela e genero',
     }
 
     def setUp(self):
@@ -55,6 +100,9 @@ class ApplicationApiTestCase(unittest.TestCase):
         self.client = self.app.test_client()
 
     def tearDown(self):
+        SearchAnalytics.buffer().descarregar()
+        PlayCounter.buffer().descarregar()
+        PlayEvents.buffer().descarregar()
         db.session.remove()
         db.drop_all()
         self.ctx.pop()
@@ -461,6 +509,1140 @@ class ApplicationApiTestCase(unittest.TestCase):
         self.assertEqual(assinatura.status, 'active')
         print('[APROVADO] Downgrade para Free aplicado com sucesso.')
 
+    def test_busca_textual_ordena_por_relevancia(self):
+        self._describe_test()
+        album = Album.query.first()
+        db.session.add(
+            Music(
+                titulo='Teste de Som',
+                album_id=album.id,
+                arquivo_url='/static/music/teste-de-som.mp3',
+                duracao=180,
+                numero_faixa=3,
+            )
+        )
+        db.session.commit()
+
+        response = self.client.get('/api/musicas?q=teste')
+        self.assertEqual(response.status_code, 200)
+
+        payload = response.get_json()
+        self.assertTrue(payload['success'])
+        self.assertEqual(payload['total'], 3)
+        self.assertEqual(payload['musicas'][0]['titulo'], 'Teste de Som')
+        print('[APROVADO] Faixa com termo no titulo ficou a frente das que casaram pelo album.')
+
+    def test_indice_de_busca_acompanha_alteracoes_do_catalogo(self):
+        self._describe_test()
+        musica = Music.query.filter_by(titulo='Primeira Musica').first()
+
+        resultado = MusicController.atualizar_musica(musica.id, {'titulo': 'Abertura Sinfonica'})
+        self.assertTrue(resultado['success'])
+        self.assertEqual(MusicController.buscar_musicas('sinfonica')['total'], 1)
+        self.assertEqual(MusicController.buscar_musicas('primeira')['total'], 0)
+
+        artista = Artist.query.first()
+        artista.nome = 'Banda Renomeada'
+        db.session.commit()
+        self.assertEqual(MusicController.buscar_musicas('renomeada')['total'], 2)
+
+        # Troca de album pela relacao, sem tocar em album_id.
+        outro_artista = Artist(nome='Orquestra Noturna', genero='Classica')
+        db.session.add(outro_artista)
+        db.session.flush()
+        outro_album = Album(titulo='Coletanea', artista_id=outro_artista.id)
+        db.session.add(outro_album)
+        db.session.commit()
+        segunda = Music.query.filter_by(titulo='Segunda Faixa').first()
+        db.session.commit()
+        segunda.album = outro_album
+        db.session.commit()
+        documento = db.session.execute(
+            db.text('SELECT album, artista FROM musicas_fts WHERE rowid = :id'), {'id': segunda.id}
+        ).one()
+        self.assertEqual(tuple(documento), ('coletanea', 'orquestra noturna'))
+
+        resultado = MusicController.deletar_musica(musica.id)
+        self.assertTrue(resultado['success'])
+        self.assertEqual(MusicController.buscar_musicas('sinfonica')['total'], 0)
+        print('[APROVADO] Indice de busca refletiu update de faixa, rename de artista, troca de album e delete.')
+
+    def test_paginacao_por_cursor_em_api_musicas(self):
+        self._describe_test()
+        primeira = self.client.get('/api/musicas?cursor=&limite=1&incluir_total=true').get_json()
+        self.assertTrue(primeira['success'])
+        self.assertEqual(primeira['total'], 2)
+        self.assertEqual([m['titulo'] for m in primeira['musicas']], ['Primeira Musica'])
+        self.assertTrue(primeira['next_cursor'])
+
+        segunda = self.client.get(f"/api/musicas?cursor={primeira['next_cursor']}&limite=1").get_json()
+        self.assertTrue(segunda['success'])
+        self.assertIsNone(segunda['total'])
+        self.assertEqual([m['titulo'] for m in segunda['musicas']], ['Segunda Faixa'])
+        self.assertIsNone(segunda['next_cursor'])
+
+        invalido = self.client.get('/api/musicas?cursor=nao-e-um-cursor').get_json()
+        self.assertFalse(invalido['success'])
+        self.assertIn('cursor', invalido['message'].lower())
+        print('[APROVADO] Cursor percorreu o catalogo sem offset e rejeitou cursor invalido.')
+
+    def test_busca_ignora_acentos_e_tolera_erro_de_digitacao(self):
+        self._describe_test()
+        album = Album.query.first()
+        db.session.add(
+            Music(
+                titulo='Manha de Domingo',
+                album_id=album.id,
+                arquivo_url='/static/music/manha.mp3',
+                duracao=210,
+                numero_faixa=3,
+            )
+        )
+        db.session.commit()
+
+        com_acento = self.client.get('/api/musicas?q=manhã').get_json()
+        self.assertEqual([m['titulo'] for m in com_acento['musicas']], ['Manha de Domingo'])
+
+        com_erro = self.client.get('/api/musicas?q=domnigo').get_json()
+        self.assertTrue(com_erro['success'])
+        self.assertEqual(com_erro['musicas'][0]['titulo'], 'Manha de Domingo')
+
+        sem_relacao = self.client.get('/api/musicas?q=xyzzy').get_json()
+        self.assertEqual(sem_relacao['total'], 0)
+
+        # Com resultado no indice textual nao ha consulta extra para decidir pela aproximada.
+        search_cache().limpar()
+        resultado, consultas = self._contar_consultas(lambda: MusicController.buscar_musicas('domingo'))
+        self.assertEqual(resultado['total'], 1)
+        self.assertEqual(consultas, 2, self.ultimas_consultas)
+        print('[APROVADO] Busca encontrou a faixa com acento e com erro de digitacao.')
+
+    def test_sugestoes_por_prefixo_acompanham_catalogo(self):
+        self._describe_test()
+        resposta = self.client.get('/api/musicas/sugestoes?prefix=pri').get_json()
+        self.assertTrue(resposta['success'])
+        self.assertEqual([(s['tipo'], s['nome']) for s in resposta['sugestoes']], [('musica', 'Primeira Musica')])
+
+        resposta = self.client.get('/api/musicas/sugestoes?prefix=TESTE').get_json()
+        self.assertEqual({s['tipo'] for s in resposta['sugestoes']}, {'album', 'artista'})
+
+        musica = Music.query.filter_by(titulo='Segunda Faixa').first()
+        musica.titulo = 'Manhã de Domingo'
+        db.session.commit()
+
+        resposta = self.client.get('/api/musicas/sugestoes?prefix=dom').get_json()
+        self.assertEqual([s['nome'] for s in resposta['sugestoes']], ['Manhã de Domingo'])
+        resposta = self.client.get('/api/musicas/sugestoes?prefix=seg').get_json()
+        self.assertEqual(resposta['sugestoes'], [])
+
+        # Indice vencido com outra thread reconstruindo: responde com o anterior, sem consultas.
+        self.app.config['SUGGESTIONS_REFRESH_SECONDS'] = 0
+        with suggestion_service._reconstrucao_lock:
+            sugestoes, consultas = self._contar_consultas(lambda: suggestion_service.SuggestionService.sugerir('dom'))
+        self.assertEqual(consultas, 0)
+        self.assertEqual([s['nome'] for s in sugestoes], ['Manhã de Domingo'])
+
+        # Cada prefixo guarda so os mais populares; remover um deles traz o seguinte.
+        indice = suggestion_service.PrefixIndex()
+        indice.carregar([('musica', i, f'Cancao numero {i}', i) for i in range(60)])
+        self.assertEqual([s['id'] for s in indice.buscar('can', 3)], [59, 58, 57])
+        indice.remover('musica', 59)
+        self.assertEqual([s['id'] for s in indice.buscar('can', 3)], [58, 57, 56])
+        self.assertEqual(len(indice.buscar('numero', 100)), indice.LIMITE_MAXIMO)
+        self.assertEqual([s['id'] for s in indice.buscar('cancao numero 12', 5)], [12])
+        indice.buscar('ca', 2).clear()
+        self.assertEqual(len(indice.buscar('ca', 2)), 2)
+        print('[APROVADO] Sugestoes por prefixo refletiram a alteracao do catalogo.')
+
+    def test_cache_de_busca_conta_acertos_e_invalida_em_escritas(self):
+        self._describe_test()
+        primeira = self.client.get('/api/musicas?q=Primeira').get_json()
+        repetida = self.client.get('/api/musicas?q=  PRIMEIRA ').get_json()
+        self.assertEqual(primeira, repetida)
+
+        cache = self.client.get('/api/musicas/busca/cache').get_json()['cache']
+        self.assertEqual((cache['hits'], cache['misses']), (1, 1))
+
+        # Alterar o resultado devolvido nao altera o que esta no cache.
+        alterado = MusicController.buscar_musicas('primeira')
+        alterado['musicas'][0]['titulo'] = 'Alterada'
+        alterado['musicas'].clear()
+        self.assertEqual(MusicController.buscar_musicas('primeira')['musicas'][0]['titulo'], 'Primeira Musica')
+
+        album = Album.query.first()
+        resultado = MusicController.criar_musica(
+            {'titulo': 'Primeira Chuva', 'album_id': album.id, 'arquivo_url': '/static/music/chuva.mp3'}
+        )
+        self.assertTrue(resultado['success'])
+
+        depois = self.client.get('/api/musicas?q=primeira').get_json()
+        self.assertEqual(depois['total'], 2)
+        cache = self.client.get('/api/musicas/busca/cache').get_json()['cache']
+        self.assertEqual((cache['hits'], cache['misses']), (2, 3))
+
+        # Renomear o album (ou o artista) tambem invalida: o resultado traz os nomes deles.
+        album.titulo = 'Album Renomeado'
+        db.session.commit()
+        renomeada = self.client.get('/api/musicas?q=primeira').get_json()
+        self.assertEqual({m['album']['titulo'] for m in renomeada['musicas']}, {'Album Renomeado'})
+        artista = db.session.get(Artist, album.artista_id)
+        artista.nome = 'Artista Renomeado'
+        db.session.commit()
+        renomeada = self.client.get('/api/musicas?q=primeira').get_json()
+        self.assertEqual({m['album']['artista']['nome'] for m in renomeada['musicas']}, {'Artista Renomeado'})
+        print('[APROVADO] Cache reaproveitou a busca normalizada e foi invalidado pela escrita.')
+
+    def test_navegacao_facetada_retorna_contagens_por_faceta(self):
+        self._describe_test()
+        artista = Artist(nome='Artista Jazz', genero='Jazz')
+        db.session.add(artista)
+        db.session.flush()
+        album = Album(titulo='Album Jazz', artista_id=artista.id, ano_lancamento=1959)
+        db.session.add(album)
+        db.session.flush()
+        db.session.add(
+            Music(titulo='So What', album_id=album.id, arquivo_url='/static/music/so-what.mp3', duracao=545)
+        )
+        db.session.commit()
+
+        resposta = self.client.get('/api/musicas/navegar').get_json()
+        self.assertTrue(resposta['success'])
+        self.assertEqual(resposta['total'], 3)
+        generos = {f['valor']: f['total'] for f in resposta['facetas']['genero']}
+        self.assertEqual(generos, {'Jazz': 1, 'Rock': 2})
+        duracoes = [(f['valor'], f['total']) for f in resposta['facetas']['duracao']]
+        self.assertEqual(duracoes, [('3_a_5min', 2), ('acima_8min', 1)])
+
+        filtrada = self.client.get('/api/musicas/navegar?genero=Rock&duracao=acima_8min').get_json()
+        self.assertEqual((filtrada['total'], filtrada['musicas']), (0, []))
+        # A faceta de genero ignora o proprio filtro: mostra quantas teria cada genero.
+        generos = {f['valor']: (f['total'], f['selecionado']) for f in filtrada['facetas']['genero']}
+        self.assertEqual(generos, {'Jazz': (1, False)})
+
+        por_ano = self.client.get('/api/musicas/navegar?ano=1959').get_json()
+        self.assertEqual([m['titulo'] for m in por_ano['musicas']], ['So What'])
+
+        def recalcular_em_segundo_plano():
+            # Simula o fim do intervalo: a leitura agenda o recalculo e segue com o cubo anterior.
+            facet_service._estado_por_engine[db.engine]['recalculado_em'] -= 3600
+            _, facetas = FacetService.contagens({})
+            with facet_service._recalculo_lock:
+                pass
+            return {f['valor'] for f in facetas['genero']}
+
+        # Alteracoes do catalogo recalculam o cubo no maximo uma vez por FACETS_REFRESH_SECONDS.
+        artista.genero = 'Bebop'
+        db.session.commit()
+        _, consultas = self._contar_consultas(lambda: FacetService.contagens({}))
+        self.assertEqual(consultas, 0)
+        self.assertFalse(facet_service._recalculo_lock.locked())
+        self.assertEqual(recalcular_em_segundo_plano(), {'Jazz', 'Rock'})
+        resposta = self.client.get('/api/musicas/navegar').get_json()
+        generos = {f['valor']: f['total'] for f in resposta['facetas']['genero']}
+        self.assertEqual(generos, {'Bebop': 1, 'Rock': 2})
+
+        invalida = self.client.get('/api/musicas/navegar?duracao=eterna').get_json()
+        self.assertFalse(invalida['success'])
+
+        # Com outra thread recalculando, a leitura segue com o cubo anterior, sem GROUP BY.
+        artista = Artist.query.filter_by(nome='Artista Jazz').one()
+        artista.genero = 'Cool Jazz'
+        db.session.commit()
+        with facet_service._recalculo_lock:
+            (total, facetas), consultas = self._contar_consultas(lambda: FacetService.contagens({}))
+        self.assertEqual(consultas, 0)
+        self.assertEqual({f['valor'] for f in facetas['genero']}, {'Bebop', 'Rock'})
+        self.assertEqual(recalcular_em_segundo_plano(), {'Bebop', 'Rock'})
+        _, facetas = FacetService.contagens({})
+        self.assertEqual({f['valor'] for f in facetas['genero']}, {'Cool Jazz', 'Rock'})
+
+        # Um recalculo mais novo que o pedido (de outro worker) e reaproveitado.
+        atualizado_em = db.session.query(db.func.max(CatalogFacet.atualizado_em)).scalar()
+        FacetService.recalcular(anterior_a=atualizado_em - timedelta(seconds=1))
+        self.assertEqual(db.session.query(db.func.max(CatalogFacet.atualizado_em)).scalar(), atualizado_em)
+        print('[APROVADO] Navegacao facetada filtrou e contou a partir do cubo pre-calculado.')
+
+    def test_ranking_combina_correspondencia_e_popularidade(self):
+        self._describe_test()
+        album = Album.query.first()
+        for indice, (titulo, visualizacoes) in enumerate(
+            [('A Noite de Aurora', 5000), ('Aurora', 0), ('Aurora Boreal', 10), ('Auroras do Sul', 0)]
+        ):
+            musica = Music(
+                titulo=titulo,
+                album_id=album.id,
+                arquivo_url=f'/static/music/aurora-{indice}.mp3',
+            )
+            musica.visualizacoes = visualizacoes
+            db.session.add(musica)
+        db.session.commit()
+
+        ranking = self.client.get('/api/musicas?q=aurora').get_json()
+        self.assertEqual(
+            [m['titulo'] for m in ranking['musicas']],
+            ['Aurora', 'Aurora Boreal', 'Auroras do Sul', 'A Noite de Aurora'],
+        )
+
+        # Artista exato muito tocado nao passa de palavra do titulo pouco tocada.
+        self.app.config['SEARCH_POPULARITY_BOOST'] = 1000
+        artista = Artist(nome='Aurora', genero='Pop')
+        db.session.add(artista)
+        db.session.flush()
+        outro_album = Album(titulo='Ao Vivo', artista_id=artista.id)
+        db.session.add(outro_album)
+        db.session.flush()
+        sucesso = Music(titulo='Sucesso', album_id=outro_album.id, arquivo_url='/static/music/sucesso.mp3')
+        sucesso.visualizacoes = 10 ** 9
+        db.session.add(sucesso)
+        db.session.commit()
+        search_cache().limpar()
+        ranking = self.client.get('/api/musicas?q=aurora').get_json()
+        self.assertEqual(
+            [m['titulo'] for m in ranking['musicas']],
+            ['Aurora', 'Aurora Boreal', 'Auroras do Sul', 'A Noite de Aurora', 'Sucesso'],
+        )
+        pontos = list(CatalogSearchService.PONTOS_CORRESPONDENCIA.values())
+        self.assertEqual({a - b for a, b in zip(pontos, pontos[1:])}, {CatalogSearchService.DISTANCIA_NIVEIS})
+
+        alfabetica = self.client.get('/api/musicas?q=aurora&ordem=titulo').get_json()
+        self.assertEqual(alfabetica['musicas'][0]['titulo'], 'A Noite de Aurora')
+
+        invalida = self.client.get('/api/musicas?q=aurora&ordem=aleatoria').get_json()
+        self.assertFalse(invalida['success'])
+        print('[APROVADO] Titulo exato ficou no topo e a popularidade desempatou o restante.')
+
+    def test_estatisticas_de_busca_gravadas_em_lote_e_aquecimento(self):
+        self._describe_test()
+        for termo in ('Primeira', 'primeira', 'PRIMEIRA', 'inexistente'):
+            self.client.get(f'/api/musicas?q={termo}')
+        self.client.get('/api/musicas?q=primeira&offset=50')
+
+        self.assertEqual(SearchQueryStat.query.count(), 0)
+        self.assertEqual(SearchAnalytics.buffer().descarregar(), 2)
+
+        top = SearchAnalytics.top_termos()
+        self.assertEqual([(t['termo'], t['buscas']) for t in top], [('primeira', 3), ('inexistente', 1)])
+        self.assertEqual(top[0]['media_resultados'], 1)
+        sem_resultado = SearchAnalytics.termos_sem_resultado()
+        self.assertEqual([(t['termo'], t['sem_resultado']) for t in sem_resultado], [('inexistente', 1)])
+
+        self.client.get('/api/musicas?q=primeira')
+        SearchAnalytics.buffer().descarregar()
+        self.assertEqual(SearchQueryStat.query.filter_by(termo='primeira').one().total_buscas, 4)
+
+        cache = search_cache()
+        cache.limpar()
+        self.assertEqual(MusicController.aquecer_cache_busca(), ['primeira'])
+        hits = cache.hits
+        self.client.get('/buscar?q=primeira')
+        self.assertEqual(cache.hits, hits + 1)
+        print('[APROVADO] Buscas agregadas em lote, relatorio gerado e cache aquecido.')
+
+    def _contar_consultas(self, funcao):
+        consultas = []
+
+        def _registrar(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', _registrar)
+        try:
+            resultado = funcao()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _registrar)
+        db.session.expunge_all()
+        self.ultimas_consultas = consultas
+        return resultado, len(consultas)
+
+    def test_listas_de_musicas_usam_numero_fixo_de_consultas(self):
+        self._describe_test()
+        for indice in range(12):
+            artista = Artist(nome=f'Banda {indice}', genero='Pop')
+            db.session.add(artista)
+            db.session.flush()
+            album = Album(titulo=f'Disco {indice}', artista_id=artista.id)
+            db.session.add(album)
+            db.session.flush()
+            db.session.add(
+                Music(titulo=f'Cancao {indice}', album_id=album.id, arquivo_url=f'/static/music/c{indice}.mp3')
+            )
+        db.session.commit()
+        db.session.expunge_all()
+        tenant_id = Tenant.resolve_default_id()
+        ChartService.recalcular(tenant_id)
+
+        pequena, consultas_pequena = self._contar_consultas(
+            lambda: MusicController.obter_musicas_populares(2, tenant_id=tenant_id)
+        )
+        grande, consultas_grande = self._contar_consultas(
+            lambda: MusicController.obter_musicas_populares(14, tenant_id=tenant_id)
+        )
+        self.assertEqual(len(grande['musicas']), 14)
+        self.assertTrue(all(m['album']['artista'] for m in grande['musicas']))
+        self.assertEqual(consultas_pequena, consultas_grande)
+        self.assertEqual(consultas_grande, 1)
+
+        _, consultas_pequena = self._contar_consultas(lambda: MusicController.buscar_musicas('cancao', limite=2))
+        _, consultas_grande = self._contar_consultas(lambda: MusicController.buscar_musicas('cancao', limite=12))
+        self.assertEqual(consultas_pequena, consultas_grande)
+
+        _, consultas_pequena = self._contar_consultas(lambda: MusicController.buscar_musicas(limite=2, cursor=''))
+        _, consultas_grande = self._contar_consultas(lambda: MusicController.buscar_musicas(limite=14, cursor=''))
+        self.assertEqual(consultas_pequena, consultas_grande)
+        print(f'[APROVADO] Listas serializadas com numero fixo de consultas ({consultas_grande}).')
+
+    def test_agregados_de_album_acompanham_faixas(self):
+        self._describe_test()
+        album = Album.query.first()
+        self.assertEqual((album.total_musicas, album.duracao_total), (2, 440))
+
+        criada = MusicController.criar_musica(
+            {'titulo': 'Terceira', 'album_id': album.id, 'arquivo_url': '/static/music/terceira.mp3', 'duracao': 100}
+        )
+        self.assertEqual((album.total_musicas, album.duracao_total), (3, 540))
+
+        MusicController.atualizar_musica(criada['musica']['id'], {'duracao': 160})
+        self.assertEqual((album.total_musicas, album.duracao_total), (3, 600))
+
+        outro = Album(titulo='Outro Album', artista_id=album.artista_id)
+        db.session.add(outro)
+        db.session.commit()
+        musica = db.session.get(Music, criada['musica']['id'])
+        musica.album = outro
+        db.session.commit()
+        self.assertEqual((album.total_musicas, album.duracao_total), (2, 440))
+        self.assertEqual((outro.total_musicas, outro.duracao_total), (1, 160))
+
+        # Troca pela relacao com a faixa expirada pelo commit (album_id e duracao nao carregados).
+        musica.album = album
+        db.session.commit()
+        self.assertEqual((album.total_musicas, album.duracao_total), (3, 600))
+        self.assertEqual((outro.total_musicas, outro.duracao_total), (0, 0))
+        musica.album = outro
+        db.session.commit()
+        self.assertEqual((album.total_musicas, album.duracao_total), (2, 440))
+        self.assertEqual((outro.total_musicas, outro.duracao_total), (1, 160))
+
+        MusicController.deletar_musica(musica.id)
+        self.assertEqual((outro.total_musicas, outro.duracao_total), (0, 0))
+
+        album.total_musicas = 99
+        db.session.commit()
+        self.assertEqual(CatalogCounters.recalcular_albuns(), 1)
+        self.assertEqual(db.session.get(Album, album.id).total_musicas, 2)
+
+        artista_id = album.artista_id
+        _, consultas_antes = self._contar_consultas(lambda: self.client.get(f'/artista/{artista_id}'))
+        for indice in range(5):
+            db.session.add(Album(titulo=f'Extra {indice}', artista_id=artista_id))
+        db.session.commit()
+        _, consultas_depois = self._contar_consultas(lambda: self.client.get(f'/artista/{artista_id}'))
+        self.assertEqual(consultas_antes, consultas_depois)
+        print('[APROVADO] Agregados do album acompanharam insercao, edicao, troca de album e remocao.')
+
+    def test_discografia_materializada_do_artista(self):
+        self._describe_test()
+        album = Album.query.first()
+        artista_id = album.artista_id
+
+        primeira = self.client.get(f'/api/artistas/{artista_id}/discografia').get_json()
+        self.assertTrue(primeira['success'])
+        self.assertEqual(primeira['discografia']['artista']['total_musicas'], 2)
+        self.assertEqual(ArtistDiscography.query.count(), 1)
+
+        resposta, consultas = self._contar_consultas(lambda: self.client.get(f'/artista/{artista_id}'))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(consultas, 1)
+
+        MusicController.criar_musica(
+            {'titulo': 'Bonus', 'album_id': album.id, 'arquivo_url': '/static/music/bonus.mp3', 'duracao': 60}
+        )
+        self.assertEqual(ArtistDiscography.query.count(), 0)
+        atualizada = self.client.get(f'/api/artistas/{artista_id}/discografia').get_json()['discografia']
+        self.assertEqual(atualizada['artista']['total_musicas'], 3)
+        self.assertEqual(atualizada['albuns'][0]['duracao_total'], 500)
+
+        album = db.session.get(Album, album.id)
+        album.titulo = 'Album Renomeado'
+        db.session.commit()
+        renomeada = self.client.get(f'/api/artistas/{artista_id}/discografia').get_json()['discografia']
+        self.assertEqual(renomeada['albuns'][0]['titulo'], 'Album Renomeado')
+
+        self.assertEqual(self.client.get('/artista/9999').status_code, 404)
+        print('[APROVADO] Pagina do artista veio de uma leitura e refletiu as alteracoes.')
+
+    def test_detalhe_da_playlist_em_consulta_unica(self):
+        self._describe_test()
+        from app.controllers.playlist_controller import PlaylistController
+
+        playlist_id = self.playlist_default_publica_id
+        playlist = db.session.get(Playlist, playlist_id)
+        for posicao, musica in enumerate(reversed(Music.query.order_by(Music.id).all()), start=1):
+            playlist.adicionar_musica(musica, posicao=posicao)
+        db.session.commit()
+        db.session.expunge_all()
+
+        resultado, consultas_pequena = self._contar_consultas(lambda: PlaylistController.obter_playlist(playlist_id))
+        self.assertTrue(resultado['success'])
+        detalhe = resultado['playlist']
+        self.assertEqual([m['titulo'] for m in detalhe['musicas']], ['Segunda Faixa', 'Primeira Musica'])
+        self.assertEqual([m['posicao'] for m in detalhe['musicas']], [1, 2])
+        self.assertEqual((detalhe['total_musicas'], detalhe['duracao_total']), (2, 440))
+        self.assertEqual(detalhe['musicas'][0]['album']['artista']['nome'], 'Artista Teste')
+
+        playlist = db.session.get(Playlist, playlist_id)
+        album_id = Album.query.first().id
+        for indice in range(6):
+            musica = Music(titulo=f'Extra {indice}', album_id=album_id, arquivo_url=f'/static/music/e{indice}.mp3', duracao=10)
+            db.session.add(musica)
+            db.session.flush()
+            playlist.adicionar_musica(musica)
+        db.session.commit()
+        db.session.expunge_all()
+
+        resultado, consultas_grande = self._contar_consultas(lambda: PlaylistController.obter_playlist(playlist_id))
+        self.assertEqual(resultado['playlist']['total_musicas'], 8)
+        self.assertEqual(resultado['playlist']['duracao_total'], 500)
+        self.assertEqual(consultas_pequena, consultas_grande)
+
+        resposta = self.client.get(f'/playlist/{playlist_id}')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('Extra 5', resposta.get_data(as_text=True))
+        print(f'[APROVADO] Detalhe da playlist com {consultas_grande} consulta(s), independente do numero de faixas.')
+
+    def test_contadores_da_playlist_acompanham_faixas(self):
+        self._describe_test()
+        from app.controllers.playlist_controller import PlaylistController
+
+        playlist_id = self.playlist_default_publica_id
+        usuario_id, tenant_id = self.user_default.id, self.user_default.tenant_id
+        primeira, segunda = Music.query.order_by(Music.id).all()
+
+        resultado = PlaylistController.adicionar_musica(playlist_id, usuario_id, primeira.id)
+        self.assertEqual((resultado['playlist']['total_musicas'], resultado['playlist']['duracao_total']), (1, 200))
+        # A posicao da nova faixa sai do contador, sem COUNT em playlist_musicas.
+        self._contar_consultas(lambda: PlaylistController.adicionar_musica(playlist_id, usuario_id, segunda.id))
+        self.assertFalse(any('count(' in consulta.lower() for consulta in self.ultimas_consultas))
+        primeira, segunda = Music.query.order_by(Music.id).all()
+        playlist = db.session.get(Playlist, playlist_id)
+        self.assertEqual((playlist.total_musicas, playlist.duracao_total), (2, 440))
+        self.assertEqual([posicao for posicao, _ in playlist.faixas_ordenadas()], [1, 2])
+
+        MusicController.atualizar_musica(primeira.id, {'duracao': 260})
+        self.assertEqual((playlist.total_musicas, playlist.duracao_total), (2, 500))
+
+        resultado = PlaylistController.remover_musica(playlist_id, usuario_id, segunda.id)
+        self.assertEqual((resultado['playlist']['total_musicas'], resultado['playlist']['duracao_total']), (1, 260))
+
+        self.assertTrue(MusicController.deletar_musica(primeira.id)['success'])
+        playlist = db.session.get(Playlist, playlist_id)
+        self.assertEqual((playlist.total_musicas, playlist.duracao_total), (0, 0))
+
+        playlist.total_musicas = 7
+        db.session.commit()
+        self.assertEqual(CatalogCounters.recalcular_playlists(), 1)
+        self.assertEqual(db.session.get(Playlist, playlist_id).total_musicas, 0)
+
+        _, consultas_antes = self._contar_consultas(
+            lambda: PlaylistController.obter_playlists_publicas(limite=50, tenant_id=tenant_id)
+        )
+        segunda = Music.query.filter_by(titulo='Segunda Faixa').one()
+        for indice in range(5):
+            extra = Playlist(tenant_id=tenant_id, usuario_id=usuario_id, nome=f'Lista {indice}', publica=True)
+            db.session.add(extra)
+            db.session.flush()
+            extra.adicionar_musica(segunda)
+        db.session.commit()
+        resultado, consultas_depois = self._contar_consultas(
+            lambda: PlaylistController.obter_playlists_publicas(limite=50, tenant_id=tenant_id)
+        )
+        self.assertEqual(len(resultado['playlists']), 6)
+        self.assertTrue(all(p['duracao_total'] == 240 for p in resultado['playlists'] if p['nome'].startswith('Lista')))
+        self.assertEqual(consultas_antes, consultas_depois)
+        self.assertEqual(consultas_depois, 1)
+        print('[APROVADO] Contadores da playlist acompanharam inclusao, remocao e alteracao de faixas.')
+
+    def test_perfil_usa_contadores_do_usuario(self):
+        self._describe_test()
+        from app.controllers.playlist_controller import PlaylistController
+
+        usuario_id = self.user_default.id
+        primeira, segunda = [musica.id for musica in Music.query.order_by(Music.id)]
+        self._login('teste@local.com')
+
+        perfil = self.client.get('/api/usuario/perfil').get_json()['usuario']
+        self.assertEqual((perfil['total_playlists'], perfil['total_favoritos']), (1, 0))
+
+        self.assertTrue(self.client.post(f'/api/usuario/favoritos/{primeira}').get_json()['success'])
+        self.assertTrue(self.client.post(f'/api/usuario/favoritos/{segunda}').get_json()['success'])
+        self.client.post(f'/api/usuario/favoritos/{segunda}')
+        criada = PlaylistController.criar_playlist(usuario_id, 'Nova Lista', publica=True)
+        self.assertTrue(criada['success'])
+        perfil = self.client.get('/api/usuario/perfil').get_json()['usuario']
+        self.assertEqual((perfil['total_playlists'], perfil['total_favoritos']), (2, 2))
+
+        self.assertTrue(self.client.delete(f'/api/usuario/favoritos/{segunda}').get_json()['success'])
+        PlaylistController.deletar_playlist(criada['playlist']['id'], usuario_id)
+        MusicController.deletar_musica(primeira)
+        usuario = db.session.get(User, usuario_id)
+        self.assertEqual((usuario.total_playlists, usuario.total_favoritos), (1, 0))
+
+        usuario.total_favoritos = 5
+        db.session.commit()
+        self.assertEqual(CatalogCounters.recalcular_usuarios(), 1)
+        self.assertIn('Favoritos 0', self.client.get('/auth/perfil').get_data(as_text=True))
+
+        perfil, _ = self._contar_consultas(lambda: self.client.get('/api/usuario/perfil').get_json()['usuario'])
+        self.assertEqual((perfil['total_playlists'], perfil['total_favoritos']), (1, 0))
+        self.assertFalse([sql for sql in self.ultimas_consultas if 'count(' in sql.lower()])
+
+        # O contador e um inteiro antes e depois do flush, sem expressao SQL pendente.
+        usuario = db.session.get(User, usuario_id)
+        usuario.add_favorito(db.session.get(Music, segunda))
+        self.assertEqual(usuario.to_dict()['total_favoritos'], 0)
+        db.session.flush()
+        self.assertEqual(usuario.to_dict()['total_favoritos'], 1)
+        db.session.commit()
+
+        # Troca de dono pela relacao, com a playlist expirada pelo commit.
+        outro = User.query.filter_by(email='tenantb@local.com').one()
+        playlist = Playlist.query.filter_by(usuario_id=usuario_id).one()
+        db.session.commit()
+        playlist.usuario = outro
+        db.session.commit()
+        self.assertEqual((usuario.total_playlists, outro.total_playlists), (0, 2))
+        self.assertEqual(CatalogCounters.recalcular_usuarios(), 0)
+        print('[APROVADO] Perfil serviu contadores mantidos sem consultas de agregacao.')
+    def test_listas_grandes_sao_transmitidas_em_fluxo(self):
+        self._describe_test()
+        for rota in ('/api/musicas?limite=5&ordem=titulo', '/api/musicas/populares?limite=5', '/api/musicas?q=musica&limite=5'):
+            self.app.config['API_STREAM_MIN_ROWS'] = 1000
+            completa = self.client.get(rota)
+            self.app.config['API_STREAM_MIN_ROWS'] = 5
+            self.app.config['API_STREAM_CHUNK_ITEMS'] = 1
+            em_fluxo = self.client.get(rota)
+
+            self.assertIn('Content-Length', completa.headers)
+            self.assertNotIn('Content-Length', em_fluxo.headers)
+            self.assertEqual(em_fluxo.mimetype, 'application/json')
+            self.assertEqual(em_fluxo.get_json(), completa.get_json())
+            self.assertTrue(completa.get_json()['musicas'])
+
+        self.assertEqual(self.app.json.loads(self.app.json.dumps({'b': [1, 2], 'a': None})), {'a': None, 'b': [1, 2]})
+
+        # Erro no meio da leitura: registrado no log e documento fechado como JSON valido.
+        def musicas_com_erro():
+            yield {'id': 1}
+            yield {'id': 2}
+            raise RuntimeError('conexao perdida')
+
+        with self.app.test_request_context('/api/musicas'), self.assertLogs(self.app.logger, 'ERROR'):
+            resposta = resposta_em_fluxo({'success': True, 'musicas': musicas_com_erro(), 'total': 3})
+            corpo = json.loads(b''.join(resposta.response))
+        self.assertEqual(corpo['musicas'], [{'id': 1}, {'id': 2}])
+        self.assertEqual((corpo['success'], corpo['incompleto'], corpo['total']), (False, True, 3))
+        print('[APROVADO] Listas grandes transmitidas em fluxo com o mesmo conteudo do jsonify.')
+
+    def test_fields_limita_campos_e_consultas(self):
+        self._describe_test()
+        from app.models.campos import interpretar_campos
+
+        self.assertEqual(
+            interpretar_campos('id, titulo,album.titulo,album'),
+            {'id': None, 'titulo': None, 'album': None},
+        )
+        self.assertIsNone(interpretar_campos(' , ,'))
+        vazio = self.client.get('/api/musicas?fields=').get_json()
+        self.assertEqual(vazio['musicas'], self.client.get('/api/musicas').get_json()['musicas'])
+
+        # Parada ja calculada: o recalculo em lote nao entra nas consultas medidas.
+        ChartService.recalcular()
+        resposta, _ = self._contar_consultas(
+            lambda: self.client.get('/api/musicas/populares?fields=id,titulo,arquivo_url').get_json()
+        )
+        self.assertEqual({tuple(sorted(m)) for m in resposta['musicas']}, {('arquivo_url', 'id', 'titulo')})
+        self.assertFalse([sql for sql in self.ultimas_consultas if 'albuns' in sql])
+
+        resposta = self.client.get('/api/musicas?q=primeira&fields=id,album.titulo,album.artista.nome').get_json()
+        self.assertEqual(
+            resposta['musicas'],
+            [{'id': resposta['musicas'][0]['id'], 'album': {'titulo': 'Album Teste', 'artista': {'nome': 'Artista Teste'}}}],
+        )
+
+        playlist_id = self.playlist_default_publica_id
+        playlist = db.session.get(Playlist, playlist_id)
+        for musica in Music.query.order_by(Music.id):
+            playlist.adicionar_musica(musica)
+        db.session.commit()
+        self._login('teste@local.com')
+
+        resposta, _ = self._contar_consultas(
+            lambda: self.client.get(f'/api/playlists/{playlist_id}?fields=nome,total_musicas').get_json()
+        )
+        self.assertEqual(resposta['playlist'], {'nome': 'Publica Default', 'total_musicas': 2})
+        self.assertFalse([sql for sql in self.ultimas_consultas if 'playlist_musicas' in sql])
+
+        resposta, _ = self._contar_consultas(
+            lambda: self.client.get(f'/api/playlists/{playlist_id}?fields=musicas.id,musicas.posicao').get_json()
+        )
+        self.assertEqual([m['posicao'] for m in resposta['playlist']['musicas']], [1, 2])
+        self.assertEqual(set(resposta['playlist']), {'musicas'})
+        self.assertFalse([sql for sql in self.ultimas_consultas if 'albuns' in sql])
+
+        completa = self.client.get(f'/api/playlists/{playlist_id}').get_json()['playlist']
+        self.assertIn('album', completa['musicas'][0])
+        print('[APROVADO] fields= reduziu a resposta e evitou cargas de album e faixas nao pedidas.')
+
+    def test_api_v2_envia_relacionados_em_included(self):
+        self._describe_test()
+        album = Album.query.first()
+        playlist = db.session.get(Playlist, self.playlist_default_publica_id)
+        for indice in range(30):
+            musica = Music(titulo=f'Faixa {indice}', album_id=album.id, arquivo_url=f'/static/music/f{indice}.mp3')
+            db.session.add(musica)
+            db.session.flush()
+            playlist.adicionar_musica(musica)
+        db.session.commit()
+        playlist_id = playlist.id
+        self._login('teste@local.com')
+
+        v1 = self.client.get(f'/api/playlists/{playlist_id}')
+        v2 = self.client.get(f'/api/v2/playlists/{playlist_id}')
+        dados = v2.get_json()
+        self.assertTrue(dados['success'])
+        self.assertEqual(len(dados['playlist']['musicas']), 30)
+        self.assertTrue(all('album' not in m and m['album_id'] == album.id for m in dados['playlist']['musicas']))
+        self.assertEqual(list(dados['included']['albuns']), [str(album.id)])
+        self.assertEqual(dados['included']['albuns'][str(album.id)]['artista_id'], album.artista_id)
+        self.assertEqual(dados['included']['artistas'][str(album.artista_id)]['nome'], 'Artista Teste')
+        self.assertLess(len(v2.data), len(v1.data) * 0.8)
+
+        busca = self.client.get('/api/v2/musicas?q=faixa&limite=5').get_json()
+        self.assertEqual(len(busca['musicas']), 5)
+        self.assertEqual(len(busca['included']['albuns']), 1)
+        v1_busca = self.client.get('/api/musicas?q=faixa&limite=5').get_json()
+        self.assertIn('album', v1_busca['musicas'][0])
+
+        populares = self.client.get('/api/v2/musicas/populares').get_json()
+        self.assertEqual(len(populares['included']['artistas']), 1)
+        print('[APROVADO] API v2 enviou cada album e artista uma unica vez em included.')
+
+    @unittest.skipIf(msgpack is None, 'msgpack nao instalado')
+    def test_api_negocia_msgpack(self):
+        self._describe_test()
+        self._login('teste@local.com')
+        cabecalhos = {'Accept': 'application/msgpack'}
+
+        padrao = self.client.get('/api/musicas?q=primeira')
+        self.assertEqual(padrao.mimetype, 'application/json')
+        self.assertIn('Accept', padrao.headers.get('Vary', ''))
+
+        resposta = self.client.get('/api/musicas?q=primeira', headers=cabecalhos)
+        self.assertEqual(resposta.mimetype, 'application/msgpack')
+        dados = msgpack.unpackb(resposta.data)
+        self.assertEqual(dados, padrao.get_json())
+
+        # Limite acima de API_STREAM_MIN_ROWS: em msgpack a lista vai inteira.
+        populares = self.client.get('/api/musicas/populares?limite=600', headers=cabecalhos)
+        self.assertEqual(len(msgpack.unpackb(populares.data)['musicas']), 2)
+
+        criada = self.client.post(
+            '/api/playlists',
+            data=msgpack.packb({'nome': 'Via msgpack', 'publica': True}),
+            content_type='application/msgpack',
+            headers=cabecalhos,
+        )
+        self.assertEqual(criada.status_code, 201)
+        playlist = msgpack.unpackb(criada.data)['playlist']
+        self.assertEqual(playlist['nome'], 'Via msgpack')
+        self.assertTrue(playlist['publica'])
+
+        atualizada = self.client.put(
+            f"/api/playlists/{playlist['id']}",
+            data=msgpack.packb({'descricao': 'Corpo binario'}),
+            content_type='application/msgpack',
+        )
+        self.assertEqual(atualizada.get_json()['playlist']['descricao'], 'Corpo binario')
+
+        invalido = self.client.post('/api/playlists', data=b'\xc1', content_type='application/msgpack')
+        self.assertEqual(invalido.status_code, 400)
+        self.assertEqual(self.client.get('/api/v2/musicas', headers=cabecalhos).mimetype, 'application/json')
+        print('[APROVADO] API respondeu e leu msgpack quando pedido e manteve JSON como padrao.')
+
+    def test_leitura_catalogo_sem_orm(self):
+        self._describe_test()
+        esperado = {m.id: m.to_dict() for m in Music.query.all()}
+        db.session.expunge_all()
+
+        musicas = CatalogReader.musicas(Music.query.order_by(Music.id))
+        self.assertTrue(all(isinstance(m, MusicaResumo) for m in musicas))
+        self.assertFalse(hasattr(musicas[0], '__dict__'))
+        self.assertIs(musicas[0].album, musicas[1].album)
+        self.assertEqual([m.to_dict() for m in musicas], list(esperado.values()))
+        # Mesmo serializador: mesmas chaves, na mesma ordem.
+        self.assertEqual([list(m.to_dict()) for m in musicas], [list(d) for d in esperado.values()])
+        # Nenhuma instancia do ORM passa pela sessao.
+        self.assertEqual(len(db.session.identity_map), 0)
+
+        tenant_id = Tenant.resolve_default_id()
+        ChartService.recalcular(tenant_id)
+        populares = MusicController.obter_musicas_populares(limite=10)['musicas']
+        busca = MusicController.buscar_musicas('primeira', limite=10)['musicas']
+        pagina = MusicController.buscar_musicas(limite=1, cursor='')
+        self.assertEqual({m['id']: m for m in populares}, esperado)
+        self.assertEqual(busca, [esperado[busca[0]['id']]])
+        self.assertIsNotNone(pagina['next_cursor'])
+        self.assertEqual(len(db.session.identity_map), 0)
+
+        _, consultas = self._contar_consultas(
+            lambda: MusicController.obter_musicas_populares(limite=10, campos={'id': None}, tenant_id=tenant_id)
+        )
+        self.assertEqual(consultas, 1)
+        self.assertNotIn('albuns', self.ultimas_consultas[0])
+        print('[APROVADO] Listas do catalogo sairam de SELECTs por coluna com o formato de Music.to_dict().')
+
+    def test_consulta_em_lote_por_ids(self):
+        self._describe_test()
+        primeira = Music.query.filter_by(titulo='Primeira Musica').first()
+        segunda = Music.query.filter_by(titulo='Segunda Faixa').first()
+        album = Album.query.first()
+        artista = Artist.query.first()
+        esperado = [segunda.to_dict(), primeira.to_dict()]
+        ids = f'{segunda.id},9999,{primeira.id},{segunda.id}'
+
+        resposta, consultas = self._contar_consultas(lambda: self.client.get(f'/api/musicas?ids={ids}').get_json())
+        self.assertEqual(consultas, 1)
+        self.assertEqual(resposta['musicas'], esperado)
+        self.assertEqual(resposta['nao_encontrados'], [9999])
+
+        albuns, consultas = self._contar_consultas(
+            lambda: self.client.get(f'/api/albuns?ids=9998,{album.id}').get_json()
+        )
+        self.assertEqual(consultas, 1)
+        self.assertEqual([a['artista_nome'] for a in albuns['albuns']], ['Artista Teste'])
+        self.assertEqual(albuns['nao_encontrados'], [9998])
+
+        artistas, consultas = self._contar_consultas(
+            lambda: self.client.get(f'/api/artistas?ids={artista.id}').get_json()
+        )
+        self.assertEqual(consultas, 2)
+        self.assertEqual(artistas['artistas'][0]['total_albuns'], 1)
+        self.assertEqual(artistas['artistas'][0]['total_musicas'], 2)
+        self.assertEqual(artistas['nao_encontrados'], [])
+
+        compactos = self.client.get(f'/api/musicas?ids={primeira.id}&fields=id,titulo').get_json()
+        self.assertEqual(compactos['musicas'], [{'id': primeira.id, 'titulo': 'Primeira Musica'}])
+        self.assertEqual(self.client.get('/api/musicas?ids=1,abc').status_code, 400)
+        self.assertEqual(self.client.get('/api/artistas').status_code, 400)
+        self.app.config['API_BATCH_MAX_IDS'] = 2
+        self.assertEqual(self.client.get('/api/albuns?ids=1,2,3').status_code, 400)
+        print('[APROVADO] Consultas por ids responderam em uma consulta, na ordem pedida e com os ausentes.')
+
+    def test_faixas_da_playlist_em_janelas(self):
+        from app.controllers.playlist_controller import PlaylistController
+
+        self._describe_test()
+        album = Album.query.first()
+        playlist = db.session.get(Playlist, self.playlist_default_publica_id)
+        for indice in range(7):
+            musica = Music(titulo=f'Janela {indice}', album_id=album.id, arquivo_url=f'/static/music/j{indice}.mp3')
+            db.session.add(musica)
+            db.session.flush()
+            # Posicoes repetidas sao desempatadas pelo id da faixa.
+            playlist.adicionar_musica(musica, posicao=indice // 2 + 1)
+        db.session.commit()
+        playlist_id = playlist.id
+        esperado = [f'Janela {indice}' for indice in range(7)]
+
+        titulos = []
+        cursor = ''
+        while cursor is not None:
+            dados = self.client.get(f'/api/playlists/{playlist_id}/musicas?limite=3&cursor={cursor}').get_json()
+            self.assertTrue(dados['success'])
+            self.assertLessEqual(len(dados['musicas']), 3)
+            titulos += [m['titulo'] for m in dados['musicas']]
+            cursor = dados['next_cursor']
+        self.assertEqual(titulos, esperado)
+        invalido = self.client.get(f'/api/playlists/{playlist_id}/musicas?cursor=xyz')
+        self.assertEqual(invalido.status_code, 400)
+        self.assertFalse(invalido.get_json()['success'])
+        self.assertEqual(self.client.get(f'/playlist/{playlist_id}/faixas?cursor=xyz').status_code, 400)
+        self.assertEqual(self.client.get('/api/playlists/999999/musicas').status_code, 404)
+        self.assertEqual(self.client.get('/playlist/999999/faixas').status_code, 404)
+
+        self.app.config['PLAYLIST_TRACKS_WINDOW'] = 4
+        pagina = self.client.get(f'/playlist/{playlist_id}')
+        self.assertIn(b'Janela 3', pagina.data)
+        self.assertNotIn(b'Janela 4', pagina.data)
+        self.assertIn(b'data-carregar-faixas', pagina.data)
+
+        detalhe = PlaylistController.obter_playlist(playlist_id, limite_musicas=4)['playlist']
+        self.assertEqual(detalhe['total_musicas'], 7)
+        fragmento = self.client.get(f'/playlist/{playlist_id}/faixas?cursor={detalhe["musicas_next_cursor"]}')
+        self.assertEqual(fragmento.status_code, 200)
+        self.assertIn(b'Janela 6', fragmento.data)
+        self.assertNotIn(b'Janela 3', fragmento.data)
+        self.assertEqual(fragmento.headers['X-Next-Cursor'], '')
+        print('[APROVADO] Faixas da playlist foram lidas em janelas por posicao, sem repetir nem pular faixas.')
+
+    def test_status_em_lote_de_favoritos_e_playlists(self):
+        from app.controllers.playlist_controller import PlaylistController
+
+        self._describe_test()
+        usuario = User.query.filter_by(email='teste@local.com').first()
+        primeira = Music.query.filter_by(titulo='Primeira Musica').first()
+        segunda = Music.query.filter_by(titulo='Segunda Faixa').first()
+        publica = db.session.get(Playlist, self.playlist_default_publica_id)
+        privada = Playlist(tenant_id=usuario.tenant_id, usuario_id=usuario.id, nome='Privada Default')
+        outra = db.session.get(Playlist, self.playlist_tenant_b_publica_id)
+        db.session.add(privada)
+        db.session.flush()
+        usuario.add_favorito(primeira)
+        publica.adicionar_musica(segunda)
+        privada.adicionar_musica(segunda)
+        outra.adicionar_musica(primeira)
+        db.session.commit()
+        ids = [segunda.id, 9999, primeira.id]
+        usuario_id, publica_id, privada_id = usuario.id, publica.id, privada.id
+
+        self._login('teste@local.com')
+        dados = self.client.get(f'/api/usuario/musicas/status?ids={",".join(map(str, ids))}').get_json()
+        self.assertEqual(dados['musicas'], [
+            {'id': ids[0], 'favorito': False, 'playlists': sorted([publica_id, privada_id])},
+            {'id': 9999, 'favorito': False, 'playlists': []},
+            {'id': ids[2], 'favorito': True, 'playlists': []},
+        ])
+        self.assertEqual(self.client.get('/api/usuario/musicas/status').status_code, 400)
+
+        db.session.expunge_all()
+        _, consultas = self._contar_consultas(lambda: PlaylistController.obter_status_musicas(usuario_id, ids))
+        _, consultas_uma = self._contar_consultas(lambda: PlaylistController.obter_status_musicas(usuario_id, ids[:1]))
+        # Usuario + favoritos + playlists, independente do numero de musicas.
+        self.assertEqual(consultas, consultas_uma)
+        self.assertLessEqual(consultas, 3)
+
+        usuario = db.session.get(User, usuario_id)
+        publica = db.session.get(Playlist, publica_id)
+        primeira = db.session.get(Music, ids[2])
+        segunda = db.session.get(Music, ids[0])
+        self.assertTrue(usuario.is_favorito(primeira))
+        self.assertFalse(usuario.is_favorito(segunda))
+        self.assertTrue(publica.tem_musica(segunda))
+        self.assertFalse(publica.tem_musica(primeira))
+        _, _ = self._contar_consultas(lambda: (usuario.is_favorito(primeira), publica.tem_musica(segunda)))
+        self.assertTrue(all('EXISTS' in consulta for consulta in self.ultimas_consultas))
+        print('[APROVADO] Status de favoritos e playlists saiu em uma consulta cada, com EXISTS nas checagens unitarias.')
+
+    def test_reproducoes_gravadas_em_lote(self):
+        self._describe_test()
+        from threading import Thread
+
+        primeira = Music.query.filter_by(titulo='Primeira Musica').first()
+        segunda = Music.query.filter_by(titulo='Segunda Faixa').first()
+        primeira_id, segunda_id = primeira.id, segunda.id
+        self._login('teste@local.com')
+
+        buffer = PlayCounter.buffer()
+        buffer.intervalo_segundos = 3600
+        self._contar_consultas(
+            lambda: [self.client.post(f'/api/musicas/{primeira_id}/reproduzir') for _ in range(5)]
+        )
+        self.assertFalse(any(c.lstrip().upper().startswith('UPDATE') for c in self.ultimas_consultas))
+        resposta = self.client.post(f'/api/musicas/{primeira_id}/reproduzir').get_json()
+        self.assertEqual(resposta['visualizacoes'], 6)
+        self.assertEqual(self.client.post('/api/musicas/9999/reproduzir').get_json()['success'], False)
+
+        def tocar():
+            with self.app.app_context():
+                for _ in range(50):
+                    PlayCounter.registrar(segunda_id)
+
+        threads = [Thread(target=tocar) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(PlayCounter.pendentes(segunda_id), 200)
+        self.assertEqual(db.session.get(Music, segunda_id).visualizacoes, 0)
+
+        self._contar_consultas(buffer.descarregar)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(len(self.ultimas_consultas), 1)
+        self.assertIn('SET visualizacoes=(coalesce(musicas.visualizacoes', self.ultimas_consultas[0])
+        self.assertEqual(db.session.get(Music, primeira_id).visualizacoes, 6)
+        self.assertEqual(db.session.get(Music, segunda_id).visualizacoes, 200)
+
+        # Com o limite de pendentes atingido o lote e gravado na propria reproducao.
+        buffer.max_pendentes = 1
+        PlayCounter.registrar(primeira_id)
+        self.assertEqual(len(buffer), 0)
+        db.session.expunge_all()
+        self.assertEqual(db.session.get(Music, primeira_id).visualizacoes, 7)
+
+        # Worker ocioso: a thread de descarga grava o lote sem esperar outra reproducao.
+        buffer.max_pendentes = 1000
+        buffer.intervalo_segundos = 0.1
+        PlayCounter.registrar(segunda_id)
+        limite = time.monotonic() + 5
+        while (len(buffer) or buffer._flush_lock.locked()) and time.monotonic() < limite:
+            time.sleep(0.05)
+        self.assertEqual(len(buffer), 0)
+        db.session.expunge_all()
+        self.assertEqual(db.session.get(Music, segunda_id).visualizacoes, 201)
+        print('[APROVADO] Reproducoes acumuladas em memoria foram gravadas em lote sem perder incrementos.')
+
+    def test_log_de_reproducoes_e_agregados(self):
+        self._describe_test()
+        primeira = Music.query.filter_by(titulo='Primeira Musica').first()
+        segunda = Music.query.filter_by(titulo='Segunda Faixa').first()
+        usuario = User.query.filter_by(email='teste@local.com').first()
+        primeira_id, segunda_id, usuario_id, tenant_id = primeira.id, segunda.id, usuario.id, usuario.tenant_id
+        self._login('teste@local.com')
+
+        for _ in range(3):
+            self.client.post(f'/api/musicas/{primeira_id}/reproduzir')
+        self.client.post(f'/api/musicas/{segunda_id}/reproduzir')
+        ontem = datetime.utcnow() - timedelta(days=1)
+        PlayEvents.registrar(segunda_id, usuario_id, tenant_id, quando=ontem)
+        PlayEvents.registrar(segunda_id, usuario_id, tenant_id, quando=ontem)
+        # Reproducao de uma musica removida antes do lote e descartada.
+        PlayEvents.registrar(9999, usuario_id, tenant_id)
+        self.assertEqual(PlayEvent.query.count(), 0)
+
+        PlayEvents.buffer().descarregar()
+        self.assertEqual(db.session.query(db.func.sum(PlayEvent.quantidade)).scalar(), 6)
+        self.assertLessEqual(PlayEvent.query.count(), 4)
+        self.assertEqual(PlayEvents.mais_tocadas(tenant_id), [(primeira_id, 3), (segunda_id, 3)])
+        self.assertEqual(PlayEvents.mais_tocadas(tenant_id, dias=1), [(primeira_id, 3), (segunda_id, 1)])
+        self.assertEqual(PlayEvents.mais_tocadas(self.user_tenant_b.tenant_id), [])
+        self.assertEqual([total for _, total in PlayEvents.serie(segunda_id, tenant_id)], [2, 1])
+        self.assertEqual(
+            sum(total for _, total in PlayEvents.serie(primeira_id, tenant_id, periodo='hora')), 3
+        )
+
+        # Reagregar a partir dos eventos reproduz os mesmos totais (idempotente).
+        antes = sorted((r.periodo, r.inicio, r.musica_id, r.total) for r in PlayRollup.query)
+        PlayEvents.reconstruir_agregados(horas=72)
+        PlayEvents.reconstruir_agregados(horas=72)
+        db.session.expire_all()
+        self.assertEqual(sorted((r.periodo, r.inicio, r.musica_id, r.total) for r in PlayRollup.query), antes)
+
+        # Retencao: eventos e agregados por hora antigos saem; os diarios ficam.
+        antigo = datetime.utcnow() - timedelta(days=60)
+        db.session.add(PlayEvent(musica_id=primeira_id, tenant_id=tenant_id, tocado_em=antigo, quantidade=1))
+        db.session.add_all([
+            PlayRollup(periodo='hora', inicio=antigo.replace(minute=0, second=0, microsecond=0),
+                       tenant_id=tenant_id, musica_id=primeira_id, total=1),
+            PlayRollup(periodo='dia', inicio=antigo.replace(hour=0, minute=0, second=0, microsecond=0),
+                       tenant_id=tenant_id, musica_id=primeira_id, total=1),
+        ])
+        db.session.commit()
+        # O lote da requisicao nao aplica a retencao; so a reconstrucao (`rollup-plays`).
+        PlayEvents.registrar(primeira_id, usuario_id, tenant_id)
+        PlayEvents.buffer().descarregar()
+        self.assertEqual(PlayEvent.query.filter(PlayEvent.tocado_em < ontem - timedelta(days=1)).count(), 1)
+        PlayEvents.reconstruir_agregados()
+        db.session.expire_all()
+        self.assertEqual(PlayEvent.query.filter(PlayEvent.tocado_em < ontem - timedelta(days=1)).count(), 0)
+        self.assertEqual(PlayRollup.query.filter(PlayRollup.inicio < ontem - timedelta(days=1)).count(), 1)
+        self.assertEqual(PlayRollup.query.filter(PlayRollup.inicio < ontem - timedelta(days=1)).one().periodo, 'dia')
+        print('[APROVADO] Reproducoes gravadas em lote no log e agregadas por hora/dia, com retencao dos eventos.')
+
+
+    def test_paradas_de_populares_por_janela_e_genero(self):
+        self._describe_test()
+        primeira = Music.query.filter_by(titulo='Primeira Musica').first()
+        segunda = Music.query.filter_by(titulo='Segunda Faixa').first()
+        artista = Artist(nome='Quarteto Jazz', genero='Jazz')
+        db.session.add(artista)
+        db.session.flush()
+        album = Album(titulo='Sessao', artista_id=artista.id)
+        db.session.add(album)
+        db.session.flush()
+        jazz = Music(titulo='Improviso', album_id=album.id, arquivo_url='/static/music/improviso.mp3')
+        jazz.visualizacoes, primeira.visualizacoes, segunda.visualizacoes = 0, 1, 4
+        db.session.add(jazz)
+        db.session.commit()
+        primeira_id, segunda_id, jazz_id = primeira.id, segunda.id, jazz.id
+        tenant_id = self.user_default.tenant_id
+        tenant_b_id = self.user_tenant_b.tenant_id
+
+        # Antes do primeiro calculo a leitura nao espera o recalculo: ordena o catalogo.
+        self.app.config['CHARTS_REFRESH_ON_READ'] = True
+        with chart_service._recalculo_lock:
+            inicial = self.client.get('/api/musicas/populares').get_json()
+            so_jazz = MusicController.obter_musicas_populares(10, tenant_id=tenant_id, genero='Jazz')
+        self.assertEqual([m['id'] for m in inicial['musicas']], [segunda_id, primeira_id, jazz_id])
+        self.assertEqual(inicial['janela'], 'sempre')
+        self.assertEqual([m['id'] for m in so_jazz['musicas']], [jazz_id])
+        self.assertEqual(ChartEntry.query.count(), 0)
+
+        # Sem reproducoes registradas a parada e completada pelas visualizacoes do catalogo.
+        ChartService.recalcular(tenant_id)
+        self.assertEqual(
+            [m['id'] for m in self.client.get('/api/musicas/populares').get_json()['musicas']],
+            [segunda_id, primeira_id, jazz_id],
+        )
+
+        agora = datetime.utcnow()
+        for _ in range(5):
+            PlayEvents.registrar(jazz_id, None, tenant_id, quando=agora)
+        for _ in range(8):
+            PlayEvents.registrar(primeira_id, None, tenant_id, quando=agora - timedelta(days=3))
+        PlayEvents.registrar(primeira_id, None, tenant_b_id, quando=agora)
+        PlayEvents.buffer().descarregar()
+        self.assertGreater(ChartService.recalcular(), 0)
+
+        def ids(janela, genero=None, tenant=tenant_id):
+            resultado = MusicController.obter_musicas_populares(10, tenant_id=tenant, janela=janela, genero=genero)
+            return [m['id'] for m in resultado['musicas']]
+
+        # Reproducoes de 3 dias atras nao contam no dia e pesam menos na semana que as de agora.
+        self.assertEqual(ids('dia'), [jazz_id, segunda_id, primeira_id])
+        self.assertEqual(ids('semana'), [jazz_id, primeira_id, segunda_id])
+        self.assertEqual(ids('sempre'), [primeira_id, jazz_id, segunda_id])
+        self.assertEqual(ids('sempre', 'Rock'), [primeira_id, segunda_id])
+        self.assertEqual(ids('dia', 'Jazz'), [jazz_id])
+        self.assertEqual(ids('sempre', 'Samba'), [])
+        # No 'sempre' contam tambem as visualizacoes anteriores ao log (segunda: 4 contra 1 reproducao).
+        self.assertEqual(ids('sempre', tenant=tenant_b_id), [segunda_id, primeira_id, jazz_id])
+        topo = ChartEntry.query.filter_by(tenant_id=tenant_id, janela='semana', genero='').order_by(
+            ChartEntry.posicao
+        ).all()
+        self.assertGreater(topo[0].pontuacao, topo[1].pontuacao)
+        self.assertEqual(topo[2].pontuacao, 0)
+        # Soma, ordem e corte saem do banco: so as `limite` melhores de cada lista voltam.
+        with db.engine.connect() as connection:
+            melhores = ChartService._pontuacoes(connection, tenant_id, 'sempre', datetime.utcnow(), 1)
+        self.assertEqual(melhores, {'': [(primeira_id, 8.0)], 'Rock': [(primeira_id, 8.0)], 'Jazz': [(jazz_id, 5.0)]})
+
+        self.assertFalse(MusicController.obter_musicas_populares(10, janela='ano')['success'])
+        self.assertEqual(
+            [m['id'] for m in self.client.get('/api/musicas/populares?janela=dia&genero=Jazz').get_json()['musicas']],
+            [jazz_id],
+        )
+
+        # Leitura da parada vigente: uma consulta, sem ordenar o catalogo.
+        _, consultas = self._contar_consultas(
+            lambda: MusicController.obter_musicas_populares(10, tenant_id=tenant_id, janela='semana')
+        )
+        self.assertEqual(consultas, 1)
+        self.assertIn('paradas', self.ultimas_consultas[0])
+        self.assertNotIn('ORDER BY musicas.visualizacoes', self.ultimas_consultas[0])
+
+        # Parada vencida: a leitura segue com as posicoes gravadas enquanto outro recalcula.
+        self.app.config['CHARTS_REFRESH_SECONDS'] = 0
+        chart_service._estado_por_engine.clear()
+        with chart_service._recalculo_lock:
+            resultado, _ = self._contar_consultas(
+                lambda: MusicController.obter_musicas_populares(10, tenant_id=tenant_id, janela='semana')
+            )
+        self.assertEqual([m['id'] for m in resultado['musicas']], [jazz_id, primeira_id, segunda_id])
+        self.assertEqual(len(self.ultimas_consultas), 2)
+        self.assertFalse(any(c.lstrip().upper().startswith('DELETE') for c in self.ultimas_consultas))
+        # Depois da trava, o recalculo confere se outro worker ja atualizou a parada.
+        self.assertEqual(ChartService.recalcular(tenant_id, anterior_a=datetime.utcnow() - timedelta(hours=1)), 0)
+        print('[APROVADO] Paradas pre-calculadas por tenant, janela e genero, com decaimento e leitura em uma consulta.')
+
 
 if __name__ == '__main__':
     suite = unittest.defaultTestLoader.loadTestsFromTestCase(ApplicationApiTestCase)